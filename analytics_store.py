@@ -0,0 +1,445 @@
+"""
+Almacén analítico de inspecciones: dataset Parquet particionado y rollups de defectos.
+
+Cada ficha completada se anexa a dos datasets Parquet particionados por día
+y proyecto/OT (`fichas/dia=2026-10-18/proyecto_ot=OT-12/…parquet` y lo mismo
+en `detecciones/`), legibles con pandas, pyarrow o DuckDB sin pasar por
+SQLite. Al mismo tiempo se actualizan, de forma incremental, rollups diarios
+por soldador, WPS, máquina, consumible y parámetros de soldadura (voltaje,
+amperaje y velocidad agrupados en intervalos): inspecciones, rechazadas,
+defectos y defectos por clase. Los rollups viven en una pequeña base SQLite
+(UPSERT con incrementos, seguro con varios procesos), de modo que "tasa de
+rechazo por soldador en los últimos 90 días" suma unas pocas filas en vez de
+recorrer los registros.
+
+    store = get_analytics()
+    store.append(ficha, detections)
+    store.reject_rate("soldador", days=90)
+
+Volver a guardar una ficha (mismo id_cordon) resta su aporte anterior a los
+rollups; en Parquet queda una fila nueva y las lecturas se quedan con la más
+reciente (`ingested_at`).
+
+    python analytics_store.py --backfill            # desde el historial SQLite
+    python analytics_store.py --report soldador --days 90
+    python analytics_store.py --compact             # un archivo por partición
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+from ficha_store import DEFAULT_DB_PATH, FichaStore, ficha_verdict
+
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", "data/analytics")
+DATASETS = ("fichas", "detecciones")
+PARTITION_COLS = ("dia", "proyecto_ot")
+NO_OT = "sin_ot"
+# Un backfill de años de historial abre más particiones (día × OT) que el límite de pyarrow (1024)
+MAX_PARTITIONS = 100_000
+# Dimensiones de los rollups; los parámetros numéricos se agrupan en intervalos de este ancho
+DIMENSIONS = ("soldador", "wps", "maquina", "consumible", "voltaje", "amperaje", "velocidad")
+PARAM_BINS = {"voltaje": 1.0, "amperaje": 10.0, "velocidad": 2.0}
+TOTAL = "*"
+FICHA_COLUMNS = ("soldador", "wps", "maquina", "consumible", "proceso", "material_base", "proyecto_ot")
+PARAM_COLUMNS = ("voltaje", "amperaje", "velocidad", "gas", "temp_amb")
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    dimension    TEXT NOT NULL,
+    dia          TEXT NOT NULL,
+    valor        TEXT NOT NULL,
+    inspecciones INTEGER NOT NULL,
+    rechazadas   INTEGER NOT NULL,
+    defectos     INTEGER NOT NULL,
+    PRIMARY KEY (dimension, dia, valor)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_clases (
+    dimension TEXT NOT NULL,
+    dia       TEXT NOT NULL,
+    valor     TEXT NOT NULL,
+    clase     TEXT NOT NULL,
+    n         INTEGER NOT NULL,
+    PRIMARY KEY (dimension, dia, valor, clase)
+) WITHOUT ROWID;
+
+-- Aporte de cada ficha a los rollups, para poder restarlo si se vuelve a guardar
+CREATE TABLE IF NOT EXISTS rollup_fichas (
+    id_cordon    TEXT PRIMARY KEY,
+    contribucion TEXT NOT NULL
+);
+"""
+
+
+def parse_defect_map(text):
+    """`mapa_defectos` como dict ({'Porosity': 3}); acepta JSON y el str(dict) antiguo."""
+    if isinstance(text, dict):
+        return text
+    if not text:
+        return {}
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        try:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return {}
+        return value if isinstance(value, dict) else {}
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    # 0.0 es el valor por defecto del formulario y NaN el de pandas al leer Parquet: sin dato
+    if value != value:
+        return None
+    return value or None
+
+
+def dataset_schema(name):
+    """Esquema fijo de cada dataset: una ficha sin voltaje no debe dejar la columna como `null`."""
+    import pyarrow as pa
+    if name == "fichas":
+        fields = [("id_cordon", pa.string()), ("fecha", pa.string()), ("dia", pa.string()),
+                  ("veredicto", pa.string()), ("aprobacion_auto", pa.string()), ("rechazado", pa.bool_()),
+                  ("n_defectos", pa.int64()), ("mapa_defectos", pa.string()), ("ingested_at", pa.float64())]
+        fields += [(column, pa.string()) for column in FICHA_COLUMNS]
+        fields += [(column, pa.float64()) for column in PARAM_COLUMNS]
+    else:
+        fields = [("id_cordon", pa.string()), ("dia", pa.string()), ("proyecto_ot", pa.string()),
+                  ("cls", pa.int64()), ("clase", pa.string()), ("conf", pa.float64()),
+                  ("x1", pa.float64()), ("y1", pa.float64()), ("x2", pa.float64()), ("y2", pa.float64()),
+                  ("ingested_at", pa.float64())]
+    return pa.schema(fields)
+
+
+def param_bucket(value, width):
+    """Intervalo 'a–b' (a incluido, b excluido) de un parámetro numérico, o None si no hay dato."""
+    value = _number(value)
+    if value is None:
+        return None
+    low = (value // width) * width
+    return f"{low:g}–{low + width:g}"
+
+
+def class_counts(ficha, det=None):
+    if det is not None:
+        from weld_analysis import count_defects
+        return count_defects(det)
+    return {k: int(v) for k, v in parse_defect_map(ficha.get('auto_data', {}).get('mapa_defectos')).items()}
+
+
+def ficha_record(ficha, counts, ingested_at):
+    """Fila plana del dataset `fichas`."""
+    manual = ficha.get('manual_data', {})
+    auto = ficha.get('auto_data', {})
+    verdict = ficha_verdict(ficha)
+    record = {
+        'id_cordon': ficha['id_cordon'],
+        'fecha': ficha['fecha'],
+        'dia': ficha['fecha'][:10],
+        'veredicto': verdict,
+        'aprobacion_auto': auto.get('aprobacion_final'),
+        'rechazado': verdict == "RECHAZADO",
+        'n_defectos': int(sum(counts.values())),
+        'mapa_defectos': json.dumps(counts, ensure_ascii=False),
+        'ingested_at': ingested_at,
+    }
+    for column in FICHA_COLUMNS:
+        record[column] = str(manual.get(column) or "") or None
+    record['proyecto_ot'] = record['proyecto_ot'] or NO_OT
+    for column in PARAM_COLUMNS:
+        record[column] = _number(manual.get(column))
+    return record
+
+
+def contribution(record, counts):
+    """Aporte de una ficha a los rollups: claves (dimensión, valor) y conteos."""
+    keys = [(TOTAL, TOTAL)]
+    for dimension in DIMENSIONS:
+        if dimension in PARAM_BINS:
+            value = param_bucket(record[dimension], PARAM_BINS[dimension])
+        else:
+            value = record[dimension]
+        if value:
+            keys.append((dimension, value))
+    return {"dia": record['dia'], "keys": keys, "rechazada": int(record['rechazado']),
+            "defectos": record['n_defectos'], "clases": counts}
+
+
+class AnalyticsStore:
+    """Datasets Parquet + rollups SQLite bajo `path`."""
+
+    def __init__(self, path=ANALYTICS_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(ROLLUP_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, "rollups.db"), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def dataset_path(self, name):
+        return os.path.join(self.path, name)
+
+    # --- Escritura ---
+
+    def append_many(self, items):
+        """Anexa [(ficha, detections | None), ...] a Parquet y actualiza los rollups."""
+        ingested_at = time.time()
+        fichas, detections, contributions = [], [], []
+        for ficha, det in items:
+            counts = class_counts(ficha, det)
+            record = ficha_record(ficha, counts, ingested_at)
+            fichas.append(record)
+            contributions.append((record['id_cordon'], contribution(record, counts)))
+            if det is not None and len(det):
+                names = det.class_names()
+                for c, name, conf, box in zip(det.cls, names, det.conf, det.xyxy):
+                    detections.append({'id_cordon': record['id_cordon'], 'dia': record['dia'],
+                                       'proyecto_ot': record['proyecto_ot'], 'cls': int(c), 'clase': name,
+                                       'conf': float(conf), 'x1': float(box[0]), 'y1': float(box[1]),
+                                       'x2': float(box[2]), 'y2': float(box[3]), 'ingested_at': ingested_at})
+        if not fichas:
+            return 0
+        self._write("fichas", fichas)
+        if detections:
+            self._write("detecciones", detections)
+        self._update_rollups(contributions)
+        return len(fichas)
+
+    def append(self, ficha, detections=None):
+        return self.append_many([(ficha, detections)])
+
+    def _write(self, name, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(rows, schema=dataset_schema(name))
+        # Un archivo nuevo por partición y escritura: anexar nunca reescribe datos existentes
+        pq.write_to_dataset(table, self.dataset_path(name), partition_cols=list(PARTITION_COLS),
+                            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                            max_partitions=MAX_PARTITIONS)
+
+    def _update_rollups(self, contributions):
+        conn = self._conn()
+        with conn:
+            for id_cordon, contrib in contributions:
+                old = conn.execute("SELECT contribucion FROM rollup_fichas WHERE id_cordon = ?",
+                                   (id_cordon,)).fetchone()
+                if old is not None:
+                    self._apply(conn, json.loads(old[0]), -1)
+                self._apply(conn, contrib, 1)
+                conn.execute("INSERT OR REPLACE INTO rollup_fichas VALUES (?, ?)",
+                             (id_cordon, json.dumps(contrib, ensure_ascii=False)))
+
+    @staticmethod
+    def _apply(conn, contrib, sign):
+        dia = contrib["dia"]
+        rows = [(dimension, dia, valor, sign, sign * contrib["rechazada"], sign * contrib["defectos"])
+                for dimension, valor in contrib["keys"]]
+        conn.executemany(
+            "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (dimension, dia, valor) DO UPDATE SET "
+            "inspecciones = inspecciones + excluded.inspecciones, rechazadas = rechazadas + excluded.rechazadas, "
+            "defectos = defectos + excluded.defectos", rows)
+        class_rows = [(dimension, dia, valor, clase, sign * n)
+                      for dimension, valor in contrib["keys"] for clase, n in contrib["clases"].items()]
+        conn.executemany(
+            "INSERT INTO rollup_clases VALUES (?, ?, ?, ?, ?) ON CONFLICT (dimension, dia, valor, clase) "
+            "DO UPDATE SET n = n + excluded.n", class_rows)
+
+    def rebuild_rollups(self):
+        """Recalcula los rollups desde el dataset Parquet (p. ej. tras cambiar PARAM_BINS)."""
+        df = self.read("fichas")
+        # Nulos de pandas (NaN) como None y tipos numpy como tipos de Python, igual que en append()
+        df = df.astype(object).where(df.notna(), None)
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM rollups")
+            conn.execute("DELETE FROM rollup_clases")
+            conn.execute("DELETE FROM rollup_fichas")
+        contributions = []
+        for record in df.to_dict("records"):
+            record['rechazado'] = bool(record['rechazado'])
+            record['n_defectos'] = int(record['n_defectos'])
+            counts = parse_defect_map(record['mapa_defectos'])
+            contributions.append((record['id_cordon'], contribution(record, counts)))
+        self._update_rollups(contributions)
+        return len(contributions)
+
+    # --- Consultas sobre los rollups ---
+
+    @staticmethod
+    def _since(days, today=None):
+        return ((today or date.today()) - timedelta(days=days - 1)).isoformat()
+
+    def reject_rate(self, dimension, days=90, today=None, min_inspecciones=1):
+        """[{valor, inspecciones, rechazadas, tasa_rechazo, defectos}] de los últimos `days` días."""
+        rows = self._conn().execute(
+            "SELECT valor, SUM(inspecciones) AS inspecciones, SUM(rechazadas) AS rechazadas, "
+            "SUM(defectos) AS defectos FROM rollups WHERE dimension = ? AND dia >= ? "
+            "GROUP BY valor HAVING SUM(inspecciones) >= ?",
+            (dimension, self._since(days, today), max(1, min_inspecciones))).fetchall()
+        result = [dict(r, tasa_rechazo=r['rechazadas'] / r['inspecciones']) for r in rows]
+        return sorted(result, key=lambda r: (-r['tasa_rechazo'], -r['inspecciones']))
+
+    def daily(self, dimension=TOTAL, valor=TOTAL, days=90, today=None):
+        """Serie diaria [{dia, inspecciones, rechazadas, defectos}] de un valor de una dimensión."""
+        rows = self._conn().execute(
+            "SELECT dia, inspecciones, rechazadas, defectos FROM rollups "
+            "WHERE dimension = ? AND valor = ? AND dia >= ? ORDER BY dia",
+            (dimension, valor, self._since(days, today))).fetchall()
+        return [dict(r) for r in rows]
+
+    def class_breakdown(self, dimension, days=90, today=None):
+        """{valor: {clase: n}} de los últimos `days` días."""
+        rows = self._conn().execute(
+            "SELECT valor, clase, SUM(n) FROM rollup_clases WHERE dimension = ? AND dia >= ? "
+            "GROUP BY valor, clase HAVING SUM(n) > 0",
+            (dimension, self._since(days, today))).fetchall()
+        breakdown = {}
+        for valor, clase, n in rows:
+            breakdown.setdefault(valor, {})[clase] = n
+        return breakdown
+
+    # --- Lectura y mantenimiento del dataset ---
+
+    def read(self, name="fichas", desde=None, hasta=None, proyecto_ot=None, columns=None):
+        """DataFrame del dataset `name` (solo el último guardado de cada ficha), con poda de particiones."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        path = self.dataset_path(name)
+        if not os.path.isdir(path):
+            return pd.DataFrame(columns=columns or [])
+        partitioning = ds.partitioning(pa.schema([("dia", pa.string()), ("proyecto_ot", pa.string())]),
+                                       flavor="hive")
+        dataset = ds.dataset(path, format="parquet", partitioning=partitioning, schema=dataset_schema(name))
+        expr = None
+        for condition in ((ds.field("dia") >= desde) if desde else None,
+                          (ds.field("dia") <= hasta) if hasta else None,
+                          (ds.field("proyecto_ot") == proyecto_ot) if proyecto_ot else None):
+            if condition is not None:
+                expr = condition if expr is None else expr & condition
+        df = dataset.to_table(filter=expr).to_pandas()
+        if name == "fichas" and len(df):
+            df = df.sort_values("ingested_at").drop_duplicates("id_cordon", keep="last")
+        elif len(df):
+            # Detecciones del último guardado de cada ficha (aunque ese guardado no tenga ninguna)
+            latest = self.read("fichas", desde, hasta, proyecto_ot, columns=["id_cordon", "ingested_at"])
+            df = df.merge(latest, on=["id_cordon", "ingested_at"])
+        return df[columns] if columns else df
+
+    def compact(self, name="fichas"):
+        """Une los archivos de cada partición en uno solo. Devuelve las particiones compactadas."""
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+        schema = dataset_schema(name)
+        # Las columnas de partición van en la ruta, no en los archivos
+        schema = schema.remove(schema.get_field_index("proyecto_ot")).remove(schema.get_field_index("dia"))
+        compacted = 0
+        for root, _, files in os.walk(self.dataset_path(name)):
+            parts = sorted(f for f in files if f.endswith(".parquet"))
+            if len(parts) < 2:
+                continue
+            table = ds.dataset([os.path.join(root, f) for f in parts], format="parquet", schema=schema).to_table()
+            tmp = os.path.join(root, f".compact-{uuid.uuid4().hex}.tmp")
+            pq.write_table(table, tmp)
+            for f in parts:
+                os.remove(os.path.join(root, f))
+            os.replace(tmp, os.path.join(root, f"part-{uuid.uuid4().hex}-0.parquet"))
+            compacted += 1
+        return compacted
+
+    def clear(self):
+        for name in DATASETS:
+            shutil.rmtree(self.dataset_path(name), ignore_errors=True)
+        conn = self._conn()
+        with conn:
+            for table in ("rollups", "rollup_clases", "rollup_fichas"):
+                conn.execute(f"DELETE FROM {table}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_analytics():
+    """Almacén analítico único del proceso."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore()
+        return _store
+
+
+def backfill(analytics, fichas_db=DEFAULT_DB_PATH, batch_size=500):
+    """Carga todas las fichas del historial SQLite (con sus detecciones)."""
+    store = FichaStore(fichas_db)
+    batch, total = [], 0
+    for ficha in store.iter_fichas(batch_size):
+        detail = store.get(ficha['id_cordon'])
+        counts = {}
+        for d in detail['detecciones']:
+            counts[d['clase']] = counts.get(d['clase'], 0) + 1
+        if detail['detecciones']:
+            # Detecciones guardadas: fuente más fiable que el texto de mapa_defectos
+            ficha['auto_data'] = dict(ficha['auto_data'], mapa_defectos=json.dumps(counts, ensure_ascii=False))
+        batch.append((ficha, None))
+        if len(batch) >= batch_size:
+            total += analytics.append_many(batch)
+            batch = []
+    if batch:
+        total += analytics.append_many(batch)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Almacén analítico (Parquet + rollups) de las inspecciones.")
+    parser.add_argument("--path", default=ANALYTICS_PATH)
+    parser.add_argument("--backfill", action="store_true", help="Cargar las fichas del historial SQLite")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Base de fichas para --backfill")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="Recalcular los rollups desde Parquet")
+    parser.add_argument("--compact", action="store_true", help="Un archivo Parquet por partición")
+    parser.add_argument("--report", choices=(TOTAL,) + DIMENSIONS, default=None,
+                        help="Tasa de rechazo por esta dimensión")
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args(argv)
+
+    analytics = AnalyticsStore(args.path)
+    if args.backfill:
+        t0 = time.perf_counter()
+        n = backfill(analytics, args.db)
+        print(f"{n} fichas cargadas en {time.perf_counter() - t0:.1f}s")
+    if args.rebuild_rollups:
+        print(f"Rollups recalculados a partir de {analytics.rebuild_rollups()} fichas")
+    if args.compact:
+        print(f"{sum(analytics.compact(name) for name in DATASETS)} particiones compactadas")
+    if args.report:
+        t0 = time.perf_counter()
+        rows = analytics.reject_rate(args.report, args.days)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        print(f"Tasa de rechazo por {args.report}, últimos {args.days} días ({elapsed_ms:.1f} ms):")
+        for r in rows:
+            print(f"  {r['valor']:<30} {r['rechazadas']:>5}/{r['inspecciones']:<5} "
+                  f"{r['tasa_rechazo']:>6.1%}  defectos {r['defectos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
+# cv2/PIL se cargan aquí vía image_decode y compañía (ver warm_start.py); pandas se importa al usarse
 import streamlit as st
-from ultralytics import YOLO
-import cv2
-import tempfile
 import os
-from PIL import Image
 import numpy as np
-import pandas as pd
+from collections import deque
 from datetime import datetime
+import functools
+import time
 import uuid
-import fichas_config as fc
+import ficha_layout as layout
+from model_registry import get_registry, process_rss_mb
+from inference_backend import BACKENDS, DEFAULT_BACKEND
+from tiled_inference import TILING_MODES
+from inference_cache import predict_cached, image_digest
+from analytics_store import get_analytics
+from ficha_store import get_store, new_id_cordon
+from report_export import TEMPLATE_PATH, export_bytes, fill_template
+from session_images import DISPLAY_MAX_SIDE, AnnotatedImage, capacity_estimate, session_memory_report
+from image_decode import DecodedImage
+from inference_scheduler import get_scheduler
+from inference_workers import get_worker_pool
+from warm_start import get_warm_start, load_entry
+from bead_geometry import WORK_SIZE
+from defect_map import DefectMap
+from weld_analysis import build_auto_data, count_defects, measure_geometry, surface_condition
+from pipeline_metrics import StageTimer, get_metrics, start_metrics_server
 
 # Configuración de la página
 st.set_page_config(
@@ -17,6 +32,21 @@ st.set_page_config(
     layout="wide"
 )
 
+page_t0 = time.perf_counter()
+# Las secciones de la página son fragmentos: una interacción dentro de uno
+# (slider, carga de imagen, botón) re-ejecuta solo ese fragmento. El script
+# completo solo corre al cambiar de paso (st.rerun()).
+st.session_state._full_run = True
+# Endpoint Prometheus (GET /metrics) compartido por todas las sesiones del proceso
+metrics_port = start_metrics_server()
+
+# Tiempo del rerun que siguió al último análisis (desde st.rerun hasta este punto)
+if 'timing_pending' in st.session_state:
+    pipeline, stages, t_end = st.session_state.pop('timing_pending')
+    rerun_s = time.perf_counter() - t_end
+    get_metrics().observe(pipeline, "rerun", rerun_s)
+    st.session_state.last_timing = (pipeline, stages + [("rerun", round(rerun_s * 1000, 1))])
+
 # Estilos CSS personalizados
 st.markdown("""
 <style>
@@ -59,7 +89,8 @@ st.markdown("""
 # Inicializar Session State
 if 'ficha' not in st.session_state:
     st.session_state.ficha = {
-        'id_cordon': str(uuid.uuid4())[:8].upper(),
+        'id_cordon': new_id_cordon(),
+        'origen': uuid.uuid4().hex,
         'fecha': datetime.now().strftime("%Y-%m-%d %H:%M"),
         'manual_data': {},
         'auto_data': {},
@@ -69,7 +100,8 @@ if 'ficha' not in st.session_state:
 
 def reset_ficha():
     st.session_state.ficha = {
-        'id_cordon': str(uuid.uuid4())[:8].upper(),
+        'id_cordon': new_id_cordon(),
+        'origen': uuid.uuid4().hex,
         'fecha': datetime.now().strftime("%Y-%m-%d %H:%M"),
         'manual_data': {},
         'auto_data': {},
@@ -77,291 +109,482 @@ def reset_ficha():
         'step': 1
     }
 
-# Sidebar
-st.sidebar.title("🔧 Configuración")
-st.sidebar.markdown("---")
-confidence = st.sidebar.slider("Umbral de Confianza IA", 0.0, 1.0, 0.25, 0.05)
-model_path = st.sidebar.text_input("Ruta Modelo Soldadura (.pt)", "models/welding_model.pt")
-surface_model_path = st.sidebar.text_input("Ruta Modelo Superficie (.pt)", "models/surface_model.pt")
-
-try:
-    model = YOLO(model_path)
-    st.sidebar.success(f"Modelo Soldadura: OK")
-except Exception as e:
-    st.sidebar.error(f"Error Modelo Soldadura: {e}")
-
-try:
-    surface_model = YOLO(surface_model_path)
-    st.sidebar.success(f"Modelo Superficie: OK")
-except Exception as e:
-    st.sidebar.warning(f"Modelo Superficie no encontrado (usando dummy): {e}")
-    surface_model = None
-
-st.sidebar.markdown("---")
-if st.sidebar.button("Nueva Ficha"):
-    reset_ficha()
-    st.rerun()
+# Configuración de la barra lateral (los fragmentos la leen de session_state)
+CONFIG_DEFAULTS = {
+    'cfg_confidence': 0.25,
+    'cfg_model_path': "models/welding_model.pt",
+    'cfg_surface_model_path': "models/surface_model.pt",
+    'cfg_backend': DEFAULT_BACKEND,
+    'cfg_tiling': TILING_MODES[0],
+}
+for key, value in CONFIG_DEFAULTS.items():
+    st.session_state.setdefault(key, value)
 
-st.title("📋 Sistema de Gestión de Calidad de Soldadura")
+RERUN_LOG_SIZE = 20
 
-# Progress Bar
-steps = ["1. Datos de Entrada", "2. Inspección", "3. Resultados", "4. Reporte"]
-current_step = st.session_state.ficha['step']
-st.progress(current_step / 4)
-st.subheader(f"Paso {current_step}: {steps[current_step-1]}")
 
-# --- STEP 1: DATOS DE ENTRADA ---
-if current_step == 1:
-    st.markdown("### 📝 Ingreso de Datos Manuales (Pre-Soldadura)")
-    
-    # --- SECCIÓN DE INSPECCIÓN DE SUPERFICIE ---
-    with st.expander("🔍 Inspección de Superficie (Pre-Soldadura)", expanded=True):
-        st.info("Cargue una imagen del material base para detectar contaminación (Óxido, Aceite, etc.)")
-        surf_file = st.file_uploader("Imagen Superficie", type=['jpg', 'png', 'jpeg'], key="surf_uploader")
-        
-        if surf_file:
-            surf_img = Image.open(surf_file).convert("RGB")
-            c1, c2 = st.columns(2)
-            c1.image(surf_img, caption="Superficie Material", use_container_width=True)
-            
-            if st.button("Analizar Superficie"):
-                if surface_model:
-                    res_surf = surface_model.predict(np.array(surf_img), conf=confidence)
-                    res_plotted_surf = res_surf[0].plot()
-                    c2.image(res_plotted_surf, caption="Detección de Contaminantes", use_container_width=True)
-                    
+def record_rerun(name, seconds):
+    """Anota la duración de un fragmento (o del script completo) para el panel de depuración."""
+    scope = "completo" if st.session_state.get('_full_run') else "fragmento"
+    if 'rerun_log' not in st.session_state:
+        st.session_state.rerun_log = deque(maxlen=RERUN_LOG_SIZE)
+    st.session_state.rerun_log.append((datetime.now().strftime("%H:%M:%S"), scope, name,
+                                       round(seconds * 1000, 1)))
+    if scope == "fragmento":
+        get_metrics().observe("ui", f"fragmento_{name}", seconds)
+
+
+def timed_fragment(fn):
+    """st.fragment que además mide cada ejecución."""
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record_rerun(fn.__name__, time.perf_counter() - t0)
+    return st.fragment(run)
+
+
+def load_models():
+    """(entrada soldadura, entrada superficie, errores); los registros ya los tienen en memoria."""
+    entries, errors = [], []
+    for key in ('cfg_model_path', 'cfg_surface_model_path'):
+        try:
+            entries.append(load_entry(st.session_state[key], st.session_state.cfg_backend))
+            errors.append(None)
+        except Exception as e:
+            entries.append(None)
+            errors.append(e)
+    return entries[0], entries[1], errors
+
+
+def render_widget(widget, value):
+    if widget.kind == "number":
+        st.number_input(widget.label, key=widget.key, step=widget.step, value=value if value else 0.0)
+    elif widget.kind == "selectbox":
+        st.selectbox(widget.label, widget.options, key=widget.key,
+                     index=widget.options.index(value) if value in widget.options else 0)
+    else:
+        st.text_input(widget.label, key=widget.key, value=value if value else "")
+
+
+# Los modelos se cargan una sola vez y se comparten entre sesiones: en el pool
+# de procesos de inferencia (INFERENCE_WORKERS) o, si está desactivado, aquí.
+# La precarga empieza al arrancar el contenedor (warm_start.py) o, si no, ahora
+# en segundo plano; el primer visitante solo espera lo que falte.
+warm = get_warm_start()
+warm.start()
+if warm.warming:
+    with st.spinner("⏳ Cargando y calentando los modelos (primer arranque)..."):
+        warm.wait()
+worker_pool = get_worker_pool()
+registry = get_registry()
+# Con el pool de procesos, cada carril admite tantos trabajos como procesos
+scheduler = get_scheduler(lane_width=worker_pool.size if worker_pool else 1)
+
+
+@timed_fragment
+def sidebar_config():
+    st.title("🔧 Configuración")
+    st.markdown("---")
+    st.slider("Umbral de Confianza IA", 0.0, 1.0, step=0.05, key='cfg_confidence')
+    st.text_input("Ruta Modelo Soldadura (.pt)", key='cfg_model_path')
+    st.text_input("Ruta Modelo Superficie (.pt)", key='cfg_surface_model_path')
+    st.selectbox("Backend de Inferencia", BACKENDS, key='cfg_backend',
+                 help="auto: ONNX Runtime (CPU) si está disponible, si no PyTorch")
+    st.selectbox("Inferencia por Mosaicos", TILING_MODES, key='cfg_tiling',
+                 format_func={"auto": "Automática", "on": "Siempre", "off": "Nunca"}.get,
+                 help="Divide fotos de alta resolución en mosaicos a resolución nativa")
+
+    model_entry, surface_entry, (model_error, surface_error) = load_models()
+    if model_entry:
+        st.success(f"Modelo Soldadura: OK [{model_entry.backend}] ({model_entry.load_s:.2f}s)")
+    else:
+        st.error(f"Error Modelo Soldadura: {model_error}")
+    if surface_entry:
+        st.success(f"Modelo Superficie: OK [{surface_entry.backend}]")
+    else:
+        st.warning(f"Modelo Superficie no encontrado (usando dummy): {surface_error}")
+
+    with st.expander("Modelos en memoria"):
+        if worker_pool:
+            pool_stats = worker_pool.stats()
+            st.caption(f"Pool de inferencia: {pool_stats['alive']}/{pool_stats['workers']} procesos × "
+                       f"{pool_stats['threads_per_worker']} hilos · en curso {sum(pool_stats['inflight'])} · "
+                       f"reinicios {pool_stats['restarts']}")
+        for info in (pool_stats['models'] if worker_pool else registry.stats()):
+            st.caption(
+                f"**{os.path.basename(info['path'])}** ({info['backend']}) — carga {info['load_s']:.2f}s, "
+                f"warm-up {info['warmup_s']:.2f}s, +{info['rss_delta_mb']:.0f} MB RSS, "
+                f"usos {info['hits']}"
+            )
+
+    with st.expander("Memoria de la sesión"):
+        session_report = session_memory_report(st.session_state)
+        session_bytes = sum(session_report.values())
+        st.caption(f"Sesión: {session_bytes / 1e6:.2f} MB · proceso: {process_rss_mb():.0f} MB RSS")
+        for key, size in list(session_report.items())[:5]:
+            st.caption(f"`{key}`: {size / 1e3:.0f} KB")
+        budget_mb = st.number_input("Memoria del contenedor (MB)", value=4096, step=512)
+        st.caption(f"Capacidad estimada: ~{capacity_estimate(session_bytes, budget_mb)} inspectores concurrentes")
+
+    st.markdown("---")
+    if st.button("Nueva Ficha"):
+        reset_ficha()
+        st.rerun()
+
+
+def debug_panel(live):
+    with st.expander("⏱️ Tiempos por etapa y reruns"):
+        # pandas solo se importa cuando hay tiempos que mostrar
+        if warm.cold_start_s is not None:
+            st.caption(f"Arranque en frío: {warm.cold_start_s:.1f} s ({warm.state})")
+        if 'last_timing' in st.session_state:
+            import pandas as pd
+            pipeline, stages = st.session_state.last_timing
+            st.caption(f"Último análisis ({pipeline}):")
+            st.dataframe(pd.DataFrame(stages, columns=["Etapa", "ms"]), hide_index=True, use_container_width=True)
+        if st.session_state.get('rerun_log'):
+            import pandas as pd
+            st.caption("Últimas ejecuciones (script completo o solo el fragmento tocado):")
+            st.dataframe(pd.DataFrame(list(reversed(st.session_state.rerun_log)),
+                                      columns=["Hora", "Alcance", "Sección", "ms"]),
+                         hide_index=True, use_container_width=True)
+        summary = get_metrics().summary()
+        if summary:
+            import pandas as pd
+            st.caption("Promedio del proceso (todas las sesiones):")
+            st.dataframe(pd.DataFrame([(p, s, n, round(ms, 1)) for (p, s), (n, ms) in sorted(summary.items())],
+                                      columns=["Pipeline", "Etapa", "N", "ms prom."]),
+                         hide_index=True, use_container_width=True)
+        if metrics_port:
+            st.caption(f"Métricas Prometheus: `http://<host>:{metrics_port}/metrics`")
+        if st.toggle("Actualizar en vivo", key='debug_live',
+                     help="Refresca este panel cada 2 s para ver los reruns de los demás fragmentos") != live:
+            # run_every se fija al crear el fragmento: hace falta una ejecución completa
+            st.rerun()
+
+
+with st.sidebar:
+    sidebar_config()
+    # El panel es su propio fragmento; en vivo se refresca solo, sin tocar el resto
+    debug_live = st.session_state.get('debug_live', False)
+    st.fragment(debug_panel, run_every="2s" if debug_live else None)(debug_live)
+
+
+@timed_fragment
+def surface_inspection():
+    st.info("Cargue una imagen del material base para detectar contaminación (Óxido, Aceite, etc.)")
+    surf_file = st.file_uploader("Imagen Superficie", type=['jpg', 'png', 'jpeg'], key="surf_uploader")
+
+    if surf_file:
+        t0 = time.perf_counter()
+        surf_digest = image_digest(surf_file.getvalue())
+        t1 = time.perf_counter()
+        # Solo cabecera + vista reducida (modo draft); nunca la foto completa
+        surf_decoded = DecodedImage(surf_file.getvalue())
+        surf_view, surf_scale = surf_decoded.reduced(DISPLAY_MAX_SIDE)
+        decode_s, digest_s = time.perf_counter() - t1, t1 - t0
+        c1, c2 = st.columns(2)
+        c1.image(surf_view, caption="Superficie Material", use_container_width=True)
+
+        if st.button("Analizar Superficie"):
+            _, surface_entry, _ = load_models()
+            if surface_entry:
+                timer = StageTimer("surface")
+                with timer:
+                    timer.record("digest", digest_s)
+                    timer.record("decode", decode_s)
+                    # Detecciones cacheadas por contenido: cambiar el umbral solo re-filtra
+                    with timer.stage("predict"):
+                        surf_det = scheduler.submit(
+                            "surface", predict_cached, surface_entry.model, surface_entry.key, surf_decoded,
+                            surf_digest, st.session_state.cfg_confidence).result()
+                    with timer.stage("render"):
+                        res_plotted_surf = surf_det.scaled(surf_scale).plot(np.asarray(surf_view))
+                        c2.image(res_plotted_surf, caption="Detección de Contaminantes", use_container_width=True)
+
                     # Contar defectos
-                    surf_boxes = res_surf[0].boxes
-                    surf_defects = []
-                    if len(surf_boxes) > 0:
-                        for box in surf_boxes:
-                            cls = int(box.cls[0])
-                            surf_defects.append(surface_model.names[cls])
-                    
-                    if surf_defects:
-                        st.error(f"Contaminación Detectada: {', '.join(set(surf_defects))}")
-                        st.session_state.ficha['manual_data']['condicion_superficial'] = f"RECHAZADO ({', '.join(set(surf_defects))})"
-                    else:
-                        st.success("Superficie Limpia")
-                        st.session_state.ficha['manual_data']['condicion_superficial'] = "ACEPTADO (Limpio)"
+                    with timer.stage("verdict"):
+                        condicion = surface_condition(surf_det)
+                st.session_state.last_timing = ("surface", timer.breakdown())
+                if len(surf_det) > 0:
+                    st.error(f"Contaminación Detectada: {', '.join(sorted(count_defects(surf_det)))}")
                 else:
-                    st.warning("Modelo de superficie no cargado.")
+                    st.success("Superficie Limpia")
+                st.session_state.ficha['manual_data']['condicion_superficial'] = condicion
+            else:
+                st.warning("Modelo de superficie no cargado.")
+
+    # Resultado de superficie (se actualiza junto con este fragmento, no con el formulario)
+    st.text_input("Condición Superficial (Auto)", disabled=True,
+                  value=st.session_state.ficha['manual_data'].get('condicion_superficial', 'Pendiente'))
+
 
+@timed_fragment
+def manual_data_form():
+    manual = st.session_state.ficha['manual_data']
     with st.form("manual_data_form"):
-        # Trazabilidad
-        st.markdown("#### Ficha de Trazabilidad")
-        cols = st.columns(3)
-        for i, field in enumerate(fc.TRAZABILIDAD_FIELDS["manual"]):
-            col = cols[i % 3]
-            with col:
-                key = field["key"]
-                val = st.session_state.ficha['manual_data'].get(key)
-                if field["type"] == "number":
-                    st.number_input(field["label"], key=key, step=field.get("step", 1.0), value=val if val else 0.0)
-                else:
-                    st.text_input(field["label"], key=key, value=val if val else "")
-
-        st.markdown("---")
-        # Geometría y Dimensionalidad (Manuales)
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("#### Geometría (Config)")
-            for field in fc.GEOMETRIA_FIELDS["manual"]:
-                key = field["key"]
-                val = st.session_state.ficha['manual_data'].get(key)
-                if field["type"] == "number":
-                    st.number_input(field["label"], key=key, step=field.get("step", 1.0), value=val if val else 0.0)
-                else:
-                    st.text_input(field["label"], key=key, value=val if val else "")
-        
-        with col2:
-            st.markdown("#### Dimensionalidad (Datos)")
-            for field in fc.DIMENSIONALIDAD_FIELDS["manual"]:
-                key = field["key"]
-                val = st.session_state.ficha['manual_data'].get(key)
-                if field["type"] == "number":
-                    st.number_input(field["label"], key=key, step=field.get("step", 1.0), value=val if val else 0.0)
-                else:
-                    st.text_input(field["label"], key=key, value=val if val else "")
-        
-        st.markdown("---")
-        # Defectología (Manuales)
-        st.markdown("#### Defectología (Normativa)")
-        for field in fc.DEFECTOLOGIA_FIELDS["manual"]:
-            key = field["key"]
-            val = st.session_state.ficha['manual_data'].get(key)
-            if field["type"] == "selectbox":
-                st.selectbox(field["label"], field["options"], key=key, index=field["options"].index(val) if val in field["options"] else 0)
-            else:
-                st.text_input(field["label"], key=key, value=val if val else "")
-        
-        # Campo extra para resultado de superficie
-        st.text_input("Condición Superficial (Auto)", key="condicion_superficial_display", 
-                      value=st.session_state.ficha['manual_data'].get('condicion_superficial', 'Pendiente'), disabled=True)
+        # Secciones precalculadas en ficha_layout a partir de fichas_config
+        for i, row in enumerate(layout.MANUAL_ROWS):
+            if i:
+                st.markdown("---")
+            containers = st.columns(len(row)) if len(row) > 1 else [st.container()]
+            for section, container in zip(row, containers):
+                with container:
+                    st.markdown(f"#### {section.title}")
+                    cols = st.columns(len(section.columns)) if len(section.columns) > 1 else [st.container()]
+                    for col, widgets in zip(cols, section.columns):
+                        with col:
+                            for widget in widgets:
+                                render_widget(widget, manual.get(widget.field))
 
         submitted = st.form_submit_button("Guardar y Continuar ➡️")
-        
+
         if submitted:
             # Save all manual inputs to session state
-            for field_list in [fc.TRAZABILIDAD_FIELDS["manual"], fc.GEOMETRIA_FIELDS["manual"], fc.DIMENSIONALIDAD_FIELDS["manual"], fc.DEFECTOLOGIA_FIELDS["manual"]]:
-                for field in field_list:
-                    st.session_state.ficha['manual_data'][field["key"]] = st.session_state[field["key"]]
-            
+            for widget in layout.MANUAL_WIDGETS:
+                manual[widget.field] = st.session_state[widget.key]
+
+            # Superficie cargada pero sin analizar: se lanza ya en su carril (corre mientras
+            # se carga el cordón) y de la foto solo queda el Future, no sus bytes
+            surf_file = st.session_state.get("surf_uploader")
+            if surf_file is not None and 'condicion_superficial' not in manual:
+                _, surface_entry, _ = load_models()
+                if surface_entry:
+                    data = surf_file.getvalue()
+                    st.session_state.ficha['surface_pending'] = scheduler.submit(
+                        "surface", predict_cached, surface_entry.model, surface_entry.key, DecodedImage(data),
+                        image_digest(data), st.session_state.cfg_confidence)
+
             st.session_state.ficha['step'] = 2
             st.rerun()
 
 
-# --- STEP 2: INSPECCIÓN ---
-elif current_step == 2:
-    st.markdown("### 👁️ Inspección y Detección")
-    
+@timed_fragment
+def weld_inspection():
     uploaded_file = st.file_uploader("Cargar Imagen del Cordón", type=['jpg', 'png', 'jpeg'])
-    
+
     if uploaded_file is not None:
-        image = Image.open(uploaded_file).convert("RGB")
-        st.image(image, caption="Imagen Original", use_container_width=True)
-        
+        t0 = time.perf_counter()
+        image_hash = image_digest(uploaded_file.getvalue())
+        t1 = time.perf_counter()
+        # Solo cabecera + vista reducida; la imagen completa se decodifica
+        # únicamente si la inferencia por mosaicos la necesita
+        decoded = DecodedImage(uploaded_file.getvalue())
+        view, _ = decoded.reduced(DISPLAY_MAX_SIDE)
+        decode_s, digest_s = time.perf_counter() - t1, t1 - t0
+        st.image(view, caption="Imagen Original", use_container_width=True)
+
         if st.button("Ejecutar Análisis IA ⚡"):
-            with st.spinner('Analizando imagen y calculando métricas...'):
-                # Análisis YOLO
-                # Análisis YOLO
-                # Pasar imagen PIL directa para asegurar manejo correcto de canales RGB
-                results = model.predict(image, conf=confidence)
-                res_plotted = results[0].plot()
-                
-                # Guardar imagen procesada
-                st.session_state.ficha['processed_image'] = cv2.cvtColor(res_plotted, cv2.COLOR_BGR2RGB)
-                
-                # Extraer datos reales de detección
-                boxes = results[0].boxes
-                defect_counts = {}
-                detections = []
-                
-                if len(boxes) > 0:
-                    for box in boxes:
-                        cls = int(box.cls[0])
-                        name = model.names[cls]
-                        detections.append(name)
-                        defect_counts[name] = defect_counts.get(name, 0) + 1
-                
-                # --- SIMULACIÓN DE MÉTRICAS (Post-Procesamiento) ---
-                # En un sistema real, esto vendría de algoritmos de visión computacional específicos
-                
-                # Geometría
-                ancho_px = results[0].boxes.xywh[:, 2].mean() if len(boxes) > 0 else 0 # width in pixels (dummy)
-                # Conversión dummy px -> mm
-                ancho_mm = np.random.uniform(8.0, 12.0) 
-                
-                auto_data = {}
-                
-                # Llenar campos automáticos de Geometría
-                auto_data['ancho_promedio'] = f"{ancho_mm:.2f}"
-                auto_data['altura_refuerzo'] = f"{np.random.uniform(1.5, 3.0):.2f}"
-                auto_data['radio_curvatura'] = f"{np.random.uniform(5.0, 8.0):.2f}"
-                auto_data['simetria'] = f"{np.random.uniform(90, 100):.1f}"
-                auto_data['angulo_mojado_l'] = f"{np.random.uniform(130, 150):.1f}"
-                auto_data['angulo_mojado_r'] = f"{np.random.uniform(130, 150):.1f}"
-                auto_data['rugosidad'] = f"{np.random.uniform(0.5, 2.0):.2f}"
-                auto_data['secciones_criticas'] = "Ninguna" if len(boxes) == 0 else f"{len(boxes)} zonas"
-
-                # Llenar campos automáticos de Defectología
-                # Mapeo más robusto de clases (ajustar según las clases reales del modelo)
-                # Clases comunes: Porosity, Undercut, Crack, Lack of Fusion, Spatter, Burn Through
-                
-                def get_count(names_list):
-                    return sum(defect_counts.get(name, 0) for name in names_list)
-
-                auto_data['def_poros'] = f"{get_count(['Porosity', 'Poros', 'Poro'])} detectados"
-                auto_data['def_porosidad_lineal'] = "No detectada" if get_count(['Linear Porosity']) == 0 else "Detectada"
-                auto_data['def_socavado'] = f"{get_count(['Undercut', 'Socavado'])} zonas"
-                auto_data['def_grietas'] = f"{get_count(['Crack', 'Grieta'])} detectadas"
-                auto_data['def_falta_fusion'] = f"{get_count(['Lack of Fusion', 'Falta Fusion'])} zonas"
-                auto_data['def_exceso_refuerzo'] = f"{get_count(['Excess Reinforcement'])} zonas"
-                auto_data['def_mordeduras'] = f"{get_count(['Bite', 'Mordedura'])} detectadas"
-                auto_data['def_spatter'] = "Alto" if get_count(['Spatter']) > 5 else ("Bajo" if get_count(['Spatter']) > 0 else "Nulo")
-                auto_data['def_irregular'] = "Detectado" if get_count(['Irregular', 'Bad Bead', 'Bad Welding']) > 0 else "No detectado"
-
-                # Llenar campos automáticos de Dimensionalidad
-                auto_data['dim_ancho'] = auto_data['ancho_promedio']
-                auto_data['dim_altura'] = auto_data['altura_refuerzo']
-                auto_data['dim_angulo_l'] = auto_data['angulo_mojado_l']
-                auto_data['dim_angulo_r'] = auto_data['angulo_mojado_r']
-                auto_data['dim_uniformidad'] = "5%"
-                auto_data['dim_rectitud'] = "1 mm"
-                auto_data['dim_penetracion'] = "N/A (Visual)"
-
-                # Trazabilidad Automática
-                auto_data['id_cordon'] = st.session_state.ficha['id_cordon']
-                auto_data['mapa_defectos'] = str(defect_counts)
-                auto_data['aprobacion_final'] = "RECHAZADO" if len(boxes) > 0 else "ACEPTADO"
+            model_entry, _, (model_error, _) = load_models()
+            if model_entry is None:
+                st.error(f"Modelo de soldadura no cargado: {model_error}")
+                return
+            confidence = st.session_state.cfg_confidence
+            with st.spinner('Analizando imagen y calculando métricas...'), StageTimer("weld") as timer:
+                timer.record("digest", digest_s)
+                timer.record("decode", decode_s)
+                # Análisis YOLO sobre la decodificación reducida (letterbox BGR); cajas en
+                # coordenadas de la imagen completa orientada.
+                # La predicción cruda se cachea por (imagen, modelo): mover el umbral
+                # o volver desde el paso 3 no repite la inferencia.
+                # Si la superficie quedó sin analizar en el paso 1, su inferencia se lanzó
+                # al salir de ese paso y corre en su carril a la vez que la del cordón.
+                jobs = {"weld": (predict_cached, (model_entry.model, model_entry.key, decoded, image_hash,
+                                                  confidence), {"tiling": st.session_state.cfg_tiling})}
+                with timer.stage("predict"):
+                    boxes = scheduler.run(jobs).result()["weld"]
+                    surface_pending = st.session_state.ficha.pop('surface_pending', None)
+                    if surface_pending is not None:
+                        # La superficie es opcional: si su modelo falla, el análisis del cordón sigue
+                        try:
+                            condicion = surface_condition(surface_pending.result())
+                        except Exception as e:
+                            condicion = f"N/A (error del modelo de superficie: {e})"
+                            st.warning(f"No se pudo analizar la superficie: {e}")
+                        st.session_state.ficha['manual_data']['condicion_superficial'] = condicion
+
+                # Guardar solo una vista previa anotada comprimida + una copia de detalle
+                # acotada; la versión anotada de detalle se dibuja bajo demanda en el paso 3
+                with timer.stage("render"):
+                    st.session_state.ficha['processed_image'] = AnnotatedImage(decoded, boxes)
+
+                # Geometría medida sobre la imagen (escala según la distancia cámara-pieza)
+                # (sobre una decodificación reducida al tamaño de trabajo de la medición)
+                with timer.stage("geometry"):
+                    geo_img, geo_scale = decoded.reduced(WORK_SIZE)
+                    geometry = measure_geometry(np.asarray(geo_img), boxes,
+                                                st.session_state.ficha['manual_data'].get('distancia_camara'),
+                                                source_scale=geo_scale)
+                decoded.release()
+
+                # Campos automáticos de las fichas (compartido con las herramientas por lotes)
+                with timer.stage("fichas"):
+                    defect_map = DefectMap.from_detections(boxes, geometry)
+                    auto_data = build_auto_data(boxes, st.session_state.ficha['id_cordon'], geometry, defect_map)
+
+                st.session_state.ficha['defect_map'] = defect_map.as_dict()
 
                 st.session_state.ficha['auto_data'] = auto_data
+                st.session_state.ficha['detections'] = boxes
                 st.session_state.ficha['image_analyzed'] = True
-                
+
                 st.session_state.ficha['step'] = 3
-                st.rerun()
-    
-    if st.button("⬅️ Volver"):
-        st.session_state.ficha['step'] = 1
-        st.rerun()
+            # El rerun se mide al comienzo de la siguiente ejecución del script
+            st.session_state.timing_pending = ("weld", timer.breakdown(), time.perf_counter())
+            st.rerun()
 
-# --- STEP 3: RESULTADOS Y VALIDACIÓN ---
-elif current_step == 3:
-    st.markdown("### 📊 Resultados y Validación")
-    
+
+@timed_fragment
+def analysis_summary():
     col_img, col_info = st.columns([1, 1])
     with col_img:
-        st.image(st.session_state.ficha['processed_image'], caption="Imagen Analizada", use_container_width=True)
-    
+        annotated = st.session_state.ficha['processed_image']
+        st.image(annotated.preview, caption="Imagen Analizada", use_container_width=True)
+        if st.button("🔍 Ver en alta resolución"):
+            st.image(annotated.render_full(), caption="Imagen Analizada (alta resolución)")
+
     with col_info:
         st.markdown("#### Resumen de Detección")
         auto = st.session_state.ficha['auto_data']
         st.info(f"Estado Sugerido: **{auto.get('aprobacion_final', 'PENDIENTE')}**")
-        
+
         # Mostrar métricas clave
         c1, c2 = st.columns(2)
-        c1.metric("Ancho Promedio", f"{auto.get('ancho_promedio', 0)} mm")
-        c2.metric("Altura Refuerzo", f"{auto.get('altura_refuerzo', 0)} mm")
-    
-    st.markdown("---")
-    st.markdown("#### Revisión de Datos Automáticos")
-    st.caption("Puede ajustar manualmente los valores si la detección fue imprecisa.")
-    
+        ancho = auto.get('ancho_promedio', '-')
+        c1.metric("Ancho Promedio", ancho if ' ' in ancho or ancho == 'N/A' else f"{ancho} mm")
+        c2.metric("Uniformidad (% Desv)", auto.get('dim_uniformidad', '-'))
+        st.caption(f"Secciones críticas: {auto.get('secciones_criticas', '-')}")
+
+        defect_map = st.session_state.ficha.get('defect_map')
+        if defect_map and defect_map['defectos']:
+            with st.expander(f"📍 Posición de los defectos a lo largo del cordón ({defect_map['units']})"):
+                st.dataframe(defect_map['defectos'], use_container_width=True, hide_index=True)
+
+
+@timed_fragment
+def validation_form():
+    auto = st.session_state.ficha['auto_data']
     with st.form("validation_form"):
         # Mostrar todos los campos automáticos para posible edición
-        tabs = st.tabs(["Geometría", "Defectología", "Dimensionalidad"])
-        
-        with tabs[0]:
-            for field in fc.GEOMETRIA_FIELDS["automatic"]:
-                key = field["key"]
-                st.text_input(field["label"], value=st.session_state.ficha['auto_data'].get(key, ""), key=f"val_{key}")
-        
-        with tabs[1]:
-            for field in fc.DEFECTOLOGIA_FIELDS["automatic"]:
-                key = field["key"]
-                st.text_input(field["label"], value=st.session_state.ficha['auto_data'].get(key, ""), key=f"val_{key}")
-                
-        with tabs[2]:
-            for field in fc.DIMENSIONALIDAD_FIELDS["automatic"]:
-                key = field["key"]
-                st.text_input(field["label"], value=st.session_state.ficha['auto_data'].get(key, ""), key=f"val_{key}")
-        
+        tabs = st.tabs([title for title, _ in layout.VALIDATION_TABS])
+        for tab, (_, widgets) in zip(tabs, layout.VALIDATION_TABS):
+            with tab:
+                for widget in widgets:
+                    st.text_input(widget.label, value=auto.get(widget.field, ""), key=widget.key)
+
         st.markdown("#### Validación Humana")
         obs = st.text_area("Observaciones del Inspector", key="observaciones_finales")
         veredicto = st.selectbox("Dictamen Final", ["APROBADO", "RECHAZADO"], index=0 if auto.get('aprobacion_final') == "ACEPTADO" else 1)
-        
+
         if st.form_submit_button("Confirmar y Generar Reporte ➡️"):
             # Actualizar datos con los valores del formulario (si se editaron)
-            for field_list in [fc.GEOMETRIA_FIELDS["automatic"], fc.DEFECTOLOGIA_FIELDS["automatic"], fc.DIMENSIONALIDAD_FIELDS["automatic"]]:
-                for field in field_list:
-                    st.session_state.ficha['auto_data'][field["key"]] = st.session_state[f"val_{field['key']}"]
-            
+            for widget in layout.VALIDATION_WIDGETS:
+                auto[widget.field] = st.session_state[widget.key]
+
             st.session_state.ficha['manual_data']['observaciones'] = obs
             st.session_state.ficha['manual_data']['veredicto_final'] = veredicto
-            
+
+            # Persistir la ficha (SQLite) para el historial
+            try:
+                get_store().save(st.session_state.ficha, st.session_state.ficha.get('detections'))
+            except Exception as e:
+                st.warning(f"No se pudo guardar la ficha en el historial: {e}")
+            else:
+                # Y anexarla al almacén analítico (Parquet + rollups del tablero de calidad)
+                try:
+                    get_analytics().append(st.session_state.ficha, st.session_state.ficha.get('detections'))
+                except Exception as e:
+                    st.warning(f"No se pudo registrar la ficha en la analítica: {e}")
+
             st.session_state.ficha['step'] = 4
             st.rerun()
 
+
+@timed_fragment
+def report():
+    import pandas as pd
+
+    ficha = st.session_state.ficha
+    tabs = st.tabs([tab for tab, _, _ in layout.REPORT_TABS])
+    for tab, (_, titulo, rows) in zip(tabs, layout.REPORT_TABS):
+        with tab:
+            st.markdown(f"#### {titulo}")
+            # Combinar manual y auto
+            data = {label: ficha[source].get(key, "-") for label, source, key in rows}
+            st.table(pd.DataFrame(list(data.items()), columns=["Campo", "Valor"]))
+
+    # Los archivos se generan una vez por ficha; descargar solo re-ejecuta este fragmento
+    exports = ficha.setdefault('exports', {})
+    for fmt in ("csv", "xlsx", "pdf"):
+        if fmt not in exports:
+            exports[fmt] = export_bytes([ficha], fmt)
+    if 'template' not in exports and os.path.exists(TEMPLATE_PATH):
+        exports['template'] = fill_template(ficha)
+
+    nombre = f"ficha_{ficha['id_cordon']}"
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        if st.button("🔄 Nueva Inspección"):
+            reset_ficha()
+            st.rerun()
+    with col2:
+        st.download_button("📥 CSV", data=exports["csv"],
+                           file_name=f"{nombre}.csv", mime="text/csv")
+    with col3:
+        st.download_button("📥 XLSX", data=exports["xlsx"], file_name=f"{nombre}.xlsx",
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    with col4:
+        st.download_button("📥 PDF", data=exports["pdf"],
+                           file_name=f"{nombre}.pdf", mime="application/pdf")
+    with col5:
+        if 'template' in exports:
+            st.download_button("📥 Plantilla Oficial", data=exports['template'], file_name=f"{nombre}_plantilla.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+
+st.title("📋 Sistema de Gestión de Calidad de Soldadura")
+
+# Progress Bar
+steps = ["1. Datos de Entrada", "2. Inspección", "3. Resultados", "4. Reporte"]
+current_step = st.session_state.ficha['step']
+st.progress(current_step / 4)
+st.subheader(f"Paso {current_step}: {steps[current_step-1]}")
+
+# --- STEP 1: DATOS DE ENTRADA ---
+if current_step == 1:
+    st.markdown("### 📝 Ingreso de Datos Manuales (Pre-Soldadura)")
+
+    # --- SECCIÓN DE INSPECCIÓN DE SUPERFICIE ---
+    with st.expander("🔍 Inspección de Superficie (Pre-Soldadura)", expanded=True):
+        surface_inspection()
+
+    manual_data_form()
+
+# --- STEP 2: INSPECCIÓN ---
+elif current_step == 2:
+    st.markdown("### 👁️ Inspección y Detección")
+
+    weld_inspection()
+
+    if st.button("⬅️ Volver"):
+        st.session_state.ficha['step'] = 1
+        st.rerun()
+
+# --- STEP 3: RESULTADOS Y VALIDACIÓN ---
+elif current_step == 3:
+    st.markdown("### 📊 Resultados y Validación")
+
+    analysis_summary()
+
+    st.markdown("---")
+    st.markdown("#### Revisión de Datos Automáticos")
+    st.caption("Puede ajustar manualmente los valores si la detección fue imprecisa.")
+
+    validation_form()
+
     if st.button("⬅️ Volver a Inspección"):
         st.session_state.ficha['step'] = 2
         st.rerun()
@@ -370,41 +593,11 @@ elif current_step == 3:
 elif current_step == 4:
     st.markdown("### 📑 Fichas Técnicas Generadas")
     st.success("¡Proceso completado! Las fichas se han generado correctamente.")
-    
-    manual = st.session_state.ficha['manual_data']
-    auto = st.session_state.ficha['auto_data']
-    
-    # Función helper para mostrar ficha
-    def mostrar_ficha(titulo, fields_manual, fields_auto):
-        st.markdown(f"#### {titulo}")
-        data = {}
-        # Combinar manual y auto
-        for f in fields_manual:
-            data[f["label"]] = manual.get(f["key"], "-")
-        for f in fields_auto:
-            data[f["label"]] = auto.get(f["key"], "-")
-            
-        df = pd.DataFrame(list(data.items()), columns=["Campo", "Valor"])
-        st.table(df)
-    
-    tab_traz, tab_geom, tab_def, tab_dim = st.tabs(["Trazabilidad", "Geometría", "Defectología", "Dimensionalidad"])
-    
-    with tab_traz:
-        mostrar_ficha("Ficha de Trazabilidad", fc.TRAZABILIDAD_FIELDS["manual"], fc.TRAZABILIDAD_FIELDS["automatic"])
-        
-    with tab_geom:
-        mostrar_ficha("Ficha de Geometría de Cordón", fc.GEOMETRIA_FIELDS["manual"], fc.GEOMETRIA_FIELDS["automatic"])
-        
-    with tab_def:
-        mostrar_ficha("Ficha de Defectología", fc.DEFECTOLOGIA_FIELDS["manual"], fc.DEFECTOLOGIA_FIELDS["automatic"])
-        
-    with tab_dim:
-        mostrar_ficha("Ficha de Dimensionalidad", fc.DIMENSIONALIDAD_FIELDS["manual"], fc.DIMENSIONALIDAD_FIELDS["automatic"])
-
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("🔄 Nueva Inspección"):
-            reset_ficha()
-            st.rerun()
-    with col2:
-        st.download_button("📥 Descargar Reporte (CSV)", data="Simulacion de descarga CSV", file_name="reporte.csv")
+
+    report()
+
+# Tiempo de la ejecución completa del script (las que terminan en st.rerun() se miden como "rerun")
+page_s = time.perf_counter() - page_t0
+get_metrics().observe("ui", f"paso_{current_step}", page_s)
+record_rerun(f"paso_{current_step}", page_s)
+st.session_state._full_run = False
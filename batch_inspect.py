@@ -0,0 +1,302 @@
+"""
+Inspección por lotes (fuera de línea) de fotos de cordón y de superficie.
+
+Evolución de debug_inference.py para re-inspeccionar miles de imágenes al
+final del turno:
+
+    python batch_inspect.py --weld fotos/cordones --surface fotos/chapas \\
+        -o resultados.jsonl --resume
+
+Las imágenes se decodifican en procesos auxiliares, se agrupan en lotes para
+`model.predict` y cada resultado se escribe como una línea JSON apenas está
+listo. Con --resume se omiten las imágenes ya presentes en el archivo de
+salida, de modo que una corrida interrumpida continúa donde quedó. Con
+--weld y --surface a la vez, ambos modelos corren en paralelo en sus carriles
+del planificador y se reparten los procesos de decodificación.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from defect_map import DefectMap
+from detections import Detections
+from tiled_inference import TILING_MODES, model_imgsz, needs_tiling, predict_tiled
+from inference_backend import BACKENDS, DEFAULT_BACKEND
+from inference_scheduler import get_scheduler
+from model_registry import get_registry
+from analytics_store import ANALYTICS_PATH, AnalyticsStore
+from ficha_store import DEFAULT_DB_PATH, FichaStore
+from weld_analysis import (build_auto_data, count_defects, measure_geometry, serialize_detections,
+                           surface_condition)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def iter_image_paths(sources):
+    """Expande directorios (recursivo), listas .txt y archivos sueltos."""
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif source.lower().endswith('.txt'):
+            with open(source, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        yield line
+        else:
+            yield source
+
+
+def load_checkpoint(output_path):
+    """Pares (tarea, ruta) ya procesados con éxito en el JSONL de salida.
+
+    Los registros con 'error' (p. ej. una imagen que no se pudo decodificar)
+    no cuentan: --resume los vuelve a intentar.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Última línea truncada por una interrupción: se re-procesa
+                continue
+            if 'error' not in record:
+                done.add((record.get('task'), record.get('path')))
+    return done
+
+
+def truncate_partial_line(output_path):
+    """Elimina una última línea incompleta para poder seguir anexando."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+
+
+def decode_image(path):
+    """Se ejecuta en el proceso auxiliar. Devuelve (ruta, array BGR | None, error)."""
+    import cv2
+    try:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            return path, None, "no se pudo decodificar"
+        return path, img, None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def decode_stream(paths, workers, max_inflight):
+    """Decodifica en paralelo preservando el orden y acotando la memoria."""
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(decode_image, path))
+            if len(pending) >= max_inflight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def path_id(path):
+    """id_cordon estable derivado de la ruta (para re-inspecciones idempotentes).
+
+    Digest completo de 128 bits: con uno corto, dos rutas distintas podrían
+    compartir código y una ficha reemplazaría a la otra.
+    """
+    return hashlib.blake2b(os.path.abspath(path).encode('utf-8'), digest_size=16).hexdigest().upper()
+
+
+def build_record(task, path, det, image, model_path, distancia_camara=None):
+    h, w = image.shape[:2]
+    defect_counts = count_defects(det)
+    record = {
+        'task': task,
+        'path': path,
+        'model': model_path,
+        'width': w,
+        'height': h,
+        'detections': serialize_detections(det),
+        'defect_counts': defect_counts,
+    }
+    if task == 'weld':
+        geometry = measure_geometry(image, det, distancia_camara, channels="BGR")
+        defect_map = DefectMap.from_detections(det, geometry)
+        record['defect_map'] = defect_map.as_dict()
+        record.update(build_auto_data(det, path_id(path), geometry, defect_map))
+    else:
+        record['condicion_superficial'] = surface_condition(det)
+    return record
+
+
+def record_to_ficha(record):
+    """Ficha almacenable a partir de un registro 'weld' del lote."""
+    skip = ('task', 'path', 'model', 'width', 'height', 'detections', 'defect_counts', 'defect_map')
+    return {
+        'id_cordon': record['id_cordon'],
+        'origen': os.path.abspath(record['path']),
+        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M"),
+        'manual_data': {'imagen': record['path']},
+        'auto_data': {k: v for k, v in record.items() if k not in skip},
+    }
+
+
+class LockedWriter:
+    """Archivo de salida compartido por varios carriles (una línea completa por escritura)."""
+
+    def __init__(self, f):
+        self._f = f
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._f.write(text)
+
+    def flush(self):
+        with self._lock:
+            self._f.flush()
+
+
+def run_batch(task, model_path, paths, out, conf, batch_size, workers, backend=DEFAULT_BACKEND,
+              distancia_camara=None, tiling="off", store=None, analytics=None):
+    """Procesa `paths` con un modelo y escribe cada resultado en `out`.
+
+    Con `store` (FichaStore) las fichas de cordón se insertan por lote, y con
+    `analytics` (AnalyticsStore) se anexan también al almacén analítico.
+    """
+    entry = get_registry().get(model_path, backend)
+    model = entry.model
+    print(f"[{task}] modelo {model_path} ({entry.backend})", file=sys.stderr)
+    processed = failed = 0
+    t0 = time.perf_counter()
+
+    imgsz = model_imgsz(model)
+
+    def flush(batch):
+        nonlocal processed, failed
+        # Imágenes grandes por mosaicos (una a una); el resto en un solo predict
+        tiled = [needs_tiling(img.shape, imgsz, tiling) for _, img in batch]
+        plain = [img for (_, img), t in zip(batch, tiled) if not t]
+        results = iter(model.predict(plain, conf=conf, verbose=False) if plain else [])
+        records, fichas = [], []
+        for (path, img), use_tiles in zip(batch, tiled):
+            if use_tiles:
+                det = predict_tiled(model, img, conf, imgsz)
+            else:
+                det = Detections.from_result(next(results), model.names)
+            record = build_record(task, path, det, img, model_path, distancia_camara)
+            records.append(record)
+            if (store is not None or analytics is not None) and task == 'weld':
+                fichas.append((record_to_ficha(record), det))
+        # El JSONL es el checkpoint de --resume: se escribe solo después de guardar
+        # las fichas; si falla el guardado el lote queda con 'error' y se reintenta
+        try:
+            if fichas and store is not None:
+                store.save_many(fichas)
+            if fichas and analytics is not None:
+                analytics.append_many(fichas)
+        except Exception as e:
+            print(f"[{task}] no se pudieron guardar {len(fichas)} fichas: {e}", file=sys.stderr)
+            records = [{'task': task, 'path': r['path'], 'error': f"ficha no guardada: {e}"} for r in records]
+            failed += len(records)
+        else:
+            processed += len(records)
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+
+    batch = []
+    for path, img, error in decode_stream(paths, workers, max_inflight=batch_size * 2):
+        if error is not None:
+            out.write(json.dumps({'task': task, 'path': path, 'error': error},
+                                 ensure_ascii=False) + '\n')
+            failed += 1
+            continue
+        batch.append((path, img))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    elapsed = time.perf_counter() - t0
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"[{task}] {processed} imágenes en {elapsed:.1f}s ({rate:.1f} img/s), "
+          f"{failed} con error", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspección por lotes con los modelos de soldadura y superficie.")
+    parser.add_argument('--weld', nargs='+', default=[], help="Directorios, imágenes o listas .txt de cordones")
+    parser.add_argument('--surface', nargs='+', default=[], help="Directorios, imágenes o listas .txt de superficies")
+    parser.add_argument('--model', default="models/welding_model.pt", help="Modelo de soldadura")
+    parser.add_argument('--surface-model', default="models/surface_model.pt", help="Modelo de superficie")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help="Backend de inferencia")
+    parser.add_argument('--tiling', choices=TILING_MODES, default="off",
+                        help="Inferencia por mosaicos para fotos de alta resolución")
+    parser.add_argument('--distancia-camara', type=float, default=None,
+                        help="Distancia cámara-pieza (mm) para medir la geometría en mm")
+    parser.add_argument('-o', '--output', default="batch_results.jsonl", help="Archivo JSONL de salida")
+    parser.add_argument('--conf', type=float, default=0.25, help="Umbral de confianza")
+    parser.add_argument('--batch', type=int, default=16, help="Imágenes por llamada a predict")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Procesos de decodificación")
+    parser.add_argument('--db', nargs='?', const=DEFAULT_DB_PATH, default=None,
+                        help=f"Guardar las fichas de cordón en SQLite (por defecto {DEFAULT_DB_PATH})")
+    parser.add_argument('--analytics', nargs='?', const=ANALYTICS_PATH, default=None,
+                        help=f"Anexar las fichas de cordón al almacén analítico (por defecto {ANALYTICS_PATH})")
+    parser.add_argument('--resume', action='store_true', help="Continuar desde el JSONL existente")
+    args = parser.parse_args(argv)
+
+    if not args.weld and not args.surface:
+        parser.error("indique al menos --weld o --surface")
+
+    store = FichaStore(args.db) if args.db else None
+    analytics = AnalyticsStore(args.analytics) if args.analytics else None
+    done = set()
+    if args.resume:
+        truncate_partial_line(args.output)
+        done = load_checkpoint(args.output)
+    mode = 'a' if args.resume else 'w'
+    pending = {}
+    for task, sources, model_path in [('surface', args.surface, args.surface_model),
+                                      ('weld', args.weld, args.model)]:
+        if not sources:
+            continue
+        paths = [p for p in iter_image_paths(sources) if (task, p) not in done]
+        skipped = sum(1 for key in done if key[0] == task)
+        if skipped:
+            print(f"[{task}] reanudando: {skipped} imágenes ya procesadas", file=sys.stderr)
+        if paths:
+            pending[task] = (model_path, paths)
+
+    # Cada tarea en el carril de su modelo; con ambas, los procesos de
+    # decodificación y los hilos de CPU se reparten entre las dos
+    workers = max(1, args.workers // len(pending)) if pending else args.workers
+    with open(args.output, mode, encoding='utf-8') as f:
+        out = LockedWriter(f)
+        jobs = {task: (run_batch, (task, model_path, paths, out, args.conf, args.batch, workers,
+                                   args.backend, args.distancia_camara, args.tiling, store, analytics), {})
+                for task, (model_path, paths) in pending.items()}
+        get_scheduler().run(jobs).result()
+
+
+if __name__ == "__main__":
+    main()
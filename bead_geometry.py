@@ -0,0 +1,196 @@
+"""
+Medición de la geometría del cordón a partir de la foto (vista superior).
+
+Se segmenta el cordón por textura local, se alinea su eje principal con el
+eje horizontal y se obtiene, columna a columna y con operaciones de arrays,
+el perfil de bordes superior/inferior. De ese perfil salen el ancho medio,
+la uniformidad, la rectitud, la simetría y la rugosidad aparente de bordes.
+
+La conversión px -> mm usa la distancia cámara-pieza ingresada en la ficha
+y el campo de visión horizontal de la cámara (modelo pinhole). La altura del
+refuerzo y los ángulos de mojado no son observables en una vista superior
+2D y se reportan como no disponibles.
+"""
+import math
+import os
+
+import cv2
+import numpy as np
+
+# Lado mayor de la imagen de trabajo; una foto 4K se reduce antes de medir
+WORK_SIZE = 1024
+# Campo de visión horizontal de la cámara de inspección (grados)
+CAMERA_HFOV_DEG = float(os.getenv("CAMERA_HFOV_DEG", "60"))
+# Fracción descartada en cada extremo del cordón (inicio/fin de pasada)
+END_TRIM = 0.05
+
+
+def mm_per_pixel(distancia_camara_mm, image_width_px, hfov_deg=CAMERA_HFOV_DEG):
+    """Escala en el plano de la pieza; None si no hay distancia válida."""
+    try:
+        distancia = float(distancia_camara_mm)
+    except (TypeError, ValueError):
+        return None
+    if distancia <= 0 or image_width_px <= 0:
+        return None
+    return 2 * distancia * math.tan(math.radians(hfov_deg) / 2) / image_width_px
+
+
+def segment_bead(gray, roi=None):
+    """Máscara booleana del cordón (componente texturada más grande)."""
+    h, w = gray.shape
+    k = max(5, (min(h, w) // 64) | 1)
+    f = gray.astype(np.float32)
+    # Desviación estándar local: el cordón (ondulaciones) es más texturado que el metal base
+    mean = cv2.blur(f, (k, k))
+    sq_mean = cv2.blur(f * f, (k, k))
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+    std8 = cv2.normalize(std, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    _, mask = cv2.threshold(std8, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    if roi is not None:
+        x1, y1, x2, y2 = [int(round(v)) for v in roi]
+        limit = np.zeros_like(mask)
+        limit[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] = 255
+        mask &= limit
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * k + 1, 2 * k + 1))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if n <= 1:
+        return None
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    return labels == largest
+
+
+def _smooth(x, window):
+    window = max(3, int(window) | 1)
+    if len(x) < window:
+        return x.astype(np.float64)
+    pad = window // 2
+    padded = np.pad(x.astype(np.float64), pad, mode='edge')
+    return np.convolve(padded, np.ones(window) / window, mode='valid')
+
+
+class BeadGeometry:
+    """Resultado de la medición. Longitudes en mm si hay escala, si no en px."""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    @property
+    def units(self):
+        return "mm" if self.mm_per_px is not None else "px"
+
+    def axis_coords(self, xy):
+        """(posición a lo largo del eje, desplazamiento lateral) en `units` de puntos xy de la imagen original."""
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2) * self.work_scale
+        d = xy - self.center
+        u = d[:, 0] * self.axis[0] + d[:, 1] * self.axis[1]
+        v = d[:, 1] * self.axis[0] - d[:, 0] * self.axis[1]
+        return (u - self.axis_start) * self.unit_per_work_px, v * self.unit_per_work_px
+
+    def axis_position(self, xy):
+        """Posición a lo largo del eje del cordón (en `units`) de puntos xy de la imagen original."""
+        return self.axis_coords(xy)[0]
+
+    def as_dict(self):
+        return {k: v for k, v in self.__dict__.items()
+                if not isinstance(v, np.ndarray)}
+
+
+def measure_bead(image, distancia_camara_mm=None, roi=None, source_scale=1.0, channels="RGB"):
+    """Mide el cordón en `image` (array HxWx3 o HxW). Devuelve BeadGeometry o None.
+
+    `channels` es el orden de color de `image`: "RGB" (PIL, la app) o "BGR"
+    (cv2.imread/imdecode en las herramientas por lotes y el servicio).
+
+    `roi` (xyxy en px de la imagen original) restringe la segmentación, p. ej.
+    a la caja 'Good Welding'/'Bad Welding' detectada por el modelo.
+    `source_scale` < 1 indica que `image` ya es una versión reducida de la
+    original (p. ej. decodificada en modo draft); las medidas siguen
+    refiriéndose a la imagen original.
+    """
+    image = np.asarray(image)
+    h, w = image.shape[:2]
+    orig_w = w / source_scale
+    resize_scale = min(1.0, WORK_SIZE / max(h, w))
+    if resize_scale < 1.0:
+        image = cv2.resize(image, (round(w * resize_scale), round(h * resize_scale)),
+                           interpolation=cv2.INTER_AREA)
+    work_scale = resize_scale * source_scale
+    gray = image if image.ndim == 2 else cv2.cvtColor(
+        image, cv2.COLOR_BGR2GRAY if channels == "BGR" else cv2.COLOR_RGB2GRAY)
+    if roi is not None:
+        roi = np.asarray(roi, dtype=np.float64) * work_scale
+
+    mask = segment_bead(gray, roi)
+    if mask is None:
+        return None
+
+    # Eje principal por momentos de segundo orden
+    m = cv2.moments(mask.view(np.uint8), binaryImage=True)
+    if m['m00'] == 0:
+        return None
+    cx, cy = m['m10'] / m['m00'], m['m01'] / m['m00']
+    theta = 0.5 * math.atan2(2 * m['mu11'], m['mu20'] - m['mu02'])
+
+    # Rotar para dejar el eje horizontal en un lienzo que contenga toda la imagen
+    h, w = mask.shape
+    diag = int(math.ceil(math.hypot(h, w)))
+    rot = cv2.getRotationMatrix2D((cx, cy), math.degrees(theta), 1.0)
+    rot[0, 2] += diag / 2 - cx
+    rot[1, 2] += diag / 2 - cy
+    aligned = cv2.warpAffine(mask.view(np.uint8), rot, (diag, diag), flags=cv2.INTER_NEAREST) > 0
+
+    # Perfil por columna, sin bucles: primer y último píxel del cordón
+    cols = np.flatnonzero(aligned.any(axis=0))
+    if len(cols) < 10:
+        return None
+    trim = int(len(cols) * END_TRIM)
+    cols = cols[trim:len(cols) - trim] if len(cols) - 2 * trim >= 10 else cols
+    sub = aligned[:, cols]
+    top = sub.argmax(axis=0).astype(np.float64)
+    bottom = (diag - 1 - sub[::-1].argmax(axis=0)).astype(np.float64)
+    widths = bottom - top + 1
+
+    scale_orig = mm_per_pixel(distancia_camara_mm, orig_w)
+    # Unidad por píxel de la imagen de trabajo
+    unit = scale_orig / work_scale if scale_orig is not None else 1.0 / work_scale
+
+    x = cols.astype(np.float64)
+    center = (top + bottom) / 2
+    slope, intercept = np.polyfit(x, center, 1)
+    axis_line = slope * x + intercept
+    upper = axis_line - top
+    lower = bottom - axis_line
+
+    mean_w = widths.mean()
+    window = max(3, mean_w)
+    edge_dev = (np.abs(top - _smooth(top, window)) + np.abs(bottom - _smooth(bottom, window))) / 2
+    sym = 100 * (1 - np.abs(upper - lower).mean() / max((upper + lower).mean(), 1e-6))
+
+    # Dirección del eje en la imagen de trabajo y origen (inicio del tramo medido)
+    axis = np.array([math.cos(theta), math.sin(theta)])
+
+    return BeadGeometry(
+        mm_per_px=scale_orig,
+        work_scale=work_scale,
+        unit_per_work_px=unit,
+        center=np.array([cx, cy]),
+        axis=axis,
+        axis_start=float(cols[0] - diag / 2),
+        angle_deg=math.degrees(theta),
+        ancho=float(mean_w * unit),
+        ancho_std=float(widths.std() * unit),
+        uniformidad_pct=float(widths.std() / mean_w * 100) if mean_w > 0 else 0.0,
+        rectitud=float(np.abs(center - axis_line).max() * unit),
+        simetria_pct=float(np.clip(sym, 0, 100)),
+        rugosidad=float(edge_dev.mean() * unit),
+        longitud=float((cols[-1] - cols[0]) * unit),
+        cobertura_pct=float(mask.mean() * 100),
+        positions=(x - cols[0]) * unit,
+        widths=widths * unit,
+    )
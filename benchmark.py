@@ -0,0 +1,239 @@
+"""
+Benchmark de inferencia: backends, tamaños de lote, tamaños de imagen e hilos.
+
+    python benchmark.py --backends pytorch onnx --batch 1 4 --imgsz 640 1280 \\
+        --threads 2 4 -o bench.json
+    python benchmark.py ... -o bench.json --baseline bench_base.json   # detecta regresiones
+    python benchmark.py --compare bench.json --baseline bench_base.json
+
+Cada configuración se mide en un proceso nuevo: el pico de memoria (RSS)
+es el de esa configuración y los hilos se fijan antes de importar torch /
+ONNX Runtime. Las primeras iteraciones (warm-up) no se cuentan. Se reporta
+latencia p50/p95/p99 por lote y por imagen, imágenes/s y pico de RSS.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+
+import numpy as np
+
+DEFAULT_MODELS = ["weld=models/welding_model.pt", "surface=models/surface_model.pt"]
+DEFAULT_IMAGES = ["debug_image.png", "docs/images"]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# Métricas comparadas con la línea base: (clave, True si más alto es mejor)
+COMPARED_METRICS = [
+    ("latency_p50_ms", False), ("latency_p95_ms", False), ("latency_p99_ms", False),
+    ("images_per_s", True), ("peak_rss_mb", False),
+]
+
+
+def collect_images(paths, limit):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted(f for f in glob(os.path.join(p, "**", "*"), recursive=True)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.exists(p):
+            files.append(p)
+    return files[:limit]
+
+
+def synthetic_images(n, width, height, seed=0):
+    """Imágenes sintéticas reproducibles (ruido suavizado, BGR)."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    return [cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (7, 7), 0)
+            for _ in range(n)]
+
+
+def _peak_rss_mb():
+    import resource
+    # ru_maxrss: KB en Linux, bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def config_key(cfg):
+    return f"{cfg['model']}|{cfg['backend']}|b{cfg['batch']}|s{cfg['imgsz']}|t{cfg['threads']}"
+
+
+def run_config(cfg):
+    """Mide una configuración (en un proceso hijo recién creado)."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(cfg["threads"])
+    import cv2
+    import torch
+    from inference_backend import load_model
+    from model_registry import process_rss_mb
+
+    torch.set_num_threads(cfg["threads"])
+    cv2.setNumThreads(cfg["threads"])
+    if cfg["images"]:
+        images = [img for img in (cv2.imread(f) for f in cfg["images"]) if img is not None]
+    else:
+        images = synthetic_images(cfg["synthetic"], *cfg["synthetic_size"])
+
+    t0 = time.perf_counter()
+    model, backend = load_model(cfg["path"], cfg["backend"], intra_op_threads=cfg["threads"])
+    load_s = time.perf_counter() - t0
+    rss_loaded = process_rss_mb()
+
+    cycle = itertools.cycle(images)
+    batches = [[next(cycle) for _ in range(cfg["batch"])] for _ in range(cfg["warmup"] + cfg["iters"])]
+    for batch in batches[:cfg["warmup"]]:
+        model.predict(batch, imgsz=cfg["imgsz"], conf=cfg["conf"], verbose=False)
+
+    times = []
+    start = time.perf_counter()
+    for batch in batches[cfg["warmup"]:]:
+        t0 = time.perf_counter()
+        model.predict(batch, imgsz=cfg["imgsz"], conf=cfg["conf"], verbose=False)
+        times.append((time.perf_counter() - t0) * 1000)
+    total_s = time.perf_counter() - start
+
+    times = np.array(times)
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {
+        "key": config_key(cfg),
+        "model": cfg["model"], "backend_requested": cfg["backend"], "backend": backend,
+        "batch": cfg["batch"], "imgsz": cfg["imgsz"], "threads": cfg["threads"],
+        "iters": cfg["iters"], "warmup": cfg["warmup"],
+        "latency_p50_ms": round(float(p50), 2),
+        "latency_p95_ms": round(float(p95), 2),
+        "latency_p99_ms": round(float(p99), 2),
+        "latency_mean_ms": round(float(times.mean()), 2),
+        "per_image_p50_ms": round(float(p50) / cfg["batch"], 2),
+        "images_per_s": round(cfg["batch"] * cfg["iters"] / total_s, 2),
+        "load_s": round(load_s, 2),
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def run_isolated(cfg):
+    # Un proceso por configuración: pico de RSS e hilos independientes
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(run_config, cfg).result()
+
+
+def environment_info():
+    info = {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpu_count": os.cpu_count()}
+    for module in ("torch", "ultralytics", "onnxruntime", "numpy", "cv2"):
+        try:
+            info[module] = __import__(module).__version__
+        except Exception:
+            pass
+    return info
+
+
+def compare(current, baseline, tolerance=0.10, rss_tolerance=0.15):
+    """Regresiones de `current` respecto de `baseline` (listas de resultados)."""
+    base = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        ref = base.get(result["key"])
+        if ref is None or ref.get("backend") != result.get("backend"):
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            new, old = result.get(metric), ref.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            tol = rss_tolerance if metric == "peak_rss_mb" else tolerance
+            if (-change if higher_is_better else change) > tol:
+                regressions.append({"key": result["key"], "metric": metric, "baseline": old,
+                                    "current": new, "change_pct": round(change * 100, 1)})
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'configuración':<42} {'backend':<8} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'img/s':>8} {'RSS MB':>8}")
+    for r in results:
+        print(f"{r['key']:<42} {r['backend']:<8} {r['latency_p50_ms']:>8.1f} {r['latency_p95_ms']:>8.1f} "
+              f"{r['latency_p99_ms']:>8.1f} {r['images_per_s']:>8.1f} {r['peak_rss_mb']:>8.0f}")
+
+
+def print_regressions(regressions):
+    if not regressions:
+        print("\nSin regresiones respecto de la línea base.")
+        return
+    print(f"\n{len(regressions)} regresiones:")
+    for r in regressions:
+        print(f"  REGRESIÓN {r['key']} {r['metric']}: {r['baseline']} -> {r['current']} "
+              f"({r['change_pct']:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia (latencia, throughput, memoria).")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS, help="nombre=ruta.pt")
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx"])
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[640])
+    parser.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1])
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES, help="Archivos o carpetas de imágenes")
+    parser.add_argument("--max-images", type=int, default=16)
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Usar N imágenes sintéticas en lugar de archivos")
+    parser.add_argument("--synthetic-size", default="1920x1080")
+    parser.add_argument("--iters", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("-o", "--output", default="bench.json")
+    parser.add_argument("--baseline", default=None, help="JSON de referencia para detectar regresiones")
+    parser.add_argument("--compare", default=None, help="Comparar este JSON con --baseline sin medir")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento tolerado (latencia, img/s)")
+    parser.add_argument("--rss-tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare) as f:
+            report = json.load(f)
+    else:
+        images = [] if args.synthetic else collect_images(args.images, args.max_images)
+        if not images and not args.synthetic:
+            print("No se encontraron imágenes; usando 8 sintéticas.", file=sys.stderr)
+            args.synthetic = 8
+        size = tuple(int(v) for v in args.synthetic_size.lower().split("x"))
+        models = dict(m.split("=", 1) if "=" in m else (os.path.basename(m), m) for m in args.models)
+        results = []
+        for (name, path), backend, batch, imgsz, threads in itertools.product(
+                models.items(), args.backends, args.batch, args.imgsz, args.threads):
+            if not os.path.exists(path):
+                print(f"Omitiendo {name}: no existe {path}", file=sys.stderr)
+                continue
+            cfg = {"model": name, "path": path, "backend": backend, "batch": batch, "imgsz": imgsz,
+                   "threads": threads, "images": images, "synthetic": args.synthetic,
+                   "synthetic_size": size, "iters": args.iters, "warmup": args.warmup, "conf": args.conf}
+            print(f"Midiendo {config_key(cfg)}...", file=sys.stderr)
+            try:
+                results.append(run_isolated(cfg))
+            except Exception as e:
+                print(f"  Error: {e}", file=sys.stderr)
+        report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment_info(),
+                  "images": images or f"{args.synthetic} sintéticas {args.synthetic_size}",
+                  "results": results}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados en {args.output}", file=sys.stderr)
+
+    print_results(report["results"])
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.rss_tolerance)
+        print_regressions(regressions)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
-from ultralytics import YOLO
 from PIL import Image
 import numpy as np
+from inference_backend import DEFAULT_BACKEND, load_model
+from detections import Detections
+from weld_analysis import count_defects, defect_fields
 
-def debug_inference():
-    # Load model
+def debug_inference(backend=DEFAULT_BACKEND):
+    # Load model (backend: auto | pytorch | onnx, env INFERENCE_BACKEND)
     model_path = "models/welding_model.pt"
     try:
-        model = YOLO(model_path)
-        print(f"Model loaded: {model_path}")
+        model, backend = load_model(model_path, backend)
+        print(f"Model loaded: {model_path} ({backend})")
         print(f"Model classes: {model.names}")
     except Exception as e:
         print(f"Error loading model: {e}")
@@ -27,18 +29,16 @@ def debug_inference():
     print("\n--- Running Inference (conf=0.1) ---")
     results = model.predict(image, conf=0.1)
     
-    # Print results
-    for r in results:
-        boxes = r.boxes
-        if len(boxes) == 0:
-            print("No detections found.")
-        else:
-            print(f"Found {len(boxes)} detections:")
-            for box in boxes:
-                cls_id = int(box.cls[0])
-                cls_name = model.names[cls_id]
-                conf = float(box.conf[0])
-                print(f"- Class: {cls_name} (ID: {cls_id}), Confidence: {conf:.4f}")
+    # Print results (arrays NumPy: una sola transferencia desde el tensor)
+    det = Detections.from_result(results[0], model.names)
+    if len(det) == 0:
+        print("No detections found.")
+    else:
+        print(f"Found {len(det)} detections:")
+        for cls_id, cls_name, conf in zip(det.cls, det.class_names(), det.conf):
+            print(f"- Class: {cls_name} (ID: {cls_id}), Confidence: {conf:.4f}")
+        print(f"Counts: {count_defects(det)}")
+        print(f"Ficha fields: {defect_fields(det)}")
 
 if __name__ == "__main__":
     debug_inference()
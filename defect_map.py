@@ -0,0 +1,228 @@
+"""
+Mapa espacial de defectos a lo largo del cordón.
+
+Cada detección se proyecta sobre el eje del cordón medido por bead_geometry
+(mm si hay distancia cámara-pieza, si no px): queda un intervalo
+[inicio, fin] a lo largo del eje y un desplazamiento lateral respecto a la
+línea central. Los intervalos se guardan ordenados en un IntervalIndex, de
+modo que "defectos a menos de 25 mm de este punto" o "todos los pares a menos
+de 25 mm" son búsquedas binarias sobre arrays, sin comparar cada caja con
+todas las demás.
+
+Sobre ese índice se agrupa (enlace simple a lo largo del eje, vectorizado):
+
+* porosidad lineal: poros casi consecutivos (separación <= LINEAR_GAP_FACTOR
+  diámetros) y alineados (dispersión lateral <= un diámetro), al menos
+  LINEAR_MIN_PORES; ya no depende de que el modelo emita 'Linear Porosity';
+* secciones críticas: tramos de longitud CRITICAL_WINDOW_MM (o
+  CRITICAL_WINDOW_WIDTHS anchos de cordón si no hay escala) con al menos
+  CRITICAL_MIN_DEFECTS defectos, fusionados si se solapan.
+
+    dm = DefectMap.from_detections(det, geometry)
+    dm.index.near(120.0, 25.0)           # defectos a <= 25 mm de x = 120 mm
+    dm.linear_porosity(), dm.critical_sections()
+"""
+import numpy as np
+
+from postprocess import DEFECT_FIELDS, get_class_index
+
+# Clases que enmarcan el cordón completo (no son defectos localizados)
+BEAD_CLASSES = ('Good Welding', 'Bad Welding')
+LINEAR_MIN_PORES = 4
+LINEAR_GAP_FACTOR = 3.0
+CRITICAL_MIN_DEFECTS = 3
+CRITICAL_WINDOW_MM = 25.0
+CRITICAL_WINDOW_WIDTHS = 3.0
+
+
+def _run_labels(starts, ends, gap):
+    """Etiquetas de grupo por enlace simple de intervalos ordenados por inicio."""
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    reach = np.maximum.accumulate(ends)
+    breaks = starts[1:] > reach[:-1] + gap
+    return np.concatenate(([0], np.cumsum(breaks)))
+
+
+class IntervalIndex:
+    """Intervalos [start, end] ordenados por inicio, con el máximo acumulado de los finales.
+
+    Como el máximo acumulado es monótono, los candidatos que solapan con
+    [lo, hi] forman un tramo contiguo que se acota con dos búsquedas binarias.
+    """
+
+    def __init__(self, starts, ends):
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        self.order = np.argsort(starts, kind="stable")
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        self.reach = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlap(self, lo, hi):
+        """Índices (en el orden original) de los intervalos que tocan [lo, hi]."""
+        first = np.searchsorted(self.reach, lo, side="left")
+        last = np.searchsorted(self.starts, hi, side="right")
+        candidates = np.arange(first, max(first, last))
+        return self.order[candidates[self.ends[candidates] >= lo]]
+
+    def near(self, position, radius):
+        """Índices de los intervalos a distancia <= radius de `position`."""
+        return self.overlap(position - radius, position + radius)
+
+    def pairs_within(self, distance):
+        """Array (k, 2) de pares (i, j), i < j en el orden original, separados <= distance."""
+        n = len(self)
+        if n < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        # Para i (ordenado por inicio), los j > i cercanos son los que empiezan antes de end_i + distance
+        upper = np.searchsorted(self.starts, self.ends + distance, side="right")
+        counts = np.maximum(upper - np.arange(1, n + 1), 0)
+        left = np.repeat(np.arange(n), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        right = left + 1 + offsets
+        pairs = np.stack([self.order[left], self.order[right]], axis=1)
+        return np.sort(pairs, axis=1)
+
+
+class DefectMap:
+    """Defectos localizados sobre el eje del cordón (posiciones en `units`)."""
+
+    def __init__(self, starts, ends, lateral, sizes, cls, conf, names, units="px", bead_width=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.centers = (self.starts + self.ends) / 2
+        self.lateral = np.asarray(lateral, dtype=np.float64)
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self.cls = np.asarray(cls, dtype=np.int64)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self.names = names
+        self.units = units
+        self.bead_width = bead_width
+        self.fields = get_class_index(names).field_lut[self.cls] if len(self.cls) else self.cls
+        self.index = IntervalIndex(self.starts, self.ends)
+
+    @classmethod
+    def from_detections(cls, det, geometry=None):
+        """Proyecta las cajas de `det` (px de la imagen original) sobre el eje del cordón.
+
+        Sin geometría medida, el eje es el lado mayor de la caja envolvente
+        del cordón (o de las detecciones) y las posiciones quedan en px.
+        """
+        bead = np.isin(det.cls, [c for c, name in det.names.items() if name in BEAD_CLASSES])
+        boxes, classes, conf = det.xyxy[~bead], det.cls[~bead], det.conf[~bead]
+        if geometry is not None:
+            # Las cuatro esquinas de cada caja: el intervalo es su sombra sobre el eje
+            corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)
+            u, v = geometry.axis_coords(corners)
+            u, v = u.reshape(-1, 4), v.reshape(-1, 4)
+            starts, ends = u.min(axis=1), u.max(axis=1)
+            lateral = v.mean(axis=1)
+            sizes = np.minimum(ends - starts, v.max(axis=1) - v.min(axis=1))
+            return cls(starts, ends, lateral, sizes, classes, conf, det.names, geometry.units, geometry.ancho)
+        frame = det.xyxy[bead] if bead.any() else det.xyxy
+        if len(frame) == 0:
+            return cls([], [], [], [], classes, conf, det.names)
+        x0, y0 = frame[:, 0].min(), frame[:, 1].min()
+        x1, y1 = frame[:, 2].max(), frame[:, 3].max()
+        # Eje horizontal si el cordón es más ancho que alto, si no vertical
+        a, b, origin, center, width = ((0, 1, x0, (y0 + y1) / 2, y1 - y0) if x1 - x0 >= y1 - y0
+                                       else (1, 0, y0, (x0 + x1) / 2, x1 - x0))
+        starts, ends = boxes[:, a] - origin, boxes[:, a + 2] - origin
+        lateral = (boxes[:, b] + boxes[:, b + 2]) / 2 - center
+        sizes = np.minimum(ends - starts, boxes[:, b + 2] - boxes[:, b])
+        return cls(starts, ends, lateral, sizes, classes, conf, det.names, "px", float(width))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def linear_porosity(self):
+        """Alineaciones de poros: [{'inicio', 'fin', 'poros'}], ordenadas por posición.
+
+        Una detección 'Linear Porosity' del modelo cuenta por sí misma.
+        """
+        literal = self.fields == DEFECT_FIELDS.index('def_porosidad_lineal')
+        groups = [{'inicio': float(s), 'fin': float(e), 'poros': None}
+                  for s, e in zip(self.starts[literal], self.ends[literal])]
+        pores = np.flatnonzero(self.fields == DEFECT_FIELDS.index('def_poros'))
+        if len(pores) >= LINEAR_MIN_PORES:
+            order = pores[np.argsort(self.starts[pores], kind="stable")]
+            diameter = max(float(np.median(self.sizes[order])), 1e-6)
+            labels = _run_labels(self.starts[order], self.ends[order], LINEAR_GAP_FACTOR * diameter)
+            n = np.bincount(labels)
+            lateral = self.lateral[order]
+            mean = np.bincount(labels, lateral) / n
+            spread = np.sqrt(np.maximum(np.bincount(labels, lateral ** 2) / n - mean ** 2, 0))
+            inicio = np.full(len(n), np.inf)
+            fin = np.full(len(n), -np.inf)
+            np.minimum.at(inicio, labels, self.starts[order])
+            np.maximum.at(fin, labels, self.ends[order])
+            for k in np.flatnonzero((n >= LINEAR_MIN_PORES) & (spread <= diameter)):
+                groups.append({'inicio': float(inicio[k]), 'fin': float(fin[k]), 'poros': int(n[k])})
+        return sorted(groups, key=lambda g: g['inicio'])
+
+    def critical_window(self):
+        """Longitud del tramo usado para buscar concentraciones de defectos."""
+        if self.units == "mm":
+            return CRITICAL_WINDOW_MM
+        if self.bead_width:
+            return CRITICAL_WINDOW_WIDTHS * self.bead_width
+        return CRITICAL_WINDOW_WIDTHS * float(np.median(self.sizes)) if len(self) else 0.0
+
+    def critical_sections(self, window=None, min_defects=CRITICAL_MIN_DEFECTS):
+        """Tramos con al menos `min_defects` defectos en `window`: [{'inicio', 'fin', 'defectos'}]."""
+        if len(self) < min_defects:
+            return []
+        window = self.critical_window() if window is None else window
+        c = np.sort(self.centers)
+        # Defectos en [c_i, c_i + window] para cada i
+        upper = np.searchsorted(c, c + window, side="right")
+        dense = np.flatnonzero(upper - np.arange(len(c)) >= min_defects)
+        if len(dense) == 0:
+            return []
+        lo, hi = c[dense], c[upper[dense] - 1]
+        labels = _run_labels(lo, hi, 0.0)
+        first = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        zone_lo = lo[first]
+        zone_hi = np.maximum.reduceat(hi, first)
+        counts = np.searchsorted(c, zone_hi, side="right") - np.searchsorted(c, zone_lo, side="left")
+        return [{'inicio': float(a), 'fin': float(b), 'defectos': int(n)}
+                for a, b, n in zip(zone_lo, zone_hi, counts)]
+
+    def records(self):
+        """Lista JSON-serializable de defectos ordenados por posición."""
+        class_names = get_class_index(self.names).class_names
+        i = self.index.order
+        return [{'class': class_names[c], 'inicio': round(float(s), 2), 'fin': round(float(e), 2),
+                 'lateral': round(float(v), 2), 'conf': round(float(p), 4)}
+                for c, s, e, v, p in zip(self.cls[i], self.starts[i], self.ends[i], self.lateral[i], self.conf[i])]
+
+    def as_dict(self):
+        return {
+            'units': self.units,
+            'defectos': self.records(),
+            'porosidad_lineal': self.linear_porosity(),
+            'secciones_criticas': self.critical_sections(),
+        }
+
+    def _span(self, group):
+        return f"{group['inicio']:.0f}–{group['fin']:.0f} {self.units}"
+
+    def fields_text(self):
+        """Textos de 'def_porosidad_lineal' y 'secciones_criticas' para la ficha."""
+        linear = self.linear_porosity()
+        zones = self.critical_sections()
+        if linear:
+            porosidad = f"Detectada ({len(linear)}: {', '.join(self._span(g) for g in linear)})"
+        else:
+            porosidad = "No detectada"
+        if zones:
+            secciones = ", ".join(f"{self._span(z)} ({z['defectos']} defectos)" for z in zones)
+        elif len(self):
+            secciones = f"Ninguna ({len(self)} {'defecto aislado' if len(self) == 1 else 'defectos aislados'})"
+        else:
+            secciones = "Ninguna"
+        return {'def_porosidad_lineal': porosidad, 'secciones_criticas': secciones}
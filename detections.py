@@ -0,0 +1,77 @@
+"""
+Detecciones en formato compacto (arrays NumPy) independientes de ultralytics.
+
+Permiten re-filtrar por confianza y dibujar las cajas sin volver a ejecutar
+el modelo ni conservar el objeto `Results` completo.
+"""
+import cv2
+import numpy as np
+
+from postprocess import get_class_index
+
+# Paleta BGR/RGB simple para distinguir clases en la imagen anotada
+PALETTE = [
+    (255, 56, 56), (255, 157, 151), (255, 112, 31), (255, 178, 29),
+    (207, 210, 49), (72, 249, 10), (146, 204, 23), (61, 219, 134),
+    (26, 147, 52), (0, 212, 187), (44, 153, 168), (0, 194, 255),
+]
+
+
+class Detections:
+    """Cajas (xyxy), confianzas y clases de una imagen."""
+
+    __slots__ = ("xyxy", "conf", "cls", "names")
+
+    def __init__(self, xyxy, conf, cls, names):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+        self.names = dict(names)
+
+    @classmethod
+    def from_result(cls, result, names=None):
+        """Convierte un `ultralytics.engine.results.Results` en Detections."""
+        boxes = result.boxes
+        data = boxes.data.cpu().numpy() if len(boxes) else np.zeros((0, 6), np.float32)
+        return cls(data[:, :4], data[:, 4], data[:, 5], names or result.names)
+
+    @classmethod
+    def empty(cls, names):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0), names)
+
+    def __len__(self):
+        return len(self.conf)
+
+    @property
+    def nbytes(self):
+        return self.xyxy.nbytes + self.conf.nbytes + self.cls.nbytes
+
+    def filter(self, min_conf):
+        """Nuevo Detections con las cajas cuya confianza es >= min_conf."""
+        keep = self.conf >= min_conf
+        return Detections(self.xyxy[keep], self.conf[keep], self.cls[keep], self.names)
+
+    def scaled(self, factor):
+        """Cajas reescaladas (p. ej. para dibujar sobre una vista reducida)."""
+        return Detections(self.xyxy * factor, self.conf, self.cls, self.names)
+
+    def class_names(self):
+        return get_class_index(self.names).class_names[self.cls].tolist()
+
+    def plot(self, image, line_width=None):
+        """Dibuja las cajas sobre una copia de `image` (array HxWx3)."""
+        canvas = np.ascontiguousarray(np.array(image, dtype=np.uint8, copy=True))
+        h, w = canvas.shape[:2]
+        lw = line_width or max(round((h + w) / 2 * 0.003), 2)
+        font_scale = lw / 3
+        for (x1, y1, x2, y2), conf, c in zip(self.xyxy.astype(int), self.conf, self.cls):
+            color = PALETTE[int(c) % len(PALETTE)]
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), color, lw, cv2.LINE_AA)
+            label = f"{self.names[int(c)]} {conf:.2f}"
+            (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, max(lw - 1, 1))
+            top = y1 - th - 3 if y1 - th - 3 >= 0 else y1 + th + 3
+            cv2.rectangle(canvas, (x1, y1), (x1 + tw, top), color, -1, cv2.LINE_AA)
+            cv2.putText(canvas, label, (x1, y1 - 2 if top < y1 else top - 2),
+                        cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255),
+                        max(lw - 1, 1), cv2.LINE_AA)
+        return canvas
@@ -0,0 +1,56 @@
+"""
+Disposición de los formularios de la ficha, calculada una vez por proceso.
+
+app.py recorría `fichas_config` en cada interacción para decidir filas,
+columnas, tipo de widget y valores por defecto de cada campo. Aquí se
+resuelve todo de antemano (los módulos importados viven mientras vive el
+proceso): dibujar un formulario es un único recorrido sobre tuplas.
+"""
+from collections import namedtuple
+
+import fichas_config as fc
+
+Widget = namedtuple("Widget", "kind label key field options step")
+# Una sección: título, número de columnas y los widgets ya repartidos por columna
+Section = namedtuple("Section", "title columns")
+
+
+def _widget(field, key_prefix=""):
+    return Widget(field.get("type", "text"), field["label"], key_prefix + field["key"], field["key"],
+                  tuple(field.get("options", ())), field.get("step", 1.0))
+
+
+def _section(title, fields, ncols=1, key_prefix=""):
+    widgets = [_widget(f, key_prefix) for f in fields]
+    return Section(title, tuple(tuple(widgets[i::ncols]) for i in range(ncols)))
+
+
+# Paso 1: filas de secciones separadas por una línea; una fila con varias
+# secciones las pone lado a lado
+MANUAL_ROWS = (
+    (_section("Ficha de Trazabilidad", fc.TRAZABILIDAD_FIELDS["manual"], ncols=3),),
+    (_section("Geometría (Config)", fc.GEOMETRIA_FIELDS["manual"]),
+     _section("Dimensionalidad (Datos)", fc.DIMENSIONALIDAD_FIELDS["manual"])),
+    (_section("Defectología (Normativa)", fc.DEFECTOLOGIA_FIELDS["manual"]),),
+)
+MANUAL_WIDGETS = tuple(w for row in MANUAL_ROWS for section in row for col in section.columns for w in col)
+
+# Paso 3: campos automáticos editables (clave del widget "val_<campo>")
+VALIDATION_TABS = tuple(
+    (title, tuple(_widget(f, "val_") for f in group["automatic"]))
+    for title, group in (("Geometría", fc.GEOMETRIA_FIELDS), ("Defectología", fc.DEFECTOLOGIA_FIELDS),
+                         ("Dimensionalidad", fc.DIMENSIONALIDAD_FIELDS))
+)
+VALIDATION_WIDGETS = tuple(w for _, widgets in VALIDATION_TABS for w in widgets)
+
+# Paso 4: (pestaña, título, ((etiqueta, 'manual_data' | 'auto_data', clave), ...))
+REPORT_TABS = tuple(
+    (tab, title, tuple((f["label"], "manual_data", f["key"]) for f in group["manual"])
+     + tuple((f["label"], "auto_data", f["key"]) for f in group["automatic"]))
+    for tab, title, group in (
+        ("Trazabilidad", "Ficha de Trazabilidad", fc.TRAZABILIDAD_FIELDS),
+        ("Geometría", "Ficha de Geometría de Cordón", fc.GEOMETRIA_FIELDS),
+        ("Defectología", "Ficha de Defectología", fc.DEFECTOLOGIA_FIELDS),
+        ("Dimensionalidad", "Ficha de Dimensionalidad", fc.DIMENSIONALIDAD_FIELDS),
+    )
+)
@@ -0,0 +1,233 @@
+"""
+Almacenamiento persistente de fichas en SQLite (modo WAL).
+
+Cada ficha completada guarda sus datos manuales, automáticos y las
+detecciones crudas. Las columnas de filtrado habituales (soldador, WPS,
+proyecto/OT, fecha y veredicto) están desnormalizadas e indexadas, y la
+paginación es por cursor (keyset) sobre (fecha, id_cordon), de modo que las
+consultas del historial no dependen del tamaño de la tabla.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_DB_PATH = os.getenv("FICHAS_DB", "data/fichas.db")
+DEFAULT_PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fichas (
+    id_cordon    TEXT PRIMARY KEY,
+    fecha        TEXT NOT NULL,
+    soldador     TEXT,
+    wps          TEXT,
+    proyecto_ot  TEXT,
+    veredicto    TEXT,
+    aprobacion_auto TEXT,
+    manual_json  TEXT NOT NULL,
+    auto_json    TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    origen       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_fichas_fecha ON fichas (fecha DESC, id_cordon DESC);
+CREATE INDEX IF NOT EXISTS idx_fichas_soldador ON fichas (soldador, fecha DESC);
+CREATE INDEX IF NOT EXISTS idx_fichas_wps ON fichas (wps, fecha DESC);
+CREATE INDEX IF NOT EXISTS idx_fichas_proyecto ON fichas (proyecto_ot, fecha DESC);
+CREATE INDEX IF NOT EXISTS idx_fichas_veredicto ON fichas (veredicto, fecha DESC);
+
+CREATE TABLE IF NOT EXISTS detecciones (
+    id_cordon  TEXT NOT NULL REFERENCES fichas (id_cordon) ON DELETE CASCADE,
+    cls        INTEGER NOT NULL,
+    clase      TEXT NOT NULL,
+    conf       REAL NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL
+);
+CREATE INDEX IF NOT EXISTS idx_detecciones_cordon ON detecciones (id_cordon);
+"""
+
+FILTER_COLUMNS = ("soldador", "wps", "proyecto_ot", "veredicto")
+
+
+def new_id_cordon():
+    """Código de cordón nuevo: 12 hex (48 bits) para que no choquen decenas de miles de fichas."""
+    return uuid.uuid4().hex[:12].upper()
+
+
+def ficha_verdict(ficha):
+    """Veredicto final: el dictamen del inspector si existe, si no el automático."""
+    manual = ficha.get('manual_data', {})
+    auto = ficha.get('auto_data', {})
+    return manual.get('veredicto_final') or auto.get('aprobacion_final')
+
+
+class FichaStore:
+    """Acceso a la base de fichas. Una conexión por hilo (Streamlit usa varios)."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            # Bases anteriores a la columna `origen`
+            if "origen" not in [r[1] for r in conn.execute("PRAGMA table_info(fichas)")]:
+                conn.execute("ALTER TABLE fichas ADD COLUMN origen TEXT")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _ficha_row(ficha):
+        manual = ficha.get('manual_data', {})
+        auto = ficha.get('auto_data', {})
+        return (
+            ficha['id_cordon'], ficha['fecha'],
+            manual.get('soldador') or None, manual.get('wps') or None,
+            manual.get('proyecto_ot') or None,
+            ficha_verdict(ficha), auto.get('aprobacion_final'),
+            json.dumps(manual, ensure_ascii=False, default=str),
+            json.dumps(auto, ensure_ascii=False, default=str),
+            time.time(),
+            ficha.get('origen'),
+        )
+
+    @staticmethod
+    def _detection_rows(id_cordon, det):
+        if det is None or len(det) == 0:
+            return []
+        names = det.class_names()
+        return [(id_cordon, int(c), name, float(conf), *map(float, box))
+                for c, name, conf, box in zip(det.cls, names, det.conf, det.xyxy)]
+
+    def save_many(self, items):
+        """Inserta/reemplaza [(ficha, detections | None), ...] en una sola transacción.
+
+        Una ficha solo reemplaza a otra con el mismo id_cordon si viene del
+        mismo origen (`ficha['origen']`: la sesión o el archivo de imagen);
+        si no, es un choque de códigos y se lanza ValueError sin guardar nada.
+        """
+        fichas, detections, ids = [], [], []
+        for ficha, det in items:
+            fichas.append(self._ficha_row(ficha))
+            detections.extend(self._detection_rows(ficha['id_cordon'], det))
+            ids.append((ficha['id_cordon'],))
+        conn = self._conn()
+        with conn:
+            clashes = []
+            for row in fichas:
+                existing = conn.execute("SELECT origen FROM fichas WHERE id_cordon = ?", (row[0],)).fetchone()
+                if existing is not None and existing[0] != row[-1]:
+                    clashes.append(row[0])
+            if clashes:
+                raise ValueError(f"Código de cordón ya usado por otra ficha: {', '.join(clashes)}")
+            conn.executemany("DELETE FROM detecciones WHERE id_cordon = ?", ids)
+            conn.executemany("INSERT OR REPLACE INTO fichas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", fichas)
+            conn.executemany("INSERT INTO detecciones VALUES (?, ?, ?, ?, ?, ?, ?, ?)", detections)
+        return len(fichas)
+
+    def save(self, ficha, detections=None):
+        return self.save_many([(ficha, detections)])
+
+    def get(self, id_cordon):
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM fichas WHERE id_cordon = ?", (id_cordon,)).fetchone()
+        if row is None:
+            return None
+        ficha = self._row_to_dict(row)
+        ficha['detecciones'] = [dict(r) for r in conn.execute(
+            "SELECT cls, clase, conf, x1, y1, x2, y2 FROM detecciones WHERE id_cordon = ?",
+            (id_cordon,))]
+        return ficha
+
+    @staticmethod
+    def _row_to_dict(row):
+        data = dict(row)
+        data['manual_data'] = json.loads(data.pop('manual_json'))
+        data['auto_data'] = json.loads(data.pop('auto_json'))
+        return data
+
+    @staticmethod
+    def _where(filters):
+        clauses, params = [], []
+        for column in FILTER_COLUMNS:
+            value = filters.get(column)
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if filters.get('fecha_desde'):
+            clauses.append("fecha >= ?")
+            params.append(filters['fecha_desde'])
+        if filters.get('fecha_hasta'):
+            clauses.append("fecha <= ?")
+            params.append(filters['fecha_hasta'])
+        return clauses, params
+
+    def query(self, page_size=DEFAULT_PAGE_SIZE, cursor=None, include_data=False, **filters):
+        """Página de fichas más recientes primero.
+
+        Filtros: soldador, wps, proyecto_ot, veredicto, fecha_desde, fecha_hasta
+        (texto 'YYYY-MM-DD[ HH:MM]'). Devuelve (filas, cursor_siguiente | None).
+        """
+        clauses, params = self._where(filters)
+        if cursor:
+            clauses.append("(fecha, id_cordon) < (?, ?)")
+            params.extend(cursor)
+        columns = "*" if include_data else (
+            "id_cordon, fecha, soldador, wps, proyecto_ot, veredicto, aprobacion_auto")
+        sql = f"SELECT {columns} FROM fichas"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY fecha DESC, id_cordon DESC LIMIT ?"
+        rows = self._conn().execute(sql, params + [page_size + 1]).fetchall()
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        result = [self._row_to_dict(r) if include_data else dict(r) for r in rows]
+        next_cursor = (rows[-1]['fecha'], rows[-1]['id_cordon']) if more else None
+        return result, next_cursor
+
+    def iter_fichas(self, batch_size=500, **filters):
+        """Recorre todas las fichas que cumplen los filtros, por páginas."""
+        cursor = None
+        while True:
+            rows, cursor = self.query(batch_size, cursor, include_data=True, **filters)
+            yield from rows
+            if cursor is None:
+                return
+
+    def count(self, **filters):
+        clauses, params = self._where(filters)
+        sql = "SELECT COUNT(*) FROM fichas"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def distinct(self, column):
+        """Valores distintos de una columna indexada (para los filtros de la UI)."""
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"Columna no filtrable: {column}")
+        sql = f"SELECT DISTINCT {column} FROM fichas WHERE {column} IS NOT NULL ORDER BY {column}"
+        return [r[0] for r in self._conn().execute(sql)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(path=DEFAULT_DB_PATH):
+    """Almacén único del proceso."""
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = FichaStore(path)
+        return _store
@@ -0,0 +1,155 @@
+"""
+Decodificación rápida de imágenes subidas.
+
+Las fotos de teléfono (20-50 MP) se decodificaban completas con
+`Image.open(...).convert("RGB")`, se copiaban a NumPy y ultralytics las
+reducía luego a 640 px. Aquí:
+
+- Los JPEG se decodifican con el modo draft de PIL, que reduce en el propio
+  decodificador (1/2, 1/4, 1/8) hasta el tamaño más cercano al que se necesita.
+- La orientación EXIF se aplica una sola vez; todas las vistas (modelo,
+  pantalla, geometría) comparten el mismo sistema de coordenadas.
+- La entrada del modelo se arma en un único lienzo BGR contiguo (letterbox),
+  listo para `model.predict`, y las cajas se devuelven en coordenadas de la
+  imagen completa.
+- La imagen completa solo se decodifica si se pide (inferencia por mosaicos).
+"""
+import io
+import math
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from detections import Detections
+
+PAD_VALUE = 114
+STRIDE = 32
+
+
+def letterbox_shape(h, w, size, stride=STRIDE, rect=True):
+    """(alto, ancho) redimensionado y del lienzo, como el LetterBox de ultralytics.
+
+    rect=True rellena solo hasta múltiplo de `stride` (inferencia rectangular
+    de PyTorch); rect=False rellena al cuadrado size x size.
+    """
+    r = min(size / h, size / w)
+    nh, nw = round(h * r), round(w * r)
+    if rect:
+        return (nh, nw), (math.ceil(nh / stride) * stride, math.ceil(nw / stride) * stride)
+    return (nh, nw), (size, size)
+
+
+def pad_into_canvas(resized, canvas_hw, flip_channels=False, out=None):
+    """Copia `resized` centrada en un lienzo gris (la única reserva de memoria).
+
+    `out` permite escribir en un buffer ya reservado (p. ej. memoria compartida).
+    """
+    nh, nw = resized.shape[:2]
+    ch, cw = canvas_hw
+    top, left = round((ch - nh) / 2 - 0.1), round((cw - nw) / 2 - 0.1)
+    if out is None:
+        canvas = np.full((ch, cw, 3), PAD_VALUE, dtype=np.uint8)
+    else:
+        canvas = out
+        canvas.fill(PAD_VALUE)
+    canvas[top:top + nh, left:left + nw] = resized[:, :, ::-1] if flip_channels else resized
+    return canvas, (left, top)
+
+
+def letterbox(img, size, stride=STRIDE, rect=False):
+    """Letterbox de un array HxWx3 (mismo orden de canales). Devuelve (lienzo, escala, (izq, arriba))."""
+    h, w = img.shape[:2]
+    (nh, nw), canvas_hw = letterbox_shape(h, w, size, stride, rect)
+    if (nh, nw) != (h, w):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    canvas, pad = pad_into_canvas(img, canvas_hw)
+    return canvas, nw / w, pad
+
+
+class DecodedImage:
+    """Imagen subida (bytes) con vistas decodificadas bajo demanda.
+
+    Al construirla solo se lee la cabecera. `size` es (ancho, alto) de la
+    imagen completa ya orientada según EXIF.
+    """
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        with Image.open(io.BytesIO(self.data)) as img:
+            w, h = img.size
+            self.format = img.format
+            self.orientation = img.getexif().get(0x0112, 1)
+        # Orientaciones 5-8 giran 90°: se intercambian ancho y alto
+        self.size = (h, w) if self.orientation in (5, 6, 7, 8) else (w, h)
+        self._full = None
+
+    @property
+    def shape(self):
+        return (self.size[1], self.size[0], 3)
+
+    def reduced(self, max_side):
+        """(PIL RGB orientada con lado mayor <= max_side, escala respecto de la completa)."""
+        img = Image.open(io.BytesIO(self.data))
+        full_side = max(self.size)
+        if max_side < full_side:
+            # draft elige la mayor reducción del decodificador que no baja de lo pedido
+            w, h = img.size
+            r = max_side / full_side
+            img.draft("RGB", (math.ceil(w * r), math.ceil(h * r)))
+        img = ImageOps.exif_transpose(img.convert("RGB"))
+        if max(img.size) > max_side:
+            r = max_side / max(img.size)
+            img = img.resize((round(img.size[0] * r), round(img.size[1] * r)),
+                             Image.Resampling.BILINEAR, reducing_gap=2.0)
+        return img, img.size[0] / self.size[0]
+
+    def model_input_shape(self, imgsz, rect=True):
+        """Forma (alto, ancho, 3) del lienzo que devuelve `model_input`."""
+        w, h = self.size
+        return letterbox_shape(h, w, imgsz, rect=rect)[1] + (3,)
+
+    def model_input(self, imgsz, rect=True, out=None):
+        """Lienzo BGR contiguo listo para `model.predict`, escala y relleno (izq, arriba).
+
+        Con `out` (array de `model_input_shape`) el lienzo se escribe ahí.
+        """
+        w, h = self.size
+        (nh, nw), canvas_hw = letterbox_shape(h, w, imgsz, rect=rect)
+        img, _ = self.reduced(max(nh, nw))
+        arr = np.asarray(img)
+        if arr.shape[:2] != (nh, nw):
+            arr = cv2.resize(arr, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        canvas, pad = pad_into_canvas(arr, canvas_hw, flip_channels=True, out=out)
+        return canvas, nw / w, pad
+
+    def full(self):
+        """PIL RGB orientada a resolución completa (se conserva mientras viva el objeto)."""
+        if self._full is None:
+            self._full = ImageOps.exif_transpose(Image.open(io.BytesIO(self.data)).convert("RGB"))
+        return self._full
+
+    def full_bgr(self):
+        return np.ascontiguousarray(np.asarray(self.full())[:, :, ::-1])
+
+    def release(self):
+        self._full = None
+
+
+def predict_decoded(model, decoded, conf, imgsz, **predict_kwargs):
+    """Una pasada del modelo sobre la entrada reducida; cajas en coordenadas completas."""
+    canvas, scale, (left, top) = decoded.model_input(imgsz)
+    results = model.predict(canvas, conf=conf, imgsz=imgsz, verbose=False, **predict_kwargs)
+    det = Detections.from_result(results[0], model.names)
+    return unletterbox(det, scale, (left, top), decoded.size), results[0]
+
+
+def unletterbox(det, scale, pad, size):
+    """Lleva (in situ) las cajas del lienzo a coordenadas de la imagen completa (ancho, alto)."""
+    if len(det):
+        left, top = pad
+        det.xyxy -= np.array([left, top, left, top], dtype=np.float32)
+        w, h = size
+        det.xyxy /= scale
+        np.clip(det.xyxy, 0, [w, h, w, h], out=det.xyxy)
+    return det
@@ -0,0 +1,93 @@
+"""
+Backends de inferencia: PyTorch (.pt) u ONNX Runtime en CPU (.onnx).
+
+Ambos se cargan a través de `ultralytics.YOLO`, de modo que el pre-proceso
+(letterbox) y el post-proceso (NMS) son los mismos y la salida es idéntica
+salvo diferencias numéricas mínimas. Si ONNX Runtime no está instalado o la
+exportación falla, se vuelve a PyTorch automáticamente.
+"""
+import os
+
+import numpy as np
+
+BACKENDS = ("auto", "pytorch", "onnx")
+DEFAULT_BACKEND = os.getenv("INFERENCE_BACKEND", "auto")
+EXPORT_IMGSZ = 640
+
+# Hilos de ONNX Runtime: intra-op = núcleos físicos aprox., inter-op = 1
+# (el grafo de YOLO es secuencial; más hilos inter-op solo compiten).
+DEFAULT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "1"))
+
+
+def onnx_available():
+    try:
+        import onnxruntime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def onnx_path_for(pt_path):
+    return os.path.splitext(pt_path)[0] + ".onnx"
+
+
+def ensure_onnx(pt_path, imgsz=EXPORT_IMGSZ):
+    """Ruta del .onnx junto al .pt, exportándolo si falta o está desactualizado."""
+    onnx_path = onnx_path_for(pt_path)
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(pt_path):
+        return onnx_path
+    from ultralytics import YOLO
+    print(f"Exportando {pt_path} a ONNX (imgsz={imgsz})...")
+    # dynamic=True permite lotes de tamaño variable (batch_inspect, inference_service)
+    exported = YOLO(pt_path).export(format="onnx", imgsz=imgsz, dynamic=True)
+    if exported and os.path.abspath(str(exported)) != os.path.abspath(onnx_path):
+        os.replace(str(exported), onnx_path)
+    return onnx_path
+
+
+def _tune_onnx_session(model, onnx_path, intra_op_threads, inter_op_threads):
+    """Reemplaza la sesión creada por ultralytics por una con hilos ajustados."""
+    import onnxruntime as ort
+
+    # La sesión de ultralytics se crea en la primera predicción
+    model.predict(np.zeros((EXPORT_IMGSZ, EXPORT_IMGSZ, 3), dtype=np.uint8), verbose=False)
+    backend = model.predictor.model
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    backend.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+
+def load_model(path, backend=DEFAULT_BACKEND, intra_op_threads=None, inter_op_threads=None):
+    """Carga `path` con el backend pedido.
+
+    Devuelve (modelo YOLO, backend efectivo). 'auto' usa ONNX Runtime cuando
+    está disponible y PyTorch en caso contrario.
+    """
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+
+    if backend in ("auto", "onnx") and onnx_available():
+        try:
+            onnx_path = ensure_onnx(path) if path.endswith(".pt") else path
+            model = YOLO(onnx_path, task="detect")
+            _tune_onnx_session(model, onnx_path,
+                               intra_op_threads or DEFAULT_INTRA_OP_THREADS,
+                               inter_op_threads or DEFAULT_INTER_OP_THREADS)
+            return model, "onnx"
+        except Exception as e:
+            print(f"ONNX Runtime no disponible para {path}, usando PyTorch: {e}")
+    elif backend == "onnx":
+        print("onnxruntime no está instalado, usando PyTorch.")
+
+    if path.endswith(".onnx"):
+        pt_path = os.path.splitext(path)[0] + ".pt"
+        if not os.path.exists(pt_path):
+            raise FileNotFoundError(f"No hay pesos PyTorch para {path}")
+        path = pt_path
+    return YOLO(path), "pytorch"
@@ -0,0 +1,113 @@
+"""
+Caché de detecciones crudas por (contenido de imagen, modelo).
+
+Se ejecuta el modelo una sola vez con un umbral bajo (BASE_CONF) y se guardan
+las cajas; mover el slider de confianza o volver al paso anterior solo
+re-filtra esos arrays en NumPy, sin otra pasada por la red.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from inference_workers import PooledModel
+from pipeline_metrics import count
+from tiled_inference import predict_auto
+
+# Umbral de la predicción almacenada; cualquier umbral >= BASE_CONF se
+# obtiene filtrando (umbrales menores quedan acotados a BASE_CONF). Al ser
+# NMS por orden de confianza, una caja por debajo del umbral nunca suprime a
+# una por encima. Lo que sí cambia es el tope de cajas por pasada (max_det,
+# 300 en ultralytics): con BASE_CONF las de baja confianza podrían desplazar
+# a cajas que una predicción directa conservaría, así que la caché se llena
+# con BASE_MAX_DET. El resultado coincide con predecir directamente con el
+# umbral pedido salvo que una pasada supere BASE_MAX_DET cajas >= BASE_CONF;
+# entonces se pierden las de menor confianza.
+BASE_CONF = 0.01
+BASE_MAX_DET = 3000
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def image_digest(data):
+    """Hash del contenido de la imagen (bytes del archivo subido)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class DetectionCache:
+    """LRU acotada por número de entradas y por bytes de arrays."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            det = self._entries.get(key)
+            if det is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return det
+
+    def put(self, key, det):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = det
+            self._bytes += det.nbytes
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def predict_cached(model, model_key, image, digest, conf, cache=None, tiling="off", **predict_kwargs):
+    """Detecciones de `image` con confianza >= conf, reutilizando la caché.
+
+    `model_key` identifica los pesos (p. ej. ModelEntry.key) y `digest` el
+    contenido de la imagen (image_digest de los bytes subidos). `tiling`
+    ('auto' | 'on' | 'off') activa la inferencia por mosaicos. Con un
+    PooledModel la inferencia corre en el pool de procesos.
+    """
+    cache = cache if cache is not None else get_cache()
+    key = (model_key, digest, tiling, tuple(sorted(predict_kwargs.items())))
+    raw = cache.get(key)
+    count("inference_cache_total", result="hit" if raw is not None else "miss")
+    if raw is None:
+        predict_kwargs.setdefault("max_det", BASE_MAX_DET)
+        if isinstance(model, PooledModel):
+            raw = model.detect(image, BASE_CONF, tiling, **predict_kwargs)
+        else:
+            raw = predict_auto(model, image, BASE_CONF, tiling, **predict_kwargs)
+        cache.put(key, raw)
+    return raw.filter(conf)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Caché única del proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DetectionCache()
+        return _cache
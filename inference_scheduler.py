@@ -0,0 +1,147 @@
+"""
+Planificador de inferencia: modelos de superficie y soldadura en paralelo.
+
+Cada modelo tiene un "carril" (un hilo dedicado). Las peticiones al mismo
+modelo se ejecutan en orden en su carril, lo que además evita usar un mismo
+predictor de ultralytics desde dos sesiones a la vez. Carriles distintos
+corren en paralelo y se reparten los núcleos: antes de cada trabajo el
+carril fija sus hilos intra-op de PyTorch (`torch.set_num_threads` es por
+hilo con el backend OpenMP) según cuántos carriles están ocupados. Las
+sesiones de ONNX Runtime ya se crean con la mitad de los núcleos
+(ORT_INTRA_OP_THREADS), que es el mismo reparto. Con el pool de procesos
+de inferencia (inference_workers) cada carril admite tantos trabajos a la
+vez como procesos tiene el pool: quien lo usa (la app) pasa `lane_width`
+al crear el planificador; el lote, con modelos locales, no arranca el pool.
+
+    scheduler = get_scheduler()
+    future = scheduler.run({
+        "surface": (predict_cached, (surface_model, key_s, surf_img, digest_s, conf), {}),
+        "weld": (predict_cached, (weld_model, key_w, weld_img, digest_w, conf), {}),
+    })
+    results = future.result()          # {"surface": Detections, "weld": Detections}
+    results = await asyncio.wrap_future(future)   # desde código asíncrono
+
+Una inspección completa (pre y post soldadura) tarda así lo que el modelo
+más lento, no la suma de ambos.
+"""
+import contextvars
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_THREADS = int(os.getenv("SCHEDULER_THREADS", "0")) or (os.cpu_count() or 2)
+# Peso relativo de cada carril al repartir los hilos (el de soldadura suele
+# ir con mosaicos e imágenes más grandes)
+DEFAULT_WEIGHTS = {"weld": 0.5, "surface": 0.5}
+
+
+def _set_torch_threads(threads):
+    # Sin torch cargado (p. ej. inferencia en el pool de procesos) no hay nada que repartir
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    if torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+
+
+class InferenceScheduler:
+    """Carriles de inferencia (uno por modelo) con reparto de hilos de CPU."""
+
+    def __init__(self, total_threads=DEFAULT_THREADS, weights=None, lane_width=1):
+        self.total_threads = max(1, total_threads)
+        self.lane_width = max(1, lane_width)
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self._lanes = {}
+        self._busy = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, name):
+        with self._lock:
+            lane = self._lanes.get(name)
+            if lane is None:
+                lane = self._lanes[name] = ThreadPoolExecutor(max_workers=self.lane_width, thread_name_prefix=f"lane-{name}")
+                self._busy[name] = 0
+            return lane
+
+    def threads_for(self, name, active):
+        """Hilos intra-op del carril `name` cuando `active` carriles trabajan a la vez."""
+        active = [a for a in active if a in self.weights] or [name]
+        share = self.weights.get(name, 1.0) / sum(self.weights.get(a, 1.0) for a in active)
+        return max(1, int(round(self.total_threads * share)))
+
+    def _run_in_lane(self, name, fn, args, kwargs):
+        with self._lock:
+            active = [lane for lane, n in self._busy.items() if n]
+        _set_torch_threads(self.threads_for(name, active))
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._busy[name] -= 1
+
+    def submit(self, lane, fn, *args, **kwargs):
+        """Encola `fn(*args, **kwargs)` en el carril `lane`. Devuelve un Future."""
+        executor = self._lane(lane)
+        with self._lock:
+            self._busy[lane] += 1
+        # Propaga el contexto (p. ej. el StageTimer activo) al hilo del carril
+        ctx = contextvars.copy_context()
+        return executor.submit(ctx.run, self._run_in_lane, lane, fn, args, kwargs)
+
+    def run(self, jobs):
+        """Lanza {carril: (fn, args, kwargs)} a la vez. Devuelve un Future con {carril: resultado}."""
+        futures = {lane: self.submit(lane, fn, *args, **(kwargs or {}))
+                   for lane, (fn, args, kwargs) in jobs.items()}
+        return gather(futures)
+
+    def stats(self):
+        with self._lock:
+            return {"total_threads": self.total_threads, "lanes": dict(self._busy)}
+
+    def shutdown(self):
+        for lane in self._lanes.values():
+            lane.shutdown(wait=True)
+
+
+def gather(futures):
+    """Un Future que se completa con {clave: resultado} cuando terminan todos."""
+    combined = Future()
+    results = {}
+    pending = [len(futures)]
+    lock = threading.Lock()
+
+    def done(key, future):
+        with lock:
+            if combined.done():
+                return
+            error = future.exception()
+            if error is not None:
+                combined.set_exception(error)
+                return
+            results[key] = future.result()
+            pending[0] -= 1
+            if pending[0] == 0:
+                combined.set_result(results)
+
+    if not futures:
+        combined.set_result({})
+    for key, future in futures.items():
+        future.add_done_callback(lambda f, key=key: done(key, f))
+    return combined
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(lane_width=1):
+    """Planificador único del proceso (compartido por las sesiones de Streamlit).
+
+    `lane_width` (trabajos simultáneos por carril) solo cuenta en la primera llamada.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler(lane_width=lane_width)
+        return _scheduler
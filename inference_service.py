@@ -0,0 +1,274 @@
+"""
+Servicio HTTP de inferencia sin interfaz, con micro-lotes dinámicos.
+
+Permite a las celdas de soldadura enviar imágenes directamente desde la línea:
+
+    curl --data-binary @cordon.jpg -H "Content-Type: image/jpeg" \\
+        "http://localhost:8000/detect/weld?id_cordon=A1B2C3D4&conf=0.25&distancia_camara=300"
+
+Endpoints:
+    POST /detect/weld     -> campos automáticos de la ficha (defect_counts, aprobacion_final, ...)
+    POST /detect/surface  -> condicion_superficial
+    GET  /stats           -> profundidad de cola, lotes y latencias p50/p99
+    GET  /metrics         -> tiempos por etapa en formato Prometheus
+    GET  /health
+
+Las peticiones se encolan y un hilo por modelo las agrupa en un solo
+`model.predict` cuando llegan dentro del presupuesto de latencia (--max-wait-ms)
+o al completar --max-batch imágenes. Un Content-Length inválido responde
+400 y un cuerpo mayor que --max-body-mb, 413, sin leerlo.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from defect_map import DefectMap
+from detections import Detections
+from ficha_store import new_id_cordon
+from inference_cache import BASE_CONF, BASE_MAX_DET
+from inference_backend import BACKENDS, DEFAULT_BACKEND
+from model_registry import get_registry
+from pipeline_metrics import StageTimer, get_metrics
+from weld_analysis import (build_auto_data, count_defects, measure_geometry, serialize_detections,
+                           surface_condition)
+
+LATENCY_WINDOW = 1000
+DEFAULT_MAX_BODY_MB = 32
+
+
+class LatencyStats:
+    """Ventana deslizante de latencias (ms) con percentiles."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64)
+        if samples.size == 0:
+            return {"count": self.count, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(samples, [50, 99])
+        return {"count": self.count, "p50_ms": round(float(p50), 2), "p99_ms": round(float(p99), 2)}
+
+
+class MicroBatcher:
+    """Agrupa peticiones concurrentes en lotes para un mismo modelo."""
+
+    def __init__(self, model, max_batch=8, max_wait_ms=10.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.latency = LatencyStats()
+        self.batches = 0
+        self.batched_images = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """Encola una imagen BGR; devuelve un Future con las Detections crudas."""
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                # Umbral bajo común (y tope de cajas alto, ver inference_cache); cada
+                # petición filtra luego con su propio conf
+                t_batch = time.perf_counter()
+                results = self.model.predict([item[0] for item in batch], conf=BASE_CONF,
+                                             max_det=BASE_MAX_DET, verbose=False)
+                get_metrics().observe("service_batch", "predict", time.perf_counter() - t_batch)
+                for (_, future, t0), result in zip(batch, results):
+                    future.set_result(Detections.from_result(result, self.model.names))
+                    self.latency.add((time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.batched_images += len(batch)
+
+    def stats(self):
+        mean_batch = self.batched_images / self.batches if self.batches else None
+        return {
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "mean_batch_size": None if mean_batch is None else round(mean_batch, 2),
+            "latency": self.latency.summary(),
+        }
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    batchers = {}
+    timeout_s = 30.0
+    max_body_bytes = DEFAULT_MAX_BODY_MB * 1024 * 1024
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "models": sorted(self.batchers)})
+        elif path == "/stats":
+            self._send_json(200, {task: b.stats() for task, b in self.batchers.items()})
+        elif path == "/metrics":
+            body = get_metrics().render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "ruta no encontrada"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        task = url.path.rsplit("/", 1)[-1] if url.path.startswith("/detect/") else None
+        batcher = self.batchers.get(task)
+        if batcher is None:
+            self._send_json(404, {"error": "ruta no encontrada"})
+            return
+
+        params = parse_qs(url.query)
+        try:
+            conf = float(params.get("conf", ["0.25"])[0])
+        except ValueError:
+            self._send_json(400, {"error": "conf inválido"})
+            return
+        # El cuerpo no leído quedaría en el socket: tras un error se cierra la conexión
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send_json(400, {"error": "Content-Length inválido"})
+            return
+        if length > self.max_body_bytes:
+            self.close_connection = True
+            self._send_json(413, {"error": f"imagen mayor que el máximo de {self.max_body_bytes} bytes"})
+            return
+
+        timer = StageTimer(f"service_{task}")
+        with timer:
+            with timer.stage("decode"):
+                data = self.rfile.read(length) if length else b""
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+            if image is None:
+                self._send_json(400, {"error": "imagen inválida o vacía"})
+                return
+
+            try:
+                # Incluye la espera en la cola del micro-lote
+                with timer.stage("predict"):
+                    det = batcher.submit(image).result(timeout=self.timeout_s).filter(conf)
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+
+            with timer.stage("analysis"):
+                payload = {
+                    "defect_counts": count_defects(det),
+                    "detections": serialize_detections(det),
+                }
+                if task == "weld":
+                    id_cordon = params.get("id_cordon", [new_id_cordon()])[0]
+                    distancia = params.get("distancia_camara", [None])[0]
+                    geometry = measure_geometry(image, det, distancia, channels="BGR")
+                    defect_map = DefectMap.from_detections(det, geometry)
+                    payload["defect_map"] = defect_map.as_dict()
+                    payload["auto_data"] = build_auto_data(det, id_cordon, geometry, defect_map)
+                    payload["aprobacion_final"] = payload["auto_data"]["aprobacion_final"]
+                else:
+                    payload["condicion_superficial"] = surface_condition(det)
+            self._send_json(200, payload)
+
+    def log_message(self, format, *args):
+        # Sin log por petición; las métricas están en /stats
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP de detección de defectos de soldadura.")
+    parser.add_argument("--host", default=os.getenv("INFERENCE_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("INFERENCE_PORT", "8000")))
+    parser.add_argument("--model", default=os.getenv("WELD_MODEL", "models/welding_model.pt"))
+    parser.add_argument("--surface-model", default=os.getenv("SURFACE_MODEL", "models/surface_model.pt"))
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Backend de inferencia")
+    parser.add_argument("--max-batch", type=int, default=int(os.getenv("MAX_BATCH", "8")),
+                        help="Máximo de imágenes por lote")
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("MAX_WAIT_MS", "10")),
+                        help="Presupuesto de espera para completar un lote")
+    parser.add_argument("--max-body-mb", type=float, default=float(os.getenv("MAX_BODY_MB", DEFAULT_MAX_BODY_MB)),
+                        help="Tamaño máximo de la imagen recibida (413 si se supera)")
+    args = parser.parse_args(argv)
+
+    registry = get_registry()
+    batchers = {}
+    for task, path in [("weld", args.model), ("surface", args.surface_model)]:
+        try:
+            entry = registry.get(path, args.backend)
+            batchers[task] = MicroBatcher(entry.model, args.max_batch, args.max_wait_ms)
+            print(f"Modelo {task} cargado: {path} ({entry.backend})")
+        except Exception as e:
+            print(f"Modelo {task} no disponible ({path}): {e}")
+    if not batchers:
+        raise SystemExit("No se pudo cargar ningún modelo.")
+
+    InferenceHandler.batchers = batchers
+    InferenceHandler.max_body_bytes = int(args.max_body_mb * 1024 * 1024)
+    server = ThreadingHTTPServer((args.host, args.port), InferenceHandler)
+    print(f"Servicio de inferencia escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
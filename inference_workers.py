@@ -0,0 +1,315 @@
+"""
+Pool de procesos de inferencia compartido por todas las sesiones.
+
+Streamlit ejecuta cada sesión en un hilo del mismo proceso: con varios
+inspectores a la vez, todas las llamadas a `model.predict` compiten por el
+GIL y por los mismos hilos de CPU. Aquí la inferencia corre en un pequeño
+pool de procesos (arrancados una vez, con spawn) dimensionado según los
+núcleos: cada proceso tiene su propio registro de modelos y
+`cpu_count // procesos` hilos intra-op.
+
+    pool = get_worker_pool()                    # None si INFERENCE_WORKERS=0
+    entry = pool.load("models/welding_model.pt", "auto")   # ModelEntry con un PooledModel
+    det = predict_cached(entry.model, entry.key, DecodedImage(data), digest, 0.25)
+
+La imagen no se serializa: el lienzo letterbox se decodifica directamente en
+un bloque de `multiprocessing.shared_memory` que el proceso de inferencia
+mapea sin copiar, y la respuesta son solo los arrays de cajas (xyxy, conf,
+clase). Cada petición va al proceso con menos trabajos en curso; si un
+proceso muere, sus peticiones fallan con RuntimeError y se relanza.
+"""
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detections import Detections
+from image_decode import DecodedImage, unletterbox
+from model_registry import ModelEntry, file_signature
+from pipeline_metrics import count, observe_yolo_speed
+from tiled_inference import model_imgsz, needs_tiling, to_bgr_array
+
+_env_workers = os.getenv("INFERENCE_WORKERS", "")
+# Sin variable: un proceso cada 4 núcleos (máx. 4); INFERENCE_WORKERS=0 desactiva el pool
+DEFAULT_WORKERS = int(_env_workers) if _env_workers else max(1, min(4, (os.cpu_count() or 2) // 4))
+HEALTH_CHECK_S = 1.0
+
+
+def _set_thread_env(threads):
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+
+def _close_shm(shm, deferred):
+    try:
+        shm.close()
+    except BufferError:
+        # El predictor de ultralytics aún referencia el último lote; se cierra más tarde
+        deferred.append(shm)
+
+
+def _worker_main(index, inbox, outbox, threads):
+    """Bucle de un proceso de inferencia: ('load' | 'predict', id, ...) -> (id, ok, respuesta)."""
+    _set_thread_env(threads)
+    from inference_backend import load_model
+    from model_registry import ModelRegistry
+    from tiled_inference import predict_tiled
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    registry = ModelRegistry(loader=lambda path, backend: load_model(path, backend, intra_op_threads=threads))
+    deferred = []
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            break
+        kind, job_id = msg[0], msg[1]
+        for shm in deferred[:]:
+            deferred.remove(shm)
+            _close_shm(shm, deferred)
+        try:
+            if kind == "load":
+                _, _, path, backend = msg
+                entry = registry.get(path, backend)
+                reply = {"names": dict(entry.model.names), "imgsz": model_imgsz(entry.model),
+                         "backend": entry.backend, "load_s": entry.load_s, "warmup_s": entry.warmup_s,
+                         "rss_delta_mb": entry.rss_delta_mb, "weights_mb": entry.weights_mb}
+            else:
+                _, _, path, backend, shm_name, shape, conf, tiled, kwargs = msg
+                model = registry.get_model(path, backend)
+                imgsz = model_imgsz(model)
+                shm = shared_memory.SharedMemory(name=shm_name)
+                try:
+                    img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+                    speed = None
+                    if tiled:
+                        det = predict_tiled(model, img, conf, imgsz, **kwargs)
+                    else:
+                        results = model.predict(img, conf=conf, imgsz=imgsz, verbose=False, **kwargs)
+                        det = Detections.from_result(results[0], model.names)
+                        speed = getattr(results[0], "speed", None)
+                        del results
+                    del img
+                finally:
+                    _close_shm(shm, deferred)
+                reply = (det.xyxy, det.conf, det.cls, speed)
+            outbox.put((job_id, True, reply))
+        except Exception as e:
+            outbox.put((job_id, False, f"{type(e).__name__}: {e} (proceso {index})"))
+
+
+class PooledModel:
+    """Modelo cargado en los procesos del pool (sustituye al YOLO local en predict_cached)."""
+
+    def __init__(self, pool, path, backend, names, imgsz):
+        self.pool = pool
+        self.path = path
+        self.backend = backend
+        self.names = names
+        self.imgsz = imgsz
+
+    def predict_async(self, image, conf, mode="auto", **predict_kwargs):
+        """Future con (Detections en coordenadas de `image`, speed de ultralytics)."""
+        return self.pool.submit_predict(self, image, conf, mode, predict_kwargs)
+
+    def detect(self, image, conf, mode="auto", **predict_kwargs):
+        """Equivalente a `predict_auto` ejecutado en el pool."""
+        det, speed = self.predict_async(image, conf, mode, **predict_kwargs).result()
+        observe_yolo_speed(speed)
+        return det
+
+
+class _Worker:
+    def __init__(self, index, process, inbox):
+        self.index = index
+        self.process = process
+        self.inbox = inbox
+        self.inflight = set()
+
+
+class InferencePool:
+    """Procesos de inferencia con reparto por menor carga y relanzamiento si mueren."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, threads=None):
+        self.size = max(1, workers)
+        self.threads = threads or max(1, (os.cpu_count() or 2) // self.size)
+        self._ctx = mp.get_context("spawn")
+        self._outbox = self._ctx.Queue()
+        self._ids = itertools.count()
+        self._jobs = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.restarts = 0
+        self._workers = [self._start_worker(i) for i in range(self.size)]
+        self._collector = threading.Thread(target=self._collect, name="inference-pool", daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, index):
+        inbox = self._ctx.Queue()
+        process = self._ctx.Process(target=_worker_main, args=(index, inbox, self._outbox, self.threads),
+                                    name=f"inference-worker-{index}", daemon=True)
+        process.start()
+        return _Worker(index, process, inbox)
+
+    def _submit(self, message, worker=None, shm=None, finish=None):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("El pool de inferencia está cerrado")
+            job_id = next(self._ids)
+            if worker is None:
+                worker = min(self._workers, key=lambda w: len(w.inflight))
+            worker.inflight.add(job_id)
+            self._jobs[job_id] = (future, worker, shm, finish)
+            worker.inbox.put((message[0], job_id) + tuple(message[1:]))
+        return future
+
+    def _finish(self, job_id, ok, payload):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            future, worker, shm, finish = job
+            worker.inflight.discard(job_id)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        if not ok:
+            future.set_exception(RuntimeError(payload))
+            return
+        try:
+            future.set_result(finish(payload) if finish else payload)
+        except Exception as e:
+            future.set_exception(e)
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            try:
+                self._finish(*self._outbox.get(timeout=HEALTH_CHECK_S))
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                break
+            if time.monotonic() - last_check >= HEALTH_CHECK_S:
+                self._check_workers()
+                last_check = time.monotonic()
+
+    def _check_workers(self):
+        for i, worker in enumerate(self._workers):
+            if self._closed or worker.process.is_alive():
+                continue
+            print(f"Proceso de inferencia {worker.index} terminó (código {worker.process.exitcode}); relanzando")
+            count("inference_worker_restarts_total")
+            with self._lock:
+                self._workers[i] = self._start_worker(worker.index)
+                self.restarts += 1
+            for job_id in list(worker.inflight):
+                self._finish(job_id, False, f"El proceso de inferencia {worker.index} terminó inesperadamente")
+
+    def load(self, path, backend):
+        """ModelEntry (con un PooledModel) tras cargar `path` en todos los procesos.
+
+        Lanza FileNotFoundError si el archivo no existe.
+        """
+        key = file_signature(path) + (backend,)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            entry.hits += 1
+            return entry
+        infos = [f.result() for f in [self._submit(("load", path, backend), worker=w) for w in self._workers]]
+        info = max(infos, key=lambda i: i["load_s"])
+        model = PooledModel(self, path, backend, info["names"], info["imgsz"])
+        entry = ModelEntry(key, model, info["backend"], info["load_s"], info["warmup_s"],
+                           sum(i["rss_delta_mb"] for i in infos), info["weights_mb"])
+        with self._lock:
+            # Otra versión del mismo archivo: se descarta la entrada anterior
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1:] != key[1:]]:
+                del self._entries[stale]
+            entry = self._entries.setdefault(key, entry)
+        entry.hits += 1
+        return entry
+
+    def submit_predict(self, model, image, conf, mode="auto", predict_kwargs=None):
+        """Copia (o decodifica) la imagen en memoria compartida y la encola."""
+        if isinstance(image, DecodedImage):
+            tiled = needs_tiling(image.shape, model.imgsz, mode)
+            shape = image.shape if tiled else image.model_input_shape(model.imgsz)
+        else:
+            image = to_bgr_array(image)
+            tiled = needs_tiling(image.shape, model.imgsz, mode)
+            shape = image.shape
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        finish = None
+        try:
+            buf = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            if isinstance(image, DecodedImage) and not tiled:
+                _, scale, pad = image.model_input(model.imgsz, out=buf)
+                finish = lambda reply: (unletterbox(Detections(*reply[:3], model.names), scale, pad, image.size),
+                                        reply[3])
+            elif isinstance(image, DecodedImage):
+                buf[...] = np.asarray(image.full())[:, :, ::-1]
+            else:
+                buf[...] = image
+            del buf
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        finish = finish or (lambda reply: (Detections(*reply[:3], model.names), reply[3]))
+        message = ("predict", model.path, model.backend, shm.name, shape, conf, tiled, predict_kwargs or {})
+        return self._submit(message, shm=shm, finish=finish)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.size,
+                "threads_per_worker": self.threads,
+                "alive": sum(w.process.is_alive() for w in self._workers),
+                "inflight": [len(w.inflight) for w in self._workers],
+                "restarts": self.restarts,
+                "models": [entry.as_dict() for entry in self._entries.values()],
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            worker.inbox.put(None)
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for job_id in list(self._jobs):
+            self._finish(job_id, False, "El pool de inferencia se cerró")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Pool único del proceso, o None si INFERENCE_WORKERS=0 (inferencia en el propio proceso)."""
+    global _pool
+    if DEFAULT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool()
+            atexit.register(_pool.shutdown)
+        return _pool
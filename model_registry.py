@@ -0,0 +1,159 @@
+"""
+Registro de modelos YOLO compartido por todo el proceso.
+
+Streamlit re-ejecuta app.py en cada interacción, pero los módulos importados
+viven mientras viva el proceso. Este registro carga cada archivo de pesos una
+sola vez, lo calienta con una pasada en vacío y lo comparte entre todas las
+sesiones del navegador.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from inference_backend import DEFAULT_BACKEND, load_model
+
+# Modelos que se mantienen en memoria (soldadura + superficie)
+DEFAULT_CAPACITY = 2
+WARMUP_IMGSZ = 640
+
+
+def file_signature(path):
+    """Clave del modelo: ruta absoluta + mtime + tamaño del archivo."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def process_rss_mb():
+    """Memoria residente del proceso en MB (sin dependencias extra)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss viene en KB en Linux (es el pico, no el actual)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _weights_mb(model):
+    try:
+        params = model.model.parameters()
+        return sum(p.numel() * p.element_size() for p in params) / 1e6
+    except Exception:
+        return None
+
+
+class ModelEntry:
+    """Modelo cargado junto con sus métricas de carga."""
+
+    def __init__(self, key, model, backend, load_s, warmup_s, rss_delta_mb, weights_mb):
+        self.key = key
+        self.model = model
+        self.backend = backend
+        self.load_s = load_s
+        self.warmup_s = warmup_s
+        self.rss_delta_mb = rss_delta_mb
+        self.weights_mb = weights_mb
+        self.hits = 0
+
+    @property
+    def path(self):
+        return self.key[0]
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "backend": self.backend,
+            "load_s": round(self.load_s, 3),
+            "warmup_s": round(self.warmup_s, 3),
+            "rss_delta_mb": round(self.rss_delta_mb, 1),
+            "weights_mb": None if self.weights_mb is None else round(self.weights_mb, 1),
+            "hits": self.hits,
+        }
+
+
+class ModelRegistry:
+    """Caché LRU de modelos YOLO indexada por (ruta, mtime, tamaño, backend)."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, warmup=True, loader=None):
+        self.capacity = capacity
+        self.warmup = warmup
+        self._loader = loader
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load_model(self, path, backend):
+        if self._loader is not None:
+            return self._loader(path, backend)
+        return load_model(path, backend)
+
+    def _load(self, key):
+        rss_before = process_rss_mb()
+        t0 = time.perf_counter()
+        model, backend = self._load_model(key[0], key[3])
+        load_s = time.perf_counter() - t0
+
+        warmup_s = 0.0
+        if self.warmup:
+            # Primera pasada en vacío: inicializa kernels y buffers internos
+            t0 = time.perf_counter()
+            dummy = np.zeros((WARMUP_IMGSZ, WARMUP_IMGSZ, 3), dtype=np.uint8)
+            model.predict(dummy, verbose=False)
+            warmup_s = time.perf_counter() - t0
+
+        rss_delta = process_rss_mb() - rss_before
+        return ModelEntry(key, model, backend, load_s, warmup_s, rss_delta, _weights_mb(model))
+
+    def get(self, path, backend=DEFAULT_BACKEND):
+        """Devuelve el ModelEntry de `path`, cargándolo si hace falta.
+
+        Lanza FileNotFoundError si el archivo no existe.
+        """
+        key = file_signature(path) + (backend,)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # El archivo cambió en disco: descartar la versión anterior
+                for stale in [k for k in self._entries if k[0] == key[0] and k[1:3] != key[1:3]]:
+                    del self._entries[stale]
+                entry = self._load(key)
+                self._entries[key] = entry
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            entry.hits += 1
+            return entry
+
+    def get_model(self, path, backend=DEFAULT_BACKEND):
+        return self.get(path, backend).model
+
+    def evict(self, path):
+        abspath = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == abspath]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return [entry.as_dict() for entry in self._entries.values()]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Registro único del proceso (compartido entre sesiones de Streamlit)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
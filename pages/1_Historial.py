@@ -0,0 +1,84 @@
+import time
+
+import pandas as pd
+import streamlit as st
+
+from ficha_store import get_store
+from report_export import export_bytes
+
+st.set_page_config(
+    page_title="Historial de Inspecciones",
+    page_icon="📚",
+    layout="wide"
+)
+
+st.title("📚 Historial de Inspecciones")
+
+store = get_store()
+
+# Filtros (columnas indexadas)
+with st.form("filtros_historial"):
+    c1, c2, c3, c4 = st.columns(4)
+    soldador = c1.selectbox("Soldador", [""] + store.distinct("soldador"))
+    wps = c2.selectbox("WPS", [""] + store.distinct("wps"))
+    proyecto = c3.selectbox("Proyecto / OT", [""] + store.distinct("proyecto_ot"))
+    veredicto = c4.selectbox("Veredicto", ["", "APROBADO", "RECHAZADO", "ACEPTADO"])
+    c5, c6, c7 = st.columns(3)
+    desde = c5.date_input("Desde", value=None)
+    hasta = c6.date_input("Hasta", value=None)
+    page_size = c7.selectbox("Filas por página", [25, 50, 100, 200], index=1)
+    aplicar = st.form_submit_button("Filtrar")
+
+filters = {
+    "soldador": soldador, "wps": wps, "proyecto_ot": proyecto, "veredicto": veredicto,
+    "fecha_desde": desde.strftime("%Y-%m-%d") if desde else None,
+    # Incluir todo el día final
+    "fecha_hasta": f"{hasta.strftime('%Y-%m-%d')} 23:59" if hasta else None,
+}
+
+# Pila de cursores: [None, cursor_pág_2, cursor_pág_3, ...]
+if aplicar or "hist_cursors" not in st.session_state:
+    st.session_state.hist_cursors = [None]
+cursors = st.session_state.hist_cursors
+
+t0 = time.perf_counter()
+rows, next_cursor = store.query(page_size=page_size, cursor=cursors[-1], **filters)
+total = store.count(**filters)
+elapsed_ms = (time.perf_counter() - t0) * 1000
+
+st.caption(f"{total} inspecciones · página {len(cursors)} · consulta en {elapsed_ms:.1f} ms")
+if rows:
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+else:
+    st.info("No hay inspecciones que cumplan los filtros.")
+
+col_prev, col_next = st.columns(2)
+with col_prev:
+    if st.button("⬅️ Anterior", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+with col_next:
+    if st.button("Siguiente ➡️", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
+with st.expander("📥 Exportar resultados filtrados"):
+    formato = st.selectbox("Formato", ["csv", "xlsx", "pdf"])
+    if st.button("Generar exportación", disabled=total == 0):
+        st.session_state.hist_export = (formato, export_bytes(store.iter_fichas(**filters), formato))
+    if "hist_export" in st.session_state:
+        formato_gen, data = st.session_state.hist_export
+        st.download_button(f"Descargar {formato_gen.upper()}", data=data, file_name=f"historial.{formato_gen}")
+
+st.markdown("---")
+id_cordon = st.text_input("Ver detalle por Código de Cordón")
+if id_cordon:
+    ficha = store.get(id_cordon.strip().upper())
+    if ficha is None:
+        st.warning("Ficha no encontrada.")
+    else:
+        c1, c2 = st.columns(2)
+        c1.json(ficha["manual_data"])
+        c2.json(ficha["auto_data"])
+        if ficha["detecciones"]:
+            st.dataframe(pd.DataFrame(ficha["detecciones"]), use_container_width=True, hide_index=True)
@@ -0,0 +1,64 @@
+import time
+
+import pandas as pd
+import streamlit as st
+
+from analytics_store import DIMENSIONS, TOTAL, get_analytics
+from fichas_config import TRAZABILIDAD_FIELDS
+
+st.set_page_config(
+    page_title="Analítica de Calidad",
+    page_icon="📊",
+    layout="wide"
+)
+
+st.title("📊 Analítica de Calidad")
+
+analytics = get_analytics()
+
+# Mismas etiquetas (y unidades) que el formulario de trazabilidad
+DIMENSION_LABELS = {f["key"]: f["label"] for f in TRAZABILIDAD_FIELDS["manual"] if f["key"] in DIMENSIONS}
+
+c1, c2, c3 = st.columns(3)
+dimension = c1.selectbox("Agrupar por", DIMENSIONS, format_func=DIMENSION_LABELS.get)
+days = c2.number_input("Últimos días", min_value=1, max_value=3650, value=90, step=1)
+min_insp = c3.number_input("Mínimo de inspecciones", min_value=1, value=1, step=1)
+
+# Todas las consultas salen de los rollups precalculados, no de las fichas
+t0 = time.perf_counter()
+rates = analytics.reject_rate(dimension, days=days, min_inspecciones=min_insp)
+totals = analytics.reject_rate(TOTAL, days=days)
+trend = analytics.daily(days=days)
+breakdown = analytics.class_breakdown(dimension, days=days)
+elapsed_ms = (time.perf_counter() - t0) * 1000
+
+total = totals[0] if totals else {"inspecciones": 0, "rechazadas": 0, "defectos": 0, "tasa_rechazo": 0.0}
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("Inspecciones", total["inspecciones"])
+m2.metric("Rechazadas", total["rechazadas"])
+m3.metric("Tasa de rechazo", f"{total['tasa_rechazo']:.1%}")
+m4.metric("Defectos detectados", total["defectos"])
+st.caption(f"Últimos {days} días · consulta en {elapsed_ms:.1f} ms")
+
+if not rates:
+    st.info("No hay inspecciones registradas en el periodo. "
+            "Cargue el historial con `python analytics_store.py --backfill`.")
+    st.stop()
+
+st.subheader(f"Tasa de rechazo por {DIMENSION_LABELS[dimension].lower()}")
+df = pd.DataFrame(rates).rename(columns={"valor": DIMENSION_LABELS[dimension]})
+st.bar_chart(df.set_index(DIMENSION_LABELS[dimension])["tasa_rechazo"])
+st.dataframe(df, use_container_width=True, hide_index=True,
+             column_config={"tasa_rechazo": st.column_config.NumberColumn("Tasa de rechazo", format="percent")})
+
+col_clases, col_tendencia = st.columns(2)
+with col_clases:
+    st.subheader("Defectos por clase")
+    if breakdown:
+        st.dataframe(pd.DataFrame(breakdown).T.fillna(0).astype(int), use_container_width=True)
+    else:
+        st.info("Sin defectos en el periodo.")
+with col_tendencia:
+    st.subheader("Tendencia diaria")
+    if trend:
+        st.line_chart(pd.DataFrame(trend).set_index("dia")[["inspecciones", "rechazadas"]])
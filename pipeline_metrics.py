@@ -0,0 +1,217 @@
+"""
+Tiempos por etapa del pipeline de inspección y métricas estilo Prometheus.
+
+    timer = StageTimer("weld")
+    with timer:
+        with timer.stage("decode"):
+            image = ...
+        with timer.stage("predict"):
+            det = predict_cached(...)   # añade yolo_preprocess / yolo_inference / yolo_postprocess
+    timer.breakdown()                   # [(etapa, ms), ...] para el panel de la barra lateral
+
+Cada etapa se acumula además en histogramas de proceso que se exponen en
+formato de texto Prometheus (`GET /metrics`) mediante un servidor HTTP local
+en un hilo (`start_metrics_server`), de modo que se puede vigilar la latencia
+de todas las estaciones desde un mismo Prometheus. El mismo servidor responde
+`GET /health` con el estado que registre `set_health_check` (warm_start). El costo por etapa es un
+par de `perf_counter()` y una búsqueda de bucket.
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# Límites superiores de los buckets (segundos)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+YOLO_STAGES = {"preprocess": "yolo_preprocess", "inference": "yolo_inference",
+               "postprocess": "yolo_postprocess"}
+
+_current_timer = contextvars.ContextVar("current_stage_timer", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histogramas por (pipeline, etapa) y contadores, compartidos por el proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, pipeline, stage, seconds):
+        with self._lock:
+            hist = self._histograms.get((pipeline, stage))
+            if hist is None:
+                hist = self._histograms[(pipeline, stage)] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def summary(self):
+        """{(pipeline, etapa): (n, media ms)} para la interfaz."""
+        with self._lock:
+            return {key: (h.count, h.sum / h.count * 1000)
+                    for key, h in self._histograms.items() if h.count}
+
+    def render_prometheus(self):
+        lines = ["# HELP inspection_stage_seconds Duración de cada etapa del pipeline de inspección.",
+                 "# TYPE inspection_stage_seconds histogram"]
+        with self._lock:
+            for (pipeline, stage), hist in sorted(self._histograms.items()):
+                labels = f'pipeline="{pipeline}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f'inspection_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'inspection_stage_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"inspection_stage_seconds_sum{{{labels}}} {hist.sum:.6f}")
+                lines.append(f"inspection_stage_seconds_count{{{labels}}} {hist.count}")
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """Registro de métricas único del proceso."""
+    return _registry
+
+
+class StageTimer:
+    """Tiempos de las etapas de una ejecución del pipeline (una inspección)."""
+
+    def __init__(self, pipeline, registry=None):
+        self.pipeline = pipeline
+        self.registry = registry or _registry
+        self.stages = []
+        self._token = None
+        self._t0 = None
+
+    def __enter__(self):
+        self._token = _current_timer.set(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _current_timer.reset(self._token)
+        self.record("total", time.perf_counter() - self._t0)
+        self.registry.inc("inspections_total", pipeline=self.pipeline,
+                          status="error" if exc[0] else "ok")
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def record(self, name, seconds):
+        self.stages.append((name, seconds * 1000))
+        self.registry.observe(self.pipeline, name, seconds)
+
+    def breakdown(self):
+        return [(name, round(ms, 1)) for name, ms in self.stages]
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+def observe_yolo_speed(speed):
+    """Registra el desglose de `Results.speed` (ms) de ultralytics en el timer activo."""
+    timer = _current_timer.get()
+    if timer is None or not speed:
+        return
+    for key, stage in YOLO_STAGES.items():
+        if speed.get(key) is not None:
+            timer.record(stage, speed[key] / 1000)
+
+
+def count(name, **labels):
+    """Incrementa un contador (con el pipeline del timer activo, si lo hay)."""
+    timer = _current_timer.get()
+    if timer is not None:
+        labels.setdefault("pipeline", timer.pipeline)
+    _registry.inc(name, **labels)
+
+
+_health_check = None
+
+
+def set_health_check(fn):
+    """`fn()` -> dict con "ready"; se sirve en GET /health (200 si está listo, 503 si no)."""
+    global _health_check
+    _health_check = fn
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, _registry.render_prometheus().encode(),
+                       "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/health":
+            status = _health_check() if _health_check else {"ready": True}
+            self._send(200 if status.get("ready") else 503,
+                       json.dumps(status, ensure_ascii=False).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Levanta `GET /metrics` en un hilo (una vez por proceso). Devuelve el puerto o None."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                print(f"No se pudo abrir el endpoint de métricas en {host}:{port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server.server_address[1]
@@ -0,0 +1,84 @@
+"""
+Post-proceso vectorizado de detecciones.
+
+Para cada modelo se construye una sola vez una tabla clase -> campo de la
+ficha (def_*). El conteo de toda la imagen es entonces un `np.bincount`
+sobre el vector de clases, sin recorrer las cajas en Python ni comparar
+listas de alias por cada campo.
+"""
+import threading
+
+import numpy as np
+
+# Alias de nombres de clase por campo de Defectología
+# (ajustar según las clases reales del modelo)
+DEFECT_ALIASES = {
+    'def_poros': ['Porosity', 'Poros', 'Poro'],
+    'def_porosidad_lineal': ['Linear Porosity'],
+    'def_socavado': ['Undercut', 'Socavado'],
+    'def_grietas': ['Crack', 'Grieta'],
+    'def_falta_fusion': ['Lack of Fusion', 'Falta Fusion'],
+    'def_exceso_refuerzo': ['Excess Reinforcement'],
+    'def_mordeduras': ['Bite', 'Mordedura'],
+    'def_spatter': ['Spatter', 'Spatters'],
+    'def_irregular': ['Irregular', 'Bad Bead', 'Bad Welding'],
+}
+DEFECT_FIELDS = list(DEFECT_ALIASES)
+
+
+class ClassIndex:
+    """Tablas de búsqueda precalculadas para el diccionario `names` de un modelo."""
+
+    def __init__(self, names):
+        num_classes = max(names) + 1 if names else 0
+        self.names = dict(names)
+        self.class_names = np.array([names.get(i, str(i)) for i in range(num_classes)], dtype=object)
+        alias_to_field = {alias: i for i, aliases in enumerate(DEFECT_ALIASES.values()) for alias in aliases}
+        # Índice len(DEFECT_FIELDS) = clase sin campo asociado (p. ej. 'Good Welding')
+        self.field_lut = np.array(
+            [alias_to_field.get(name, len(DEFECT_FIELDS)) for name in self.class_names], dtype=np.int64)
+
+    def class_counts(self, cls):
+        """Vector de conteos por id de clase."""
+        return np.bincount(np.asarray(cls, dtype=np.int64), minlength=len(self.class_names))
+
+    def counts_by_name(self, cls):
+        counts = self.class_counts(cls)
+        nonzero = np.flatnonzero(counts)
+        return {self.class_names[i]: int(counts[i]) for i in nonzero}
+
+    def field_counts(self, cls):
+        """{campo def_*: conteo} para todos los campos, con un solo bincount."""
+        counts = np.bincount(self.field_lut[np.asarray(cls, dtype=np.int64)],
+                             minlength=len(DEFECT_FIELDS) + 1)
+        return dict(zip(DEFECT_FIELDS, counts[:-1].tolist()))
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def get_class_index(names):
+    """ClassIndex cacheado por diccionario de clases (uno por modelo)."""
+    key = tuple(sorted(names.items()))
+    with _indices_lock:
+        index = _indices.get(key)
+        if index is None:
+            index = _indices[key] = ClassIndex(names)
+        return index
+
+
+def format_defect_fields(field_counts):
+    """Textos de la Ficha de Defectología a partir de los conteos por campo."""
+    c = field_counts
+    return {
+        'def_poros': f"{c['def_poros']} detectados",
+        'def_porosidad_lineal': "No detectada" if c['def_porosidad_lineal'] == 0 else "Detectada",
+        'def_socavado': f"{c['def_socavado']} zonas",
+        'def_grietas': f"{c['def_grietas']} detectadas",
+        'def_falta_fusion': f"{c['def_falta_fusion']} zonas",
+        'def_exceso_refuerzo': f"{c['def_exceso_refuerzo']} zonas",
+        'def_mordeduras': f"{c['def_mordeduras']} detectadas",
+        'def_spatter': "Alto" if c['def_spatter'] > 5 else ("Bajo" if c['def_spatter'] > 0 else "Nulo"),
+        'def_irregular': "Detectado" if c['def_irregular'] > 0 else "No detectado",
+    }
@@ -0,0 +1,239 @@
+"""
+Cuantización INT8 post-entrenamiento (ONNX Runtime) con reporte FP32 vs INT8.
+
+    python quantize_model.py                    # modelo de superficie, todas las clases de GC10
+    python quantize_model.py --weights models/welding_model.pt \\
+        --data <dataset_soldadura>/data.yaml --critical Crack Porosity --max-drop 0.02
+
+Sin --critical, todas las clases del data.yaml son críticas.
+
+Pasos:
+    1. Exporta (o reutiliza) el .onnx FP32 junto al .pt.
+    2. Calibra con una muestra de imágenes del split de entrenamiento (nunca
+       con las de validación, que son las que se evalúan) y genera un modelo
+       INT8 estático (QDQ, pesos por canal).
+    3. Evalúa ambos modelos con `YOLO.val` (mAP50, mAP50-95, recall por clase)
+       y mide la latencia en CPU.
+    4. Solo si la caída en las clases críticas está dentro del presupuesto,
+       publica el modelo como <nombre>_int8.onnx. Una clase crítica sin
+       instancias en validación rechaza el modelo (el presupuesto no se puede
+       comprobar); una que no existe en el dataset aborta antes de exportar.
+       El reporte se guarda en JSON.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from glob import glob
+
+import cv2
+import numpy as np
+import yaml
+
+from image_decode import letterbox
+from inference_backend import EXPORT_IMGSZ, ensure_onnx
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def _to_tensor(img_bgr, size):
+    # Mismo pre-proceso que ultralytics: letterbox, BGR->RGB, HWC->CHW, /255
+    canvas, _, _ = letterbox(img_bgr, size)
+    img = canvas[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(img, dtype=np.float32)[None] / 255.0
+
+
+def sample_images(image_dir, n, seed=42):
+    files = sorted(f for f in glob(os.path.join(image_dir, "**", "*"), recursive=True)
+                   if f.lower().endswith(IMAGE_EXTENSIONS))
+    random.Random(seed).shuffle(files)
+    return files[:n]
+
+
+def load_data_yaml(data_yaml):
+    with open(data_yaml) as f:
+        return yaml.safe_load(f)
+
+
+def split_images_dir(data_yaml, split="val"):
+    data = load_data_yaml(data_yaml)
+    root = data.get('path') or os.path.dirname(os.path.abspath(data_yaml))
+    return os.path.join(root, data[split])
+
+
+def dataset_class_names(data_yaml):
+    names = load_data_yaml(data_yaml).get('names', [])
+    return list(names.values()) if isinstance(names, dict) else list(names)
+
+
+def critical_classes(data_yaml, critical=None):
+    """Clases críticas a vigilar: las indicadas (deben existir en el dataset) o todas."""
+    names = dataset_class_names(data_yaml)
+    if critical is None:
+        return names
+    unknown = [c for c in critical if c not in names]
+    if unknown:
+        raise SystemExit(f"Clases críticas que no existen en {data_yaml}: {', '.join(unknown)} "
+                         f"(disponibles: {', '.join(names)})")
+    return list(critical)
+
+
+def _head_nodes_to_exclude(onnx_path):
+    """Nodos de decodificación de cajas del último bloque (Detect) que se dejan en FP32.
+
+    Cuantizar la concatenación/DFL final degrada mucho la precisión de las
+    coordenadas y apenas aporta velocidad.
+    """
+    import onnx
+    graph = onnx.load(onnx_path).graph
+    indices = [int(m.group(1)) for n in graph.node for m in [re.match(r"/model\.(\d+)/", n.name)] if m]
+    if not indices:
+        return []
+    head = f"/model.{max(indices)}/"
+    return [n.name for n in graph.node if n.name.startswith(head) and n.op_type != "Conv"]
+
+
+def quantize_int8(fp32_path, int8_path, calib_files, imgsz):
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self, files, input_name):
+            self._files = iter(files)
+            self._input_name = input_name
+
+        def get_next(self):
+            for path in self._files:
+                img = cv2.imread(path)
+                if img is not None:
+                    return {self._input_name: _to_tensor(img, imgsz)}
+            return None
+
+    import onnxruntime as ort
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    quantize_static(
+        fp32_path, int8_path, ImageReader(calib_files, input_name),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=_head_nodes_to_exclude(fp32_path),
+    )
+    return int8_path
+
+
+def evaluate(model_path, data_yaml, imgsz, latency_files, runs=3):
+    """mAP, recall por clase y latencia de un modelo ONNX en CPU."""
+    from ultralytics import YOLO
+    model = YOLO(model_path, task="detect")
+    metrics = model.val(data=data_yaml, imgsz=imgsz, batch=1, device="cpu", plots=False, verbose=False)
+    names = metrics.names
+    recall = {names[int(c)]: round(float(r), 4) for c, r in zip(metrics.box.ap_class_index, metrics.box.r)}
+
+    images = [img for img in (cv2.imread(f) for f in latency_files) if img is not None]
+    model.predict(images[0], imgsz=imgsz, verbose=False)  # warm-up
+    times = []
+    for _ in range(runs):
+        for img in images:
+            t0 = time.perf_counter()
+            model.predict(img, imgsz=imgsz, verbose=False)
+            times.append((time.perf_counter() - t0) * 1000)
+    return {
+        "model": model_path,
+        "map50": round(float(metrics.box.map50), 4),
+        "map50_95": round(float(metrics.box.map), 4),
+        "recall": recall,
+        "latency_p50_ms": round(float(np.percentile(times, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(times, 95)), 2),
+        "size_mb": round(os.path.getsize(model_path) / 1e6, 2),
+    }
+
+
+def check_budget(fp32, int8, critical, max_drop):
+    """Lista de violaciones del presupuesto de precisión (vacía = OK)."""
+    violations = []
+    drop = fp32["map50"] - int8["map50"]
+    if drop > max_drop:
+        violations.append(f"mAP50 cae {drop:.4f} (> {max_drop})")
+    for name in critical:
+        if name not in fp32["recall"]:
+            # Sin instancias en validación no hay recall que comparar: se rechaza
+            violations.append(f"clase crítica {name} sin instancias en validación")
+            continue
+        drop = fp32["recall"][name] - int8["recall"].get(name, 0.0)
+        if drop > max_drop:
+            violations.append(f"recall de {name} cae {drop:.4f} (> {max_drop})")
+    return violations
+
+
+def print_report(fp32, int8):
+    print("\n" + "=" * 60)
+    print(f"{'Métrica':<28}{'FP32':>14}{'INT8':>14}")
+    print("-" * 60)
+    for key in ["map50", "map50_95", "latency_p50_ms", "latency_p95_ms", "size_mb"]:
+        print(f"{key:<28}{fp32[key]:>14}{int8[key]:>14}")
+    for name in fp32["recall"]:
+        print(f"{'recall ' + name:<28}{fp32['recall'][name]:>14}{int8['recall'].get(name, '-'):>14}")
+    print("=" * 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cuantización INT8 con reporte de precisión/latencia.")
+    parser.add_argument("--weights", default="models/surface_model.pt", help="Pesos .pt (o .onnx FP32)")
+    parser.add_argument("--data", default="gc10_yolo_dataset/data.yaml", help="data.yaml para validación")
+    parser.add_argument("--calib-images", default=None,
+                        help="Directorio de calibración (por defecto, el split train; no puede ser el de validación)")
+    parser.add_argument("--calib-size", type=int, default=200, help="Imágenes de calibración")
+    parser.add_argument("--latency-images", type=int, default=20, help="Imágenes para medir latencia")
+    parser.add_argument("--imgsz", type=int, default=EXPORT_IMGSZ)
+    parser.add_argument("--critical", nargs="+", default=None,
+                        help="Clases críticas (por defecto, todas las del data.yaml)")
+    parser.add_argument("--max-drop", type=float, default=0.02, help="Caída absoluta máxima permitida")
+    parser.add_argument("--report", default=None, help="Ruta del reporte JSON")
+    args = parser.parse_args(argv)
+
+    critical = critical_classes(args.data, args.critical)
+    calib_dir = args.calib_images or split_images_dir(args.data, "train")
+    if os.path.abspath(calib_dir) == os.path.abspath(split_images_dir(args.data, "val")):
+        raise SystemExit("La calibración debe usar imágenes distintas de las de validación")
+
+    fp32_path = ensure_onnx(args.weights, args.imgsz) if args.weights.endswith(".pt") else args.weights
+    stem = os.path.splitext(fp32_path)[0]
+    candidate_path = f"{stem}_int8.candidate.onnx"
+    final_path = f"{stem}_int8.onnx"
+
+    calib_files = sample_images(calib_dir, args.calib_size)
+    if not calib_files:
+        raise SystemExit(f"No hay imágenes de calibración en {calib_dir}")
+    print(f"Calibrando con {len(calib_files)} imágenes de {calib_dir}...")
+    quantize_int8(fp32_path, candidate_path, calib_files, args.imgsz)
+
+    latency_files = calib_files[:args.latency_images]
+    fp32 = evaluate(fp32_path, args.data, args.imgsz, latency_files)
+    int8 = evaluate(candidate_path, args.data, args.imgsz, latency_files)
+    print_report(fp32, int8)
+
+    violations = check_budget(fp32, int8, critical, args.max_drop)
+
+    report = {"fp32": fp32, "int8": int8, "critical": critical,
+              "max_drop": args.max_drop, "violations": violations, "accepted": not violations}
+    if not violations:
+        os.replace(candidate_path, final_path)
+        report["int8"]["model"] = final_path
+        print(f"INT8 aceptado: {final_path}")
+    else:
+        print("INT8 rechazado:\n  - " + "\n  - ".join(violations))
+
+    report_path = args.report or f"{stem}_int8_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Reporte guardado en {report_path}")
+    return 0 if not violations else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
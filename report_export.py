@@ -0,0 +1,381 @@
+"""
+Exportación de fichas a CSV, XLSX y PDF.
+
+    python report_export.py --format xlsx -o historial.xlsx --soldador S-12
+    python report_export.py --format pdf -o cordon.pdf --id-cordon 1A2B3C4D
+
+Las columnas salen de `fichas_config`, de modo que la exportación sigue al
+esquema de la interfaz. La plantilla `Fichas tecnicas (1).xlsx` se lee una
+sola vez en modo solo-lectura para ubicar sus celdas a completar (`____`) y
+esa disposición queda cacheada. Las exportaciones masivas (CSV, XLSX en modo
+write-only y PDF) se escriben ficha a ficha, con memoria constante
+independientemente de cuántas fichas históricas se exporten.
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import threading
+import unicodedata
+
+import fichas_config as fc
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Fichas tecnicas (1).xlsx")
+PLACEHOLDER_PREFIX = "__"
+STATUS_PLACEHOLDER = "A / R"
+
+FICHA_GROUPS = [
+    ("Ficha de Trazabilidad", fc.TRAZABILIDAD_FIELDS),
+    ("Ficha de Geometría de Cordón", fc.GEOMETRIA_FIELDS),
+    ("Ficha de Defectología", fc.DEFECTOLOGIA_FIELDS),
+    ("Ficha de Dimensionalidad", fc.DIMENSIONALIDAD_FIELDS),
+]
+
+# Etiquetas de la plantilla (normalizadas) -> clave de la ficha
+TEMPLATE_LABELS = {
+    # Trazabilidad
+    "soldador": "soldador", "maquina de soldar": "maquina", "proceso": "proceso",
+    "wps aplicado": "wps", "material base": "material_base", "consumible": "consumible",
+    "voltaje (v)": "voltaje", "corriente (a)": "amperaje", "velocidad de avance": "velocidad",
+    "caudal de gas": "gas", "temperatura ambiente": "temp_amb",
+    # Geometría
+    "distancia camara-pieza": "distancia_camara", "tipo de junta": "tipo_junta",
+    "ancho promedio (w)": "ancho_promedio", "altura del refuerzo (h)": "altura_refuerzo",
+    "radio de curvatura": "radio_curvatura", "simetria del cordon": "simetria",
+    "angulo de mojado l": "angulo_mojado_l", "angulo de mojado r": "angulo_mojado_r",
+    "rugosidad aparente": "rugosidad", "secciones criticas": "secciones_criticas",
+    # Defectología
+    "norma de referencia": "norma", "material": "material_base",
+    "poros": "def_poros", "porosidad lineal": "def_porosidad_lineal",
+    "socavado (undercut)": "def_socavado", "grietas superficiales": "def_grietas",
+    "falta de fusion": "def_falta_fusion", "exceso de refuerzo": "def_exceso_refuerzo",
+    "mordeduras": "def_mordeduras", "spatter excesivo": "def_spatter",
+    "cordon irregular": "def_irregular",
+    # Dimensionalidad
+    "componente/spool /pipe:": "componente", "numero de junta:": "num_junta",
+    "soldador:": "soldador", "fecha:": "fecha", "proyecto / ot": "proyecto_ot",
+    "material de aporte": "consumible", "preparacion de la junta": "prep_junta",
+    "longitud total a soldar": "longitud_total",
+    "ancho del cordon (w)": "dim_ancho", "angulo de mojado lado izquierdo": "dim_angulo_l",
+    "angulo de mojado lado derecho": "dim_angulo_r", "uniformidad del cordon": "dim_uniformidad",
+    "rectitud / alineamiento": "dim_rectitud", "penetracion visible": "dim_penetracion",
+}
+# En la hoja de Dimensionalidad la altura es la de la ficha dimensional
+SHEET_LABEL_OVERRIDES = {
+    ("Ficha de Dimensionalidad", "altura del refuerzo (h)"): "dim_altura",
+}
+# Valores de defectos que significan "aceptado"
+NO_DEFECT_VALUES = {"No detectada", "No detectado", "Nulo"}
+
+
+def normalize_label(text):
+    text = unicodedata.normalize("NFKD", str(text).replace("–", "-"))
+    return " ".join(text.encode("ascii", "ignore").decode().lower().split())
+
+
+def export_columns():
+    """[(clave, etiqueta)] de todas las fichas, en el orden de fichas_config."""
+    columns = [("id_cordon", "Código Único de Cordón"), ("fecha", "Fecha"),
+               ("veredicto", "Dictamen Final")]
+    seen = {key for key, _ in columns}
+    for _, group in FICHA_GROUPS:
+        for field in group["manual"] + group["automatic"]:
+            if field["key"] not in seen:
+                seen.add(field["key"])
+                columns.append((field["key"], field["label"]))
+    columns.append(("observaciones", "Observaciones del Inspector"))
+    return columns
+
+
+def ficha_value(ficha, key):
+    manual = ficha.get("manual_data", {})
+    auto = ficha.get("auto_data", {})
+    if key == "id_cordon":
+        return ficha.get("id_cordon", auto.get("id_cordon", ""))
+    if key == "fecha":
+        return ficha.get("fecha", "")
+    if key == "veredicto":
+        return manual.get("veredicto_final") or auto.get("aprobacion_final", "")
+    value = manual.get(key, auto.get(key, ""))
+    return "" if value is None else value
+
+
+def defect_status(value):
+    """'A' (aceptado) / 'R' (rechazado) para una celda de defecto."""
+    text = str(value).strip()
+    if not text or text in NO_DEFECT_VALUES or text.startswith("0 "):
+        return "A"
+    return "R"
+
+
+# --- Plantilla -------------------------------------------------------------
+
+class TemplateLayout:
+    """Celdas a completar de la plantilla: [(hoja, celda, clave, es_estado)]."""
+
+    def __init__(self, path):
+        from openpyxl import load_workbook
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.slots = []
+        with open(path, "rb") as f:
+            self.template_bytes = f.read()
+        wb = load_workbook(io.BytesIO(self.template_bytes), read_only=True)
+        try:
+            for ws in wb.worksheets:
+                for row in ws.iter_rows():
+                    self._scan_row(ws.title, [c for c in row if getattr(c, "value", None) is not None])
+        finally:
+            wb.close()
+
+    def _scan_row(self, sheet, cells):
+        labels = []
+        last_key = None
+        for cell in cells:
+            value = str(cell.value).strip()
+            if value.startswith(PLACEHOLDER_PREFIX):
+                # Etiqueta = primer texto reconocido desde el marcador anterior
+                key = next(filter(None, (self._key(sheet, label) for label in labels)), None)
+                if key:
+                    self.slots.append((sheet, cell.coordinate, key, False))
+                last_key, labels = key, []
+            elif value == STATUS_PLACEHOLDER:
+                if last_key:
+                    self.slots.append((sheet, cell.coordinate, last_key, True))
+            elif value.endswith(":"):
+                # Encabezado "Etiqueta:" -> el valor se escribe en la misma celda
+                key = self._key(sheet, value)
+                if key:
+                    self.slots.append((sheet, cell.coordinate, key, None))
+                labels = []
+            else:
+                labels.append(value)
+
+    @staticmethod
+    def _key(sheet, label):
+        if label is None:
+            return None
+        norm = normalize_label(label)
+        return SHEET_LABEL_OVERRIDES.get((sheet, norm), TEMPLATE_LABELS.get(norm))
+
+
+_layout = None
+_layout_lock = threading.Lock()
+
+
+def get_template_layout(path=TEMPLATE_PATH):
+    """Disposición de la plantilla, leída una vez y recargada solo si cambia."""
+    global _layout
+    with _layout_lock:
+        if _layout is None or _layout.path != path or _layout.mtime != os.path.getmtime(path):
+            _layout = TemplateLayout(path)
+        return _layout
+
+
+def fill_template(ficha, path=TEMPLATE_PATH):
+    """XLSX (bytes) con la plantilla oficial completada para una ficha."""
+    from openpyxl import load_workbook
+    layout = get_template_layout(path)
+    wb = load_workbook(io.BytesIO(layout.template_bytes))
+    for sheet, coord, key, is_status in layout.slots:
+        cell = wb[sheet][coord]
+        value = ficha_value(ficha, key)
+        if is_status is None:
+            cell.value = f"{cell.value} {value}"
+        elif is_status:
+            cell.value = defect_status(value)
+        else:
+            cell.value = value
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+# --- Exportación masiva (streaming) -----------------------------------------
+
+def write_csv(fichas, out):
+    """Escribe las fichas (iterable) como CSV en el stream de texto `out`."""
+    columns = export_columns()
+    writer = csv.writer(out)
+    writer.writerow([label for _, label in columns])
+    count = 0
+    for ficha in fichas:
+        writer.writerow([ficha_value(ficha, key) for key, _ in columns])
+        count += 1
+    return count
+
+
+def write_xlsx(fichas, out):
+    """XLSX write-only: una fila por ficha, con memoria constante."""
+    from openpyxl import Workbook
+    columns = export_columns()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Fichas")
+    ws.append([label for _, label in columns])
+    count = 0
+    for ficha in fichas:
+        ws.append([ficha_value(ficha, key) for key, _ in columns])
+        count += 1
+    wb.save(out)
+    return count
+
+
+class PdfWriter:
+    """Escritor PDF mínimo (texto Helvetica, A4) que emite página a página.
+
+    Solo mantiene en memoria los desplazamientos del índice (xref), no el
+    contenido ya escrito.
+    """
+
+    WIDTH, HEIGHT = 595, 842
+    MARGIN = 50
+    LINE = 14
+
+    def __init__(self, out):
+        self.out = out
+        self.offsets = []
+        self.pages = []
+        self.pos = 0
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # Objetos reservados: 1 catálogo, 2 árbol de páginas, 3 fuente normal, 4 negrita
+        self.offsets = [None] * 4
+        self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self._object(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        self._lines = []
+
+    def _write(self, data):
+        self.out.write(data)
+        self.pos += len(data)
+
+    def _object(self, num, body):
+        while len(self.offsets) < num:
+            self.offsets.append(None)
+        self.offsets[num - 1] = self.pos
+        self._write(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    @staticmethod
+    def _escape(text):
+        text = str(text).encode("cp1252", "replace").decode("cp1252")
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    def text(self, line, bold=False, size=10):
+        max_lines = (self.HEIGHT - 2 * self.MARGIN) // self.LINE
+        if len(self._lines) >= max_lines:
+            self.new_page()
+        self._lines.append((line, bold, size))
+
+    def new_page(self):
+        if not self._lines:
+            return
+        ops = ["BT"]
+        y = self.HEIGHT - self.MARGIN
+        for line, bold, size in self._lines:
+            font = "/F2" if bold else "/F1"
+            ops.append(f"{font} {size} Tf 1 0 0 1 {self.MARGIN} {y} Tm ({self._escape(line)}) Tj")
+            y -= self.LINE
+        ops.append("ET")
+        content = "\n".join(ops).encode("cp1252", "replace")
+        content_num = len(self.offsets) + 1
+        self._object(content_num, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        page_num = len(self.offsets) + 1
+        self._object(page_num, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.WIDTH} {self.HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_num} 0 R >>").encode())
+        self.pages.append(page_num)
+        self._lines = []
+
+    def close(self):
+        self.new_page()
+        kids = " ".join(f"{p} 0 R" for p in self.pages)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode())
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_pos = self.pos
+        lines = [f"xref\n0 {len(self.offsets) + 1}\n", "0000000000 65535 f \n"]
+        lines += [f"{off:010d} 00000 n \n" for off in self.offsets]
+        lines.append(f"trailer\n<< /Size {len(self.offsets) + 1} /Root 1 0 R >>\n"
+                     f"startxref\n{xref_pos}\n%%EOF\n")
+        self._write("".join(lines).encode())
+
+
+def write_pdf(fichas, out):
+    """PDF con una sección por ficha (sus cuatro fichas técnicas)."""
+    pdf = PdfWriter(out)
+    count = 0
+    for ficha in fichas:
+        if count:
+            pdf.new_page()
+        pdf.text(f"Reporte de Inspección - Cordón {ficha_value(ficha, 'id_cordon')}", bold=True, size=14)
+        pdf.text(f"Fecha: {ficha_value(ficha, 'fecha')}    Dictamen: {ficha_value(ficha, 'veredicto')}")
+        for title, group in FICHA_GROUPS:
+            pdf.text("")
+            pdf.text(title, bold=True, size=12)
+            for field in group["manual"] + group["automatic"]:
+                pdf.text(f"{field['label']}: {ficha_value(ficha, field['key']) or '-'}")
+        observaciones = ficha_value(ficha, "observaciones")
+        if observaciones:
+            pdf.text("")
+            pdf.text(f"Observaciones: {observaciones}")
+        count += 1
+    pdf.close()
+    return count
+
+
+def export_bytes(fichas, fmt):
+    """Exportación en memoria (para descargas de la UI)."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        write_csv(fichas, buf)
+        return buf.getvalue().encode("utf-8-sig")
+    buf = io.BytesIO()
+    if fmt == "xlsx":
+        write_xlsx(fichas, buf)
+    elif fmt == "pdf":
+        write_pdf(fichas, buf)
+    else:
+        raise ValueError(f"Formato desconocido: {fmt}")
+    return buf.getvalue()
+
+
+def main(argv=None):
+    from ficha_store import DEFAULT_DB_PATH, FichaStore
+
+    parser = argparse.ArgumentParser(description="Exportación de fichas a CSV / XLSX / PDF.")
+    parser.add_argument("--format", choices=["csv", "xlsx", "pdf", "template"], default="csv",
+                        help="'template' completa la plantilla oficial para una sola ficha")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--id-cordon", default=None)
+    for column in ["soldador", "wps", "proyecto_ot", "veredicto", "fecha_desde", "fecha_hasta"]:
+        parser.add_argument(f"--{column.replace('_', '-')}", dest=column, default=None)
+    args = parser.parse_args(argv)
+
+    store = FichaStore(args.db)
+    if args.id_cordon:
+        ficha = store.get(args.id_cordon)
+        if ficha is None:
+            raise SystemExit(f"Ficha no encontrada: {args.id_cordon}")
+        fichas = iter([ficha])
+    else:
+        filters = {k: getattr(args, k) for k in
+                   ["soldador", "wps", "proyecto_ot", "veredicto", "fecha_desde", "fecha_hasta"]}
+        fichas = store.iter_fichas(**filters)
+
+    if args.format == "template":
+        ficha = next(fichas, None)
+        if ficha is None:
+            raise SystemExit("Ninguna ficha cumple los filtros")
+        with open(args.output, "wb") as f:
+            f.write(fill_template(ficha))
+        count = 1
+    elif args.format == "csv":
+        with open(args.output, "w", encoding="utf-8-sig", newline="") as f:
+            count = write_csv(fichas, f)
+    else:
+        with open(args.output, "wb") as f:
+            count = (write_xlsx if args.format == "xlsx" else write_pdf)(fichas, f)
+    print(f"{count} fichas exportadas a {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
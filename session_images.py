@@ -0,0 +1,104 @@
+"""
+Imágenes anotadas compactas para el estado de sesión de Streamlit.
+
+En lugar de guardar la imagen anotada a resolución completa (un array RGB
+sin comprimir por sesión), se conservan las detecciones (arrays de cajas),
+una vista previa anotada en WebP a tamaño de pantalla y una copia de
+detalle sin anotar en JPEG (codifica ~30 veces más rápido que WebP en el
+paso de análisis) con el lado mayor acotado a DETAIL_MAX_SIDE; no los bytes
+originales, que en PNG o fotos grandes ocupan varias veces más. La versión anotada de detalle se genera solo cuando se
+pide y no se guarda.
+"""
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from detections import Detections
+from image_decode import DecodedImage
+from model_registry import process_rss_mb
+
+DISPLAY_MAX_SIDE = 1280
+DISPLAY_FORMAT = ".webp"
+DISPLAY_QUALITY = 80
+DETAIL_MAX_SIDE = 3072
+DETAIL_FORMAT = ".jpg"
+DETAIL_QUALITY = 90
+
+
+def encode_rgb(rgb, ext=DISPLAY_FORMAT, quality=DISPLAY_QUALITY):
+    """Comprime un array RGB a bytes JPEG/WebP/PNG."""
+    params = {".jpg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+              ".webp": [cv2.IMWRITE_WEBP_QUALITY, quality]}.get(ext, [])
+    ok, buf = cv2.imencode(ext, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise ValueError(f"No se pudo codificar la imagen como {ext}")
+    return buf.tobytes()
+
+
+class AnnotatedImage:
+    """Vista previa anotada + copia de detalle acotada + detecciones de una inspección."""
+
+    __slots__ = ("detail", "detail_scale", "detections", "preview", "preview_size", "scale")
+
+    def __init__(self, source, detections, max_side=DISPLAY_MAX_SIDE, detail_max_side=DETAIL_MAX_SIDE):
+        """`source`: bytes del archivo subido o DecodedImage (cajas en sus coordenadas)."""
+        decoded = source if isinstance(source, DecodedImage) else DecodedImage(source)
+        self.detections = detections
+        # Decodificaciones reducidas (modo draft) y orientadas según EXIF
+        img, self.scale = decoded.reduced(max_side)
+        self.preview_size = img.size
+        self.preview = encode_rgb(detections.scaled(self.scale).plot(np.asarray(img)))
+        img, self.detail_scale = decoded.reduced(detail_max_side)
+        self.detail = encode_rgb(np.asarray(img), DETAIL_FORMAT, DETAIL_QUALITY)
+
+    @property
+    def nbytes(self):
+        return len(self.detail) + len(self.preview) + self.detections.nbytes
+
+    def render_full(self, ext=".jpg", quality=90):
+        """Imagen anotada a resolución de detalle (bytes); no se conserva."""
+        bgr = cv2.imdecode(np.frombuffer(self.detail, np.uint8), cv2.IMREAD_COLOR)
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        return encode_rgb(self.detections.scaled(self.detail_scale).plot(rgb), ext, quality)
+
+
+def _sizeof(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, AnnotatedImage):
+        # Las detecciones suelen ser las mismas que guarda la ficha: contarlas una vez
+        return len(obj.detail) + len(obj.preview) + _sizeof(obj.detections, seen)
+    if isinstance(obj, Detections):
+        return obj.nbytes
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, Image.Image):
+        return obj.width * obj.height * len(obj.getbands())
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(_sizeof(v, seen) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def session_memory_report(state):
+    """Bytes aproximados por clave del estado de sesión, de mayor a menor."""
+    seen = set()
+    sizes = {str(key): _sizeof(state[key], seen) for key in list(state.keys())}
+    return dict(sorted(sizes.items(), key=lambda kv: -kv[1]))
+
+
+def capacity_estimate(session_bytes, budget_mb, base_rss_mb=None):
+    """Inspectores concurrentes que caben en `budget_mb` de memoria del contenedor.
+
+    `base_rss_mb` es el consumo fijo del proceso (modelos, librerías); por
+    defecto, la memoria residente actual.
+    """
+    base = process_rss_mb() if base_rss_mb is None else base_rss_mb
+    per_session_mb = max(session_bytes / 1e6, 1e-3)
+    return max(0, int((budget_mb - base) // per_session_mb))
@@ -0,0 +1,288 @@
+"""
+Inspección continua de un cordón a partir de video o cámara.
+
+    python stream_inspect.py --source recorrido.mp4 --distancia-camara 250 -o ficha.json
+    python stream_inspect.py --source 0            # cámara local
+
+Un hilo productor decodifica los cuadros y descarta los casi duplicados
+mediante un hash perceptual (dHash). El hilo principal ejecuta la detección
+en lotes sobre los cuadros restantes mientras el productor sigue leyendo.
+El desplazamiento de la cámara entre cuadros se estima por correlación de
+fase y cada detección se ubica en coordenadas globales del cordón; el
+seguimiento asocia las detecciones de un mismo defecto físico para contarlo
+una sola vez. El resultado es una ficha agregada con la posición de cada
+defecto a lo largo del cordón.
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from bead_geometry import mm_per_pixel
+from defect_map import BEAD_CLASSES, DefectMap
+from detections import Detections
+from ficha_store import new_id_cordon
+from inference_backend import BACKENDS, DEFAULT_BACKEND
+from model_registry import get_registry
+from weld_analysis import build_auto_data, count_defects
+
+HASH_SIZE = 8
+# Distancia de Hamming (sobre 64 bits) por debajo de la cual un cuadro es duplicado
+DUPLICATE_THRESHOLD = 4
+MOTION_SIZE = 256
+
+
+def dhash(gray, size=HASH_SIZE):
+    """Hash de diferencias (64 bits) de una imagen en escala de grises."""
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class FrameReader(threading.Thread):
+    """Productor: decodifica, salta cuadros y descarta duplicados."""
+
+    def __init__(self, source, frame_step=1, dup_threshold=DUPLICATE_THRESHOLD, max_queue=32):
+        super().__init__(daemon=True)
+        self.source = int(source) if str(source).isdigit() else source
+        self.frame_step = max(1, frame_step)
+        self.dup_threshold = dup_threshold
+        self.frames = queue.Queue(maxsize=max_queue)
+        self.read = 0
+        self.duplicates = 0
+        self.fps = None
+        self.error = None
+
+    def run(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            self.error = f"No se pudo abrir la fuente: {self.source}"
+            self.frames.put(None)
+            return
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or None
+        last_hash = None
+        index = -1
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                index += 1
+                self.read += 1
+                if index % self.frame_step:
+                    continue
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                h = dhash(gray)
+                if last_hash is not None and hamming(h, last_hash) <= self.dup_threshold:
+                    self.duplicates += 1
+                    continue
+                last_hash = h
+                self.frames.put((index, frame, gray))
+        finally:
+            cap.release()
+            self.frames.put(None)
+
+
+class MotionEstimator:
+    """Desplazamiento acumulado de la cámara (px) por correlación de fase."""
+
+    def __init__(self, size=MOTION_SIZE):
+        self.size = size
+        self.offset = np.zeros(2)
+        self._prev = None
+        self._scale = 1.0
+
+    def update(self, gray):
+        h, w = gray.shape
+        self._scale = min(1.0, self.size / max(h, w))
+        small = cv2.resize(gray, (round(w * self._scale), round(h * self._scale)),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+        if self._prev is not None and self._prev.shape == small.shape:
+            window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+            (dx, dy), response = cv2.phaseCorrelate(self._prev, small, window)
+            if response > 0.05:
+                # El contenido se movió (dx, dy): la cámara avanzó en sentido contrario
+                self.offset -= np.array([dx, dy]) / self._scale
+        self._prev = small
+        return self.offset.copy()
+
+
+class DefectTracker:
+    """Asocia detecciones en coordenadas globales para contar cada defecto una vez."""
+
+    def __init__(self, iou_thr=0.3, max_age=15, min_hits=2):
+        self.iou_thr = iou_thr
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.tracks = []
+        self._frame = 0
+
+    @staticmethod
+    def _iou(box, boxes):
+        ix1 = np.maximum(box[0], boxes[:, 0])
+        iy1 = np.maximum(box[1], boxes[:, 1])
+        ix2 = np.minimum(box[2], boxes[:, 2])
+        iy2 = np.minimum(box[3], boxes[:, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        return inter / (area + areas - inter + 1e-9)
+
+    def update(self, det, offset, frame_index):
+        self._frame += 1
+        boxes = det.xyxy.astype(np.float64) + np.array([offset[0], offset[1]] * 2)
+        active = [t for t in self.tracks if self._frame - t['last_seen'] <= self.max_age]
+        used = set()
+        # Detecciones más confiables primero; emparejamiento voraz por IoU y clase
+        for i in np.argsort(-det.conf):
+            candidates = [t for t in active if t['cls'] == det.cls[i] and id(t) not in used]
+            if candidates:
+                ious = self._iou(boxes[i], np.array([t['box'] for t in candidates]))
+                best = int(np.argmax(ious))
+                if ious[best] >= self.iou_thr:
+                    track = candidates[best]
+                    # Promedio móvil de la caja para suavizar el error de movimiento
+                    track['box'] = 0.7 * track['box'] + 0.3 * boxes[i]
+                    track['hits'] += 1
+                    track['conf'] = max(track['conf'], float(det.conf[i]))
+                    track['last_seen'] = self._frame
+                    track['last_frame'] = frame_index
+                    used.add(id(track))
+                    continue
+            track = {'cls': int(det.cls[i]), 'box': boxes[i].copy(), 'hits': 1,
+                     'conf': float(det.conf[i]), 'last_seen': self._frame,
+                     'first_frame': frame_index, 'last_frame': frame_index}
+            self.tracks.append(track)
+            used.add(id(track))
+
+    def confirmed(self):
+        return [t for t in self.tracks if t['hits'] >= self.min_hits]
+
+
+def inspect_stream(source, model, conf=0.25, frame_step=1, batch=4, distancia_camara=None,
+                   id_cordon=None, dup_threshold=DUPLICATE_THRESHOLD, min_hits=2):
+    """Recorre la fuente y devuelve la ficha agregada (dict serializable)."""
+    reader = FrameReader(source, frame_step, dup_threshold)
+    reader.start()
+    motion = MotionEstimator()
+    tracker = DefectTracker(min_hits=min_hits)
+    processed = 0
+    frame_width = None
+    t0 = time.perf_counter()
+
+    done = False
+    while not done:
+        pending = []
+        item = reader.frames.get()
+        while item is not None:
+            pending.append(item)
+            if len(pending) >= batch:
+                break
+            try:
+                item = reader.frames.get_nowait()
+            except queue.Empty:
+                break
+        done = item is None
+        if not pending:
+            continue
+
+        results = model.predict([frame for _, frame, _ in pending], conf=conf, verbose=False)
+        for (index, frame, gray), result in zip(pending, results):
+            frame_width = frame.shape[1]
+            offset = motion.update(gray)
+            tracker.update(Detections.from_result(result, model.names), offset, index)
+        processed += len(pending)
+
+    if reader.error:
+        raise RuntimeError(reader.error)
+    elapsed = time.perf_counter() - t0
+
+    tracks = tracker.confirmed()
+    names = model.names
+    if tracks:
+        boxes = np.array([t['box'] for t in tracks])
+        det = Detections(boxes, [t['conf'] for t in tracks], [t['cls'] for t in tracks], names)
+    else:
+        det = Detections.empty(names)
+
+    scale = mm_per_pixel(distancia_camara, frame_width or 0)
+    unit, factor = ("mm", scale) if scale else ("px", 1.0)
+    # Eje del cordón = dirección dominante del recorrido de la cámara
+    travel = motion.offset
+    axis = travel / np.linalg.norm(travel) if np.linalg.norm(travel) > 1 else np.array([1.0, 0.0])
+    # Posición medida desde el origen del primer cuadro procesado
+    centers = (det.xyxy[:, :2] + det.xyxy[:, 2:]) / 2
+    along = centers @ axis * factor
+    # Mapa espacial: sombra de cada caja sobre el eje y desplazamiento perpendicular
+    half = (np.abs(axis[0]) * (det.xyxy[:, 2] - det.xyxy[:, 0])
+            + np.abs(axis[1]) * (det.xyxy[:, 3] - det.xyxy[:, 1])) / 2 * factor
+    lateral = centers @ np.array([-axis[1], axis[0]]) * factor
+    sizes = np.minimum(det.xyxy[:, 2] - det.xyxy[:, 0], det.xyxy[:, 3] - det.xyxy[:, 1]) * factor
+    bead = np.isin(det.cls, [c for c, name in names.items() if name in BEAD_CLASSES])
+    defect_map = DefectMap(along[~bead] - half[~bead], along[~bead] + half[~bead], lateral[~bead],
+                           sizes[~bead], det.cls[~bead], det.conf[~bead], names, unit)
+
+    defects = sorted(
+        ({'class': names[t['cls']], 'pos': round(float(p), 2), 'conf': round(t['conf'], 4),
+          'frames': [t['first_frame'], t['last_frame']], 'hits': t['hits']}
+         for t, p in zip(tracks, along)),
+        key=lambda d: d['pos'])
+
+    auto_data = build_auto_data(det, id_cordon or new_id_cordon(), defect_map=defect_map)
+    return {
+        'auto_data': auto_data,
+        'defect_counts': count_defects(det),
+        'defects': defects,
+        'defect_map': defect_map.as_dict(),
+        'units': unit,
+        'recorrido': round(float(np.linalg.norm(travel) * factor), 2),
+        'stats': {
+            'frames_read': reader.read,
+            'duplicates_dropped': reader.duplicates,
+            'frames_processed': processed,
+            'elapsed_s': round(elapsed, 2),
+            'processed_fps': round(processed / elapsed, 2) if elapsed > 0 else None,
+            'source_fps': reader.fps,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspección de cordón desde video o cámara.")
+    parser.add_argument('--source', required=True, help="Archivo de video, URL o índice de cámara")
+    parser.add_argument('--model', default="models/welding_model.pt")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--frame-step', type=int, default=1, help="Procesar 1 de cada N cuadros")
+    parser.add_argument('--batch', type=int, default=4)
+    parser.add_argument('--dup-threshold', type=int, default=DUPLICATE_THRESHOLD,
+                        help="Distancia de Hamming del dHash para considerar duplicado")
+    parser.add_argument('--min-hits', type=int, default=2, help="Cuadros mínimos para confirmar un defecto")
+    parser.add_argument('--distancia-camara', type=float, default=None)
+    parser.add_argument('--id-cordon', default=None)
+    parser.add_argument('-o', '--output', default=None, help="Archivo JSON (por defecto, stdout)")
+    args = parser.parse_args(argv)
+
+    model = get_registry().get_model(args.model, args.backend)
+    ficha = inspect_stream(args.source, model, args.conf, args.frame_step, args.batch,
+                           args.distancia_camara, args.id_cordon, args.dup_threshold, args.min_hits)
+    text = json.dumps(ficha, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Ficha guardada en {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
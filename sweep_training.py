@@ -0,0 +1,221 @@
+"""
+Barrido de hiperparámetros / arquitectura para los modelos de soldadura y superficie.
+
+    python sweep_training.py --data gc10_yolo_dataset/data.yaml \\
+        --models yolov8n.pt yolov8s.pt --imgsz 512 640 --batch 8 16 \\
+        --augment default light heavy --workers 2 --epochs 50
+
+Cada prueba se entrena en un proceso aparte con su propio presupuesto de
+hilos de CPU. Las pruebas se podan de forma asíncrona por escalones
+(successive halving / ASHA): al llegar a cada escalón de épocas, la prueba
+compara su mAP50-95 de validación con las que ya pasaron por ese escalón y
+se detiene si no está en la mejor fracción 1/eta. Al final se mide la
+latencia de inferencia de cada modelo y todo queda en una tabla
+(`results.csv` / `results.json`) con el frente de Pareto velocidad/precisión
+marcado.
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Presets de aumento de datos (argumentos de `model.train` de ultralytics)
+AUGMENT_PRESETS = {
+    "none": dict(mosaic=0.0, mixup=0.0, hsv_h=0.0, hsv_s=0.0, hsv_v=0.0, degrees=0.0,
+                 translate=0.0, scale=0.0, fliplr=0.0),
+    "light": dict(mosaic=0.5, mixup=0.0, hsv_v=0.2, degrees=0.0, scale=0.3, fliplr=0.5),
+    "default": {},
+    "heavy": dict(mosaic=1.0, mixup=0.2, copy_paste=0.1, hsv_v=0.5, degrees=10.0, scale=0.7,
+                  fliplr=0.5, flipud=0.2),
+}
+MAP_KEY = "metrics/mAP50-95(B)"
+RESULT_COLUMNS = [
+    "trial", "status", "model", "imgsz", "batch", "augment", "epochs_run", "pruned_at",
+    "map50", "map50_95", "latency_p50_ms", "latency_p95_ms", "size_mb", "train_s",
+    "pareto", "weights", "error",
+]
+
+
+def build_trials(models, imgsz, batch, augment, search="grid", n_trials=None, seed=0):
+    """Lista de configuraciones (dict) de la búsqueda en grilla o aleatoria."""
+    grid = [dict(model=m, imgsz=s, batch=b, augment=a)
+            for m, s, b, a in itertools.product(models, imgsz, batch, augment)]
+    if search == "random":
+        random.Random(seed).shuffle(grid)
+        grid = grid[:n_trials or len(grid)]
+    for i, trial in enumerate(grid):
+        trial["trial"] = f"t{i:03d}"
+    return grid
+
+
+def rungs_for(epochs, min_epochs, eta):
+    """Épocas en las que se evalúa la poda: min_epochs, min_epochs*eta, ... < epochs."""
+    rungs = []
+    r = min_epochs
+    while r < epochs:
+        rungs.append(r)
+        r *= eta
+    return rungs
+
+
+def should_prune(board, lock, rung, score, eta):
+    """Registra `score` en el escalón y decide si la prueba queda fuera del top 1/eta."""
+    with lock:
+        scores = board.get(rung, []) + [score]
+        board[rung] = scores  # reasignar: el proxy del Manager no ve mutaciones internas
+    if len(scores) < eta:
+        return False  # todavía no hay con qué comparar
+    cutoff = sorted(scores, reverse=True)[max(1, len(scores) // eta) - 1]
+    return score < cutoff
+
+
+def _set_thread_budget(threads):
+    # Debe hacerse antes de importar torch en el proceso de la prueba
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+
+def run_trial(trial, args, board, lock):
+    """Entrena y evalúa una configuración (se ejecuta en un proceso hijo)."""
+    _set_thread_budget(args["threads"])
+    import torch
+    from ultralytics import YOLO
+    from quantize_model import evaluate, sample_images, split_images_dir
+
+    torch.set_num_threads(args["threads"])
+    record = {k: trial[k] for k in ("trial", "model", "imgsz", "batch", "augment")}
+    rungs = set(rungs_for(args["epochs"], args["min_epochs"], args["eta"]))
+    state = {"pruned_at": None, "epochs_run": 0}
+
+    def on_fit_epoch_end(trainer):
+        epoch = trainer.epoch + 1
+        state["epochs_run"] = epoch
+        score = float(trainer.metrics.get(MAP_KEY, 0.0))
+        if epoch in rungs and should_prune(board, lock, epoch, score, args["eta"]):
+            state["pruned_at"] = epoch
+            trainer.stop = True
+
+    t0 = time.perf_counter()
+    try:
+        model = YOLO(trial["model"])
+        model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+        model.train(
+            data=args["data"], epochs=args["epochs"], imgsz=trial["imgsz"], batch=trial["batch"],
+            patience=args["patience"], device=args["device"], workers=args["dataloader_workers"],
+            project=args["project"], name=trial["trial"], exist_ok=True, plots=False, verbose=False,
+            **AUGMENT_PRESETS[trial["augment"]],
+        )
+        record["train_s"] = round(time.perf_counter() - t0, 1)
+        weights = str(model.trainer.best)
+        latency_files = sample_images(split_images_dir(args["data"], "val"), args["latency_images"])
+        metrics = evaluate(weights, args["data"], trial["imgsz"], latency_files)
+        record.update({k: metrics[k] for k in
+                       ("map50", "map50_95", "latency_p50_ms", "latency_p95_ms", "size_mb")})
+        record.update(status="pruned" if state["pruned_at"] else "done", weights=weights)
+    except Exception as e:
+        record.update(status="error", error=str(e), train_s=round(time.perf_counter() - t0, 1))
+    record.update(epochs_run=state["epochs_run"], pruned_at=state["pruned_at"])
+    return record
+
+
+def mark_pareto(records):
+    """Marca las pruebas no dominadas (mayor mAP50-95 y menor latencia p50)."""
+    valid = [r for r in records if r.get("map50_95") is not None and r.get("latency_p50_ms") is not None]
+    for r in valid:
+        r["pareto"] = not any(
+            o is not r and o["map50_95"] >= r["map50_95"] and o["latency_p50_ms"] <= r["latency_p50_ms"]
+            and (o["map50_95"] > r["map50_95"] or o["latency_p50_ms"] < r["latency_p50_ms"])
+            for o in valid)
+    return records
+
+
+def write_results(records, out_dir):
+    records = sorted(records, key=lambda r: -(r.get("map50_95") or -1))
+    with open(os.path.join(out_dir, "results.json"), "w") as f:
+        json.dump(records, f, indent=2)
+    with open(os.path.join(out_dir, "results.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(records)
+    return records
+
+
+def print_table(records):
+    print(f"\n{'prueba':<6} {'estado':<7} {'modelo':<12} {'imgsz':>5} {'batch':>5} {'aug':<8} "
+          f"{'épocas':>6} {'mAP50':>6} {'mAP50-95':>8} {'p50 ms':>7} {'MB':>6}  pareto")
+    for r in records:
+        fmt = lambda k, spec: format(r[k], spec) if r.get(k) is not None else "-"
+        print(f"{r['trial']:<6} {r['status']:<7} {os.path.basename(r['model']):<12} {r['imgsz']:>5} "
+              f"{r['batch']:>5} {r['augment']:<8} {r.get('epochs_run', 0):>6} {fmt('map50', '.4f'):>6} "
+              f"{fmt('map50_95', '.4f'):>8} {fmt('latency_p50_ms', '.1f'):>7} {fmt('size_mb', '.1f'):>6}  "
+              f"{'*' if r.get('pareto') else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Barrido paralelo de hiperparámetros con poda temprana.")
+    parser.add_argument("--data", default="gc10_yolo_dataset/data.yaml", help="data.yaml del dataset")
+    parser.add_argument("--models", nargs="+", default=["yolov8n.pt", "yolov8s.pt"])
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[640])
+    parser.add_argument("--batch", nargs="+", type=int, default=[16])
+    parser.add_argument("--augment", nargs="+", choices=sorted(AUGMENT_PRESETS), default=["default"])
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--trials", type=int, default=None, help="Número de pruebas (búsqueda aleatoria)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--patience", type=int, default=10)
+    parser.add_argument("--min-epochs", type=int, default=5, help="Primer escalón de poda")
+    parser.add_argument("--eta", type=int, default=3, help="Se conserva el mejor 1/eta en cada escalón")
+    parser.add_argument("--workers", type=int, default=2, help="Pruebas en paralelo")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de CPU por prueba")
+    parser.add_argument("--dataloader-workers", type=int, default=2)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--latency-images", type=int, default=20)
+    parser.add_argument("--name", default=None)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.data):
+        raise SystemExit(f"No existe {args.data}")
+    name = args.name or time.strftime("sweep_%Y%m%d_%H%M%S")
+    out_dir = os.path.join("runs", "sweep", name)
+    os.makedirs(out_dir, exist_ok=True)
+    # Repartir los núcleos: hilos de cálculo + workers del dataloader de cada prueba
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers - args.dataloader_workers)
+    trial_args = {
+        "data": os.path.abspath(args.data), "epochs": args.epochs, "patience": args.patience,
+        "min_epochs": args.min_epochs, "eta": args.eta, "threads": threads, "device": args.device,
+        "dataloader_workers": args.dataloader_workers, "latency_images": args.latency_images,
+        "project": os.path.abspath(out_dir),
+    }
+    trials = build_trials(args.models, args.imgsz, args.batch, args.augment,
+                          args.search, args.trials, args.seed)
+    print(f"{len(trials)} pruebas, {args.workers} en paralelo con {threads} hilos cada una; "
+          f"escalones de poda: {rungs_for(args.epochs, args.min_epochs, args.eta) or 'ninguno'}")
+
+    records = []
+    ctx = mp.get_context("spawn")  # procesos limpios: torch no se lleva bien con fork
+    with ctx.Manager() as manager:
+        board, lock = manager.dict(), manager.Lock()
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as pool:
+            futures = [pool.submit(run_trial, trial, trial_args, board, lock) for trial in trials]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                print(f"[{len(records)}/{len(trials)}] {record['trial']} {record['status']} "
+                      f"mAP50-95={record.get('map50_95', '-')} p50={record.get('latency_p50_ms', '-')} ms",
+                      file=sys.stderr)
+                # Tabla parcial: un corte del barrido no pierde lo ya entrenado
+                write_results(mark_pareto(records), out_dir)
+
+    records = write_results(mark_pareto(records), out_dir)
+    print_table(records)
+    print(f"\nResultados en {out_dir}/results.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Comprobaciones previas de quantize_model: clases críticas y split de calibración."""
+import os
+import sys
+
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quantize_model  # noqa: E402
+
+GC10_NAMES = {0: "Punching", 1: "Weld_line", 2: "Crescent_gap", 3: "Water_spot", 4: "Oil_spot",
+              5: "Silk_spot", 6: "Inclusion", 7: "Rolled_pit", 8: "Crease", 9: "Waist_folding"}
+
+
+class _Exported(Exception):
+    pass
+
+
+@pytest.fixture
+def gc10_yaml(tmp_path, monkeypatch):
+    # Mismo data.yaml que genera train_surface_model.py, en la ruta por defecto
+    root = tmp_path / "gc10_yolo_dataset"
+    root.mkdir()
+    path = root / "data.yaml"
+    path.write_text(yaml.dump({'path': str(root), 'train': 'images/train',
+                               'val': 'images/val', 'names': GC10_NAMES}))
+    monkeypatch.chdir(tmp_path)
+
+    def ensure_onnx(weights, imgsz):
+        raise _Exported(weights)
+
+    monkeypatch.setattr(quantize_model, "ensure_onnx", ensure_onnx)
+    return str(path)
+
+
+def test_default_call_passes_class_check(gc10_yaml):
+    # Sin --critical todas las clases del dataset son críticas y se llega a exportar
+    with pytest.raises(_Exported):
+        quantize_model.main([])
+    assert quantize_model.critical_classes(gc10_yaml) == list(GC10_NAMES.values())
+
+
+def test_unknown_critical_class_aborts(gc10_yaml):
+    with pytest.raises(SystemExit, match="Crack"):
+        quantize_model.main(["--data", gc10_yaml, "--critical", "Crack", "Inclusion"])
+
+
+def test_calibration_on_val_split_aborts(gc10_yaml):
+    val_dir = os.path.join(os.path.dirname(gc10_yaml), "images", "val")
+    with pytest.raises(SystemExit, match="validación"):
+        quantize_model.main(["--data", gc10_yaml, "--calib-images", val_dir])
@@ -0,0 +1,83 @@
+"""Inspección de video sobre un paneo sintético: cada poro se cuenta una vez y en su posición."""
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_inspect import inspect_stream  # noqa: E402
+
+PORES_X = [500, 1100, 1700, 2300, 2900]
+PORE_Y = 150
+FRAME_W, FRAME_H = 640, 300
+STEP = 20
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = self
+        self._data = data
+
+    def __len__(self):
+        return len(self._data)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._data
+
+
+class _Result:
+    def __init__(self, data):
+        self.boxes = _Boxes(data)
+        self.names = {0: "Porosity"}
+
+
+class BlobModel:
+    """Sustituto del YOLO: detecta los poros (manchas oscuras) por umbral."""
+
+    names = {0: "Porosity"}
+
+    def predict(self, frames, conf=0.25, verbose=False):
+        results = []
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            n, _, stats, _ = cv2.connectedComponentsWithStats((gray < 40).astype(np.uint8))
+            rows = [[x, y, x + w, y + h, 0.9, 0]
+                    for x, y, w, h, area in stats[1:]
+                    # Solo poros completos (no cortados por el borde del cuadro)
+                    if area > 50 and x > 0 and x + w < frame.shape[1]]
+            results.append(_Result(np.array(rows, np.float32).reshape(-1, 6)))
+        return results
+
+
+@pytest.fixture
+def panning_video(tmp_path):
+    rng = np.random.default_rng(0)
+    width = PORES_X[-1] + FRAME_W
+    # Fondo texturado (la correlación de fase necesita detalle) sin zonas tan oscuras como un poro
+    texture = cv2.GaussianBlur(rng.integers(60, 255, (FRAME_H, width)).astype(np.uint8), (0, 0), 2)
+    panorama = cv2.cvtColor(texture, cv2.COLOR_GRAY2BGR)
+    for x in PORES_X:
+        cv2.circle(panorama, (x, PORE_Y), 9, (10, 10, 10), -1)
+    path = str(tmp_path / "paneo.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (FRAME_W, FRAME_H))
+    for x0 in range(0, width - FRAME_W + 1, STEP):
+        writer.write(panorama[:, x0:x0 + FRAME_W])
+    writer.release()
+    return path
+
+
+def test_each_pore_counted_once_at_its_position(panning_video):
+    result = inspect_stream(panning_video, BlobModel(), batch=4)
+
+    assert result['defect_counts'] == {"Porosity": len(PORES_X)}
+    positions = [d['pos'] for d in result['defects']]
+    # El eje es el recorrido de la cámara y el origen el primer cuadro: pos = x en el panorama
+    assert positions == pytest.approx(PORES_X, abs=6)
+    assert result['units'] == "px"
+    assert result['stats']['duplicates_dropped'] == 0
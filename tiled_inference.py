@@ -0,0 +1,188 @@
+"""
+Inferencia por mosaicos (sliced inference) para fotos de alta resolución.
+
+`model.predict` reduce la imagen completa al `imgsz` del modelo (640 px), con
+lo que poros pequeños y fisuras finas de un cordón largo desaparecen. Aquí se
+corta la imagen en mosaicos solapados a resolución nativa, se ejecutan en
+lotes, se trasladan las cajas a coordenadas de la imagen original y se
+fusionan con un NMS global (por clase, vectorizado) que también elimina las
+cajas parciales cortadas en los bordes de los mosaicos.
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+from detections import Detections
+from image_decode import DecodedImage, predict_decoded
+from pipeline_metrics import observe_yolo_speed
+
+DEFAULT_IMGSZ = 640
+DEFAULT_OVERLAP = 0.2
+# Se usan mosaicos cuando el lado mayor supera TILING_FACTOR * imgsz
+TILING_FACTOR = 1.5
+TILING_MODES = ("auto", "on", "off")
+
+
+def model_imgsz(model):
+    """Tamaño de entrada con el que se entrenó/exportó el modelo."""
+    imgsz = getattr(model, "overrides", {}).get("imgsz") or DEFAULT_IMGSZ
+    return int(imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz)
+
+
+def to_bgr_array(image):
+    """Array HxWx3 BGR (convención de ultralytics) desde PIL RGB o array BGR."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))[:, :, ::-1]
+    return np.asarray(image)
+
+
+def needs_tiling(shape, imgsz, mode="auto"):
+    if mode == "on":
+        return True
+    if mode == "off":
+        return False
+    return max(shape[:2]) > TILING_FACTOR * imgsz
+
+
+def _starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)  # último mosaico alineado al borde
+    return starts
+
+
+def plan_tiles(h, w, tile, overlap=DEFAULT_OVERLAP):
+    """Lista de ventanas (x1, y1, x2, y2) solapadas que cubren la imagen."""
+    stride = max(1, int(tile * (1 - overlap)))
+    return [(x, y, min(x + tile, w), min(y + tile, h))
+            for y in _starts(h, tile, stride) for x in _starts(w, tile, stride)]
+
+
+def partial_mask(xyxy, window, shape, margin=1.0):
+    """Cajas cortadas por un borde interior del mosaico `window` (no por el de la imagen)."""
+    x1, y1, x2, y2 = window
+    h, w = shape[:2]
+    return (((xyxy[:, 0] <= x1 + margin) & (x1 > 0))
+            | ((xyxy[:, 1] <= y1 + margin) & (y1 > 0))
+            | ((xyxy[:, 2] >= x2 - margin) & (x2 < w))
+            | ((xyxy[:, 3] >= y2 - margin) & (y2 < h)))
+
+
+def _contained_partials(xyxy, cls, tile, partial, ios_thr):
+    """Máscara de cajas cortadas contenidas en una caja mayor de la misma clase de otro mosaico."""
+    cut = np.flatnonzero(partial & (tile >= 0))
+    whole = np.flatnonzero(tile >= 0)
+    drop = np.zeros(len(xyxy), dtype=bool)
+    if len(cut) == 0:
+        return drop
+    boxes = xyxy.astype(np.float64)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    a, b = boxes[cut][:, None], boxes[whole][None]
+    inter = (np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+             * np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None))
+    covered = ((inter / (areas[cut][:, None] + 1e-9) > ios_thr)
+               & (cls[cut][:, None] == cls[whole][None])
+               & (tile[cut][:, None] != tile[whole][None])
+               & (areas[whole][None] > areas[cut][:, None]))
+    drop[cut[covered.any(axis=1)]] = True
+    return drop
+
+
+def merge_nms(xyxy, conf, cls, tile=None, partial=None, conf_thr=0.0, iou_thr=0.5, ios_thr=0.8):
+    """NMS global por clase. Devuelve los índices conservados, por confianza descendente.
+
+    Descarta las cajas bajo `conf_thr`, luego las `partial` (cortadas por el
+    borde de un mosaico) contenidas en una caja mayor de la misma clase vista
+    en otro mosaico (intersección / área de la cortada > ios_thr), y sobre el
+    resto aplica un NMS por IoU vectorizado (cv2.dnn.NMSBoxesBatched).
+    `tile` identifica el mosaico de cada caja; las de la pasada completa
+    (tile = -1) nunca suprimen por contención, para que una caja grande y poco
+    detallada no borre los defectos pequeños que encuentran los mosaicos.
+    """
+    candidates = conf >= conf_thr
+    if tile is not None and partial is not None:
+        candidates &= ~_contained_partials(xyxy, cls, np.where(candidates, tile, -1),
+                                           partial & candidates, ios_thr)
+    candidates = np.flatnonzero(candidates)
+    if len(candidates) == 0:
+        return np.zeros(0, dtype=np.int64)
+    boxes = xyxy[candidates].astype(np.float64)
+    boxes[:, 2:] -= boxes[:, :2]  # NMSBoxesBatched usa (x, y, w, h)
+    keep = cv2.dnn.NMSBoxesBatched(boxes, conf[candidates].astype(np.float32),
+                                   cls[candidates].astype(np.int32), 0.0, iou_thr)
+    return candidates[np.asarray(keep, dtype=np.int64).reshape(-1)]
+
+
+def predict_tiled(model, image, conf, imgsz=None, overlap=DEFAULT_OVERLAP, batch=8,
+                  include_full=True, **predict_kwargs):
+    """Detecciones de `image` (PIL RGB o array BGR) usando mosaicos a resolución nativa.
+
+    Con include_full=True se añade una pasada de la imagen completa reducida,
+    que conserva los defectos grandes que no caben en un mosaico.
+    """
+    img = to_bgr_array(image)
+    h, w = img.shape[:2]
+    tile = imgsz or model_imgsz(model)
+    windows = plan_tiles(h, w, tile, overlap)
+
+    all_xyxy, all_conf, all_cls, all_tile, all_partial = [], [], [], [], []
+    speed = {}
+    for start in range(0, len(windows), batch):
+        chunk = windows[start:start + batch]
+        crops = [np.ascontiguousarray(img[y1:y2, x1:x2]) for x1, y1, x2, y2 in chunk]
+        results = model.predict(crops, conf=conf, imgsz=tile, verbose=False, **predict_kwargs)
+        for offset, (window, result) in enumerate(zip(chunk, results)):
+            for stage, ms in (getattr(result, "speed", None) or {}).items():
+                speed[stage] = speed.get(stage, 0.0) + (ms or 0.0)
+            det = Detections.from_result(result, model.names)
+            if len(det):
+                x1, y1 = window[:2]
+                boxes = det.xyxy + np.array([x1, y1, x1, y1], dtype=np.float32)
+                all_xyxy.append(boxes)
+                all_conf.append(det.conf)
+                all_cls.append(det.cls)
+                all_tile.append(np.full(len(det), start + offset))
+                all_partial.append(partial_mask(boxes, window, img.shape))
+
+    if include_full and len(windows) > 1:
+        full = model.predict(np.ascontiguousarray(img), conf=conf, imgsz=tile, verbose=False, **predict_kwargs)
+        for stage, ms in (getattr(full[0], "speed", None) or {}).items():
+            speed[stage] = speed.get(stage, 0.0) + (ms or 0.0)
+        det = Detections.from_result(full[0], model.names)
+        all_xyxy.append(det.xyxy)
+        all_conf.append(det.conf)
+        all_cls.append(det.cls)
+        all_tile.append(np.full(len(det), -1))
+        all_partial.append(np.zeros(len(det), dtype=bool))
+
+    # Tiempo de ultralytics acumulado sobre todos los mosaicos
+    observe_yolo_speed(speed)
+    if not all_conf:
+        return Detections.empty(model.names)
+    xyxy = np.concatenate(all_xyxy)
+    conf_arr = np.concatenate(all_conf)
+    cls_arr = np.concatenate(all_cls)
+    keep = merge_nms(xyxy, conf_arr, cls_arr, np.concatenate(all_tile), np.concatenate(all_partial), conf)
+    return Detections(xyxy[keep], conf_arr[keep], cls_arr[keep], model.names)
+
+
+def predict_auto(model, image, conf, mode="auto", **predict_kwargs):
+    """Elige entre una pasada normal y mosaicos según el tamaño de la imagen.
+
+    Con un DecodedImage la pasada normal usa la decodificación reducida y la
+    imagen completa solo se decodifica si hacen falta mosaicos.
+    """
+    imgsz = model_imgsz(model)
+    if isinstance(image, DecodedImage):
+        if needs_tiling(image.shape, imgsz, mode):
+            return predict_tiled(model, image.full_bgr(), conf, imgsz, **predict_kwargs)
+        det, result = predict_decoded(model, image, conf, imgsz, **predict_kwargs)
+        observe_yolo_speed(getattr(result, "speed", None))
+        return det
+    img = to_bgr_array(image)
+    if needs_tiling(img.shape, imgsz, mode):
+        return predict_tiled(model, img, conf, imgsz, **predict_kwargs)
+    results = model.predict(image, conf=conf, verbose=False, **predict_kwargs)
+    observe_yolo_speed(getattr(results[0], "speed", None))
+    return Detections.from_result(results[0], model.names)
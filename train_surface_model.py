@@ -2,17 +2,22 @@ from ultralytics import YOLO
 import os
 import yaml
 import shutil
-import cv2
-import numpy as np
+import time
+import json
+import hashlib
 import xml.etree.ElementTree as ET
-from glob import glob
-from sklearn.model_selection import train_test_split
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image
 import kagglehub
 
 # Paths
 DATASET_DIR = "gc10_yolo_dataset"
 IMAGES_DIR = os.path.join(DATASET_DIR, "images")
 LABELS_DIR = os.path.join(DATASET_DIR, "labels")
+MANIFEST_PATH = os.path.join(DATASET_DIR, "manifest.json")
+MANIFEST_VERSION = 1
+SPLIT_SEED = 42
+VAL_FRACTION = 0.2
 
 # GC10-DET Classes
 CLASS_MAP = {
@@ -27,6 +32,7 @@ CLASS_NAMES = {
     4: "Oil_spot", 5: "Silk_spot", 6: "Inclusion", 7: "Rolled_pit", 
     8: "Crease", 9: "Waist_folding"
 }
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
 
 def train_model():
     """Trains the YOLOv8 model using the prepared dataset."""
@@ -64,119 +70,304 @@ def train_model():
     except Exception as e:
         print(f"Export failed (non-critical): {e}")
 
-def prepare_dataset():
-    """Downloads dataset via kagglehub and converts to YOLO format."""
-    print("Downloading dataset from Kaggle...")
+def resolve_class(cls_name):
+    """Maps a GC10-DET object name to a class id (-1 if unknown)."""
+    cls_name = cls_name.lower().replace(" ", "_")
+    # Try exact match or number match
+    if cls_name in CLASS_MAP:
+        return CLASS_MAP[cls_name]
+    # Try to find partial match or mapped name
+    for k, v in CLASS_MAP.items():
+        if k in cls_name:
+            return v
+    return -1
+
+
+def scan_dataset(path):
+    """Walks the dataset once. Returns (sorted XML files, basename -> [image paths])."""
+    xml_files = []
+    image_index = {}
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            base, ext = os.path.splitext(name)
+            ext = ext.lower()
+            if ext == '.xml':
+                xml_files.append(os.path.join(dirpath, name))
+            elif ext in IMAGE_EXTS:
+                image_index.setdefault(base, []).append(os.path.join(dirpath, name))
+    return sorted(xml_files), image_index
+
+
+def find_image(xml_file, image_index):
+    """Image with the same basename, preferring the XML's own directory."""
+    basename = os.path.splitext(os.path.basename(xml_file))[0]
+    candidates = image_index.get(basename)
+    if not candidates:
+        return None
+    base_dir = os.path.dirname(xml_file)
+    for ext in IMAGE_EXTS:
+        for candidate in candidates:
+            if os.path.dirname(candidate) == base_dir and candidate.lower().endswith(ext):
+                return candidate
+    return candidates[0]
+
+
+def link_or_copy(src, dst):
+    """Hard link, then symlink, then copy. Returns the method used."""
+    if os.path.lexists(dst):
+        os.remove(dst)
     try:
-        path = kagglehub.dataset_download("zhangyunsheng/defects-class-and-location")
-        print("Path to dataset files:", path)
+        os.link(src, dst)
+        return "link"
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dst)
+        return "symlink"
+    except OSError:
+        shutil.copy(src, dst)
+        return "copy"
+
+
+def convert_sample(task):
+    """Converts one XML annotation (runs in a worker process).
+
+    Returns (xml_file, status, link method, error message).
+    """
+    xml_file, image_path, split = task
+    basename = os.path.splitext(os.path.basename(xml_file))[0]
+    label_path = os.path.join(LABELS_DIR, split, f"{basename}.txt")
+    image_dst = os.path.join(IMAGES_DIR, split, os.path.basename(image_path))
+    try:
+        root = ET.parse(xml_file).getroot()
+
+        # Width/height from the image header only, without decoding pixels
+        with Image.open(image_path) as img:
+            w, h = img.size
+
+        lines = []
+        for obj in root.findall("object"):
+            cls_id = resolve_class(obj.find("name").text)
+            if cls_id == -1:
+                continue
+
+            bndbox = obj.find("bndbox")
+            xmin = float(bndbox.find("xmin").text)
+            ymin = float(bndbox.find("ymin").text)
+            xmax = float(bndbox.find("xmax").text)
+            ymax = float(bndbox.find("ymax").text)
+
+            # Normalize
+            x_center = ((xmin + xmax) / 2) / w
+            y_center = ((ymin + ymax) / 2) / h
+            width = (xmax - xmin) / w
+            height = (ymax - ymin) / h
+            lines.append(f"{cls_id} {x_center} {y_center} {width} {height}\n")
+
+        # Label first, then the image: an image without its label would be
+        # trained on as a background sample
+        with open(label_path, "w") as f:
+            f.writelines(lines)
+        method = link_or_copy(image_path, image_dst)
+        return xml_file, ("labeled" if lines else "empty"), method, None
     except Exception as e:
-        print(f"Error downloading dataset: {e}")
-        return
+        # Roll back whatever this sample left behind
+        for output in (image_dst, label_path):
+            if os.path.lexists(output):
+                os.remove(output)
+        return xml_file, "error", None, str(e)
+
+
+def convert_samples(tasks, workers=None, report_every=500):
+    """Converts (xml, image, split) tasks across a process pool and prints a summary.
+
+    Returns (counts by status, set of XML files that failed).
+    """
+    counts = {"labeled": 0, "empty": 0, "error": 0}
+    failed = set()
+    methods = {}
+    total = len(tasks)
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(64, total // (workers * 4) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (xml_file, status, method, error) in enumerate(
+                pool.map(convert_sample, tasks, chunksize=chunksize), 1):
+            counts[status] += 1
+            if method:
+                methods[method] = methods.get(method, 0) + 1
+            if error:
+                failed.add(xml_file)
+                print(f"Error processing {xml_file}: {error}")
+            if done % report_every == 0 or done == total:
+                elapsed = time.perf_counter() - t0
+                print(f"  [{done}/{total}] {done / elapsed:.0f} files/s")
+    elapsed = time.perf_counter() - t0
+    print(f"Converted {total} annotations in {elapsed:.1f}s with {workers} workers "
+          f"({total / elapsed if elapsed else 0:.0f} files/s): {counts['labeled']} labeled, "
+          f"{counts['empty']} without known classes, {counts['error']} errors. "
+          f"Images: {', '.join(f'{n} {m}' for m, n in sorted(methods.items())) or 'none'}.")
+    return counts, failed
+
+
+def file_digest(path, previous=None):
+    """[size, mtime_ns, blake2b] of a file.
+
+    The content hash is only recomputed when size or mtime changed since the
+    previous manifest entry, so an unchanged dataset is verified with stat().
+    """
+    st = os.stat(path)
+    if previous and previous[:2] == [st.st_size, st.st_mtime_ns]:
+        return previous
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return [st.st_size, st.st_mtime_ns, h.hexdigest()]
+
+
+def config_digest():
+    """Hash of everything besides the sources that affects the generated dataset."""
+    config = {"class_map": CLASS_MAP, "class_names": CLASS_NAMES, "seed": SPLIT_SEED,
+              "val_fraction": VAL_FRACTION, "version": MANIFEST_VERSION}
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def assign_split(key):
+    """Deterministic per-sample split: adding or removing samples never reshuffles the rest."""
+    h = hashlib.blake2b(f"{SPLIT_SEED}:{key}".encode(), digest_size=8).digest()
+    return "val" if int.from_bytes(h, "big") / 2**64 < VAL_FRACTION else "train"
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("config") != config_digest():
+        print("Class mapping or split settings changed: rebuilding every sample.")
+        return None
+    return manifest
+
 
-    if os.path.exists(DATASET_DIR):
+def save_manifest(samples):
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"config": config_digest(), "samples": samples}, f)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def sample_outputs(xml_file, image_path, split):
+    basename = os.path.splitext(os.path.basename(xml_file))[0]
+    return [os.path.join(IMAGES_DIR, split, os.path.basename(image_path)),
+            os.path.join(LABELS_DIR, split, f"{basename}.txt")]
+
+
+def remove_outputs(outputs):
+    for output in outputs:
+        if os.path.lexists(output):
+            os.remove(output)
+
+
+def sync_dataset(path, workers=None):
+    """Brings DATASET_DIR up to date with the sources under `path`.
+
+    Only added or changed samples are converted; samples that disappeared
+    are removed. Returns True if anything changed (None if there is no data).
+    """
+    t0 = time.perf_counter()
+    manifest = load_manifest()
+    if manifest is None and os.path.exists(DATASET_DIR):
         print(f"Cleaning up existing dataset directory: {DATASET_DIR}")
         shutil.rmtree(DATASET_DIR)
-    
+    previous = manifest["samples"] if manifest else {}
+
     for split in ["train", "val"]:
         os.makedirs(os.path.join(IMAGES_DIR, split), exist_ok=True)
         os.makedirs(os.path.join(LABELS_DIR, split), exist_ok=True)
 
-    # Search for XML files in the downloaded path
-    xml_files = glob(os.path.join(path, "**", "*.xml"), recursive=True)
-    
+    # Single pass over the downloaded path: XML files + basename -> image index
+    xml_files, image_index = scan_dataset(path)
+
     if not xml_files:
         print("No XML files found in downloaded dataset!")
+        return None
+
+    print(f"Found {len(xml_files)} XML files and {sum(map(len, image_index.values()))} images.")
+
+    pairs = []
+    missing = 0
+    for xml_file in xml_files:
+        image_path = find_image(xml_file, image_index)
+        if image_path:
+            pairs.append((xml_file, image_path))
+        else:
+            missing += 1
+    if missing:
+        print(f"Skipping {missing} annotations without a matching image.")
+
+    def fingerprint(pair):
+        xml_file, image_path = pair
+        key = os.path.relpath(xml_file, path)
+        old = previous.get(key, {})
+        image_rel = os.path.relpath(image_path, path)
+        old_image = old.get("image") if old.get("image", [None])[0] == image_rel else None
+        return key, {
+            "xml": file_digest(xml_file, old.get("xml")),
+            "image": [image_rel] + file_digest(image_path, old_image[1:] if old_image else None),
+        }
+
+    # Hashing is I/O bound (hashlib releases the GIL): threads are enough
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as pool:
+        digests = list(pool.map(fingerprint, pairs))
+
+    samples = {}
+    tasks = []
+    for (xml_file, image_path), (key, entry) in zip(pairs, digests):
+        old = previous.get(key)
+        # The split of known samples never moves
+        entry["split"] = old["split"] if old else assign_split(key)
+        entry["outputs"] = sample_outputs(xml_file, image_path, entry["split"])
+        up_to_date = (old is not None and old["xml"] == entry["xml"] and old["image"] == entry["image"]
+                      and old["outputs"] == entry["outputs"] and all(map(os.path.lexists, entry["outputs"])))
+        if not up_to_date:
+            if old:
+                remove_outputs(old["outputs"])
+            tasks.append((xml_file, image_path, entry["split"]))
+        samples[key] = entry
+
+    stale = [key for key in previous if key not in samples]
+    for key in stale:
+        remove_outputs(previous[key]["outputs"])
+
+    changed = bool(tasks or stale)
+    if tasks:
+        print(f"Converting {len(tasks)} new or changed samples...")
+        counts, failed = convert_samples(tasks, workers)
+        print(f"Successfully processed {counts['labeled']} images.")
+        # Failed samples stay out of the manifest so the next run retries them
+        samples = {key: entry for key, entry in samples.items()
+                   if os.path.join(path, key) not in failed}
+
+    save_manifest(samples)
+    print(f"Dataset in sync: {len(samples)} samples, {len(tasks)} converted, {len(stale)} removed "
+          f"({time.perf_counter() - t0:.1f}s).")
+    return changed
+
+
+def prepare_dataset(workers=None):
+    """Downloads dataset via kagglehub and converts to YOLO format."""
+    print("Downloading dataset from Kaggle...")
+    try:
+        path = kagglehub.dataset_download("zhangyunsheng/defects-class-and-location")
+        print("Path to dataset files:", path)
+    except Exception as e:
+        print(f"Error downloading dataset: {e}")
         return
 
-    print(f"Found {len(xml_files)} XML files. Processing...")
-    
-    train_files, val_files = train_test_split(xml_files, test_size=0.2, random_state=42)
-    
-    processed_count = 0
-    for split, files in [("train", train_files), ("val", val_files)]:
-        for xml_file in files:
-            try:
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
-                
-                # Image info
-                filename = root.find("filename").text
-                
-                # Find corresponding image
-                base_dir = os.path.dirname(xml_file)
-                basename = os.path.splitext(os.path.basename(xml_file))[0]
-                
-                # Look for image with same basename
-                image_path = None
-                for ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-                    potential_path = os.path.join(base_dir, basename + ext)
-                    if os.path.exists(potential_path):
-                        image_path = potential_path
-                        break
-                
-                if not image_path:
-                    # Try searching recursively if not in same dir
-                    image_files = glob(os.path.join(path, "**", f"{basename}.*"), recursive=True)
-                    for img_f in image_files:
-                        if img_f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                            image_path = img_f
-                            break
-                
-                if not image_path:
-                    continue
-                
-                # Copy image
-                shutil.copy(image_path, os.path.join(IMAGES_DIR, split, os.path.basename(image_path)))
-                
-                # Parse objects
-                img = cv2.imread(image_path)
-                if img is None: continue
-                h, w = img.shape[:2]
-                
-                label_path = os.path.join(LABELS_DIR, split, f"{basename}.txt")
-                
-                has_valid_labels = False
-                with open(label_path, "w") as f:
-                    for obj in root.findall("object"):
-                        cls_name = obj.find("name").text.lower().replace(" ", "_")
-                        
-                        cls_id = -1
-                        # Try exact match or number match
-                        if cls_name in CLASS_MAP:
-                            cls_id = CLASS_MAP[cls_name]
-                        else:
-                            # Try to find partial match or mapped name
-                            for k, v in CLASS_MAP.items():
-                                if k in cls_name:
-                                    cls_id = v
-                                    break
-                        
-                        if cls_id == -1:
-                            continue
-                            
-                        bndbox = obj.find("bndbox")
-                        xmin = float(bndbox.find("xmin").text)
-                        ymin = float(bndbox.find("ymin").text)
-                        xmax = float(bndbox.find("xmax").text)
-                        ymax = float(bndbox.find("ymax").text)
-                        
-                        # Normalize
-                        x_center = ((xmin + xmax) / 2) / w
-                        y_center = ((ymin + ymax) / 2) / h
-                        width = (xmax - xmin) / w
-                        height = (ymax - ymin) / h
-                        
-                        f.write(f"{cls_id} {x_center} {y_center} {width} {height}\n")
-                        has_valid_labels = True
-                
-                if has_valid_labels:
-                    processed_count += 1
-                        
-            except Exception as e:
-                print(f"Error processing {xml_file}: {e}")
-
-    print(f"Successfully processed {processed_count} images.")
+    if sync_dataset(path, workers) is None:
+        return
 
     # Create data.yaml
     data = {
@@ -185,10 +376,10 @@ def prepare_dataset():
         'val': 'images/val',
         'names': CLASS_NAMES
     }
-    
+
     with open(os.path.join(DATASET_DIR, "data.yaml"), "w") as f:
         yaml.dump(data, f)
-    
+
     # Start training
     train_model()
 
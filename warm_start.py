@@ -0,0 +1,173 @@
+"""
+Arranque en frío rápido: precarga y calentamiento de los modelos al iniciar el contenedor.
+
+    python warm_start.py run app.py --server.port=8501 --server.address=0.0.0.0
+    python warm_start.py              # solo precarga y muestra el tiempo de arranque
+
+Streamlit no ejecuta app.py hasta que llega el primer visitante, que tras un
+reinicio esperaba los imports de ultralytics/torch, la carga de ambos
+modelos y la primera pasada (lenta) de cada uno. Este lanzador inicia esa
+precarga en un hilo (PRELOAD_MODELS, con la pasada de calentamiento del
+registro) y arranca Streamlit en el mismo proceso: los registros de modelos
+son únicos por proceso, así que app.py los encuentra ya en memoria o espera
+solo lo que falta. Si la app se lanza con `streamlit run` directamente, la
+precarga empieza con la primera ejecución de app.py.
+
+De los imports pesados de app.py solo pandas se difiere (se carga al
+mostrar tablas). cv2 y PIL siguen cargándose al importar app.py, porque
+image_decode, session_images, bead_geometry y tiled_inference los importan
+a nivel de módulo y este lanzador ya los trae vía inference_workers; cuestan
+~80 ms frente a los segundos de ultralytics/torch y de la carga de modelos,
+que son los que se adelantan aquí.
+
+El estado se publica en `GET /health` del servidor de métricas (200 cuando la
+inferencia está caliente, 503 mientras se calienta o si falló un modelo de
+REQUIRED_MODELS; los demás son opcionales) y el tiempo de arranque
+en frío (desde que arrancó el proceso) se imprime al terminar y se registra
+como la etapa `startup/cold_start`.
+"""
+import os
+import sys
+import threading
+import time
+
+from inference_backend import DEFAULT_BACKEND
+from inference_workers import get_worker_pool
+from model_registry import get_registry
+from pipeline_metrics import get_metrics, set_health_check, start_metrics_server
+
+PRELOAD_MODELS = [p for p in os.getenv("PRELOAD_MODELS",
+                                       "models/welding_model.pt,models/surface_model.pt").split(",") if p]
+# Sin estos modelos no se puede inspeccionar: /health no está listo si alguno falla
+REQUIRED_MODELS = [p for p in os.getenv("REQUIRED_MODELS", "models/welding_model.pt").split(",") if p]
+_IMPORT_TIME = time.time()
+
+
+def process_start_time():
+    """Instante (epoch) en que arrancó el proceso; /proc en Linux, si no el import de este módulo."""
+    try:
+        with open("/proc/self/stat") as f:
+            # El campo 22 (starttime, en ticks desde el arranque) va tras el nombre entre paréntesis
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _IMPORT_TIME
+
+
+def load_entry(path, backend=DEFAULT_BACKEND):
+    """ModelEntry de `path` desde el pool de inferencia o, si está desactivado, del registro local."""
+    pool = get_worker_pool()
+    return pool.load(path, backend) if pool else get_registry().get(path, backend)
+
+
+class WarmStart:
+    """Precarga en segundo plano y estado de salud de la inferencia."""
+
+    def __init__(self):
+        self.state = "idle"  # idle | warming | ready | degraded | error
+        self.models = {}
+        self.import_s = None
+        self.cold_start_s = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, paths=None, backend=DEFAULT_BACKEND):
+        """Inicia la precarga (una sola vez por proceso)."""
+        with self._lock:
+            if self.state != "idle":
+                return
+            self.state = "warming"
+        # Los modelos obligatorios se precargan siempre, aunque no estén en `paths`
+        paths = list(dict.fromkeys(REQUIRED_MODELS + list(paths or PRELOAD_MODELS)))
+        threading.Thread(target=self._run, args=(paths, backend),
+                         name="warm-start", daemon=True).start()
+
+    def _run(self, paths, backend):
+        t0 = time.perf_counter()
+        if get_worker_pool() is None:
+            # Con el pool, ultralytics se importa en los procesos de inferencia
+            try:
+                import ultralytics  # noqa: F401
+            except ImportError as e:
+                print(f"Precarga: {e}")
+        self.import_s = time.perf_counter() - t0
+        for path in paths:
+            try:
+                entry = load_entry(path, backend)
+                self.models[path] = {"backend": entry.backend, "load_s": round(entry.load_s, 3),
+                                     "warmup_s": round(entry.warmup_s, 3)}
+            except Exception as e:
+                self.models[path] = {"error": str(e)}
+        failed = [path for path, info in self.models.items() if "error" in info]
+        self.cold_start_s = time.time() - process_start_time()
+        get_metrics().observe("startup", "cold_start", self.cold_start_s)
+        self.state = ("error" if any(path in REQUIRED_MODELS for path in failed)
+                      else "degraded" if failed else "ready")
+        print(self.report(), flush=True)
+        self._done.set()
+
+    @property
+    def warming(self):
+        return self.state == "warming"
+
+    def wait(self, timeout=None):
+        """Espera a que termine la precarga (si se inició). True si ya terminó."""
+        return self.state == "idle" or self._done.wait(timeout)
+
+    def health(self):
+        return {
+            "status": self.state,
+            # degraded: falta algún modelo opcional, pero los obligatorios están calientes
+            "ready": self.state in ("ready", "degraded"),
+            "required": REQUIRED_MODELS,
+            "cold_start_s": None if self.cold_start_s is None else round(self.cold_start_s, 2),
+            "import_s": None if self.import_s is None else round(self.import_s, 2),
+            "uptime_s": round(time.time() - process_start_time(), 1),
+            "models": self.models,
+        }
+
+    def report(self):
+        parts = [f"imports {self.import_s:.2f}s"]
+        for path, info in self.models.items():
+            name = os.path.basename(path)
+            if "error" in info:
+                parts.append(f"{name} ERROR ({info['error']})")
+            else:
+                parts.append(f"{name} [{info['backend']}] carga {info['load_s']:.2f}s + "
+                             f"calentamiento {info['warmup_s']:.2f}s")
+        return f"Arranque en frío: {self.cold_start_s:.2f}s hasta inferencia caliente ({self.state}) — " \
+               + ", ".join(parts)
+
+
+_warm = None
+_warm_lock = threading.Lock()
+
+
+def get_warm_start():
+    """Estado de precarga único del proceso (registrado en GET /health)."""
+    global _warm
+    with _warm_lock:
+        if _warm is None:
+            _warm = WarmStart()
+            set_health_check(_warm.health)
+        return _warm
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    get_warm_start().start()
+    start_metrics_server()
+    if not argv:
+        get_warm_start().wait()
+        return
+    from streamlit.web import cli as stcli
+    sys.argv = ["streamlit"] + argv
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    # Se importa a sí mismo para que app.py comparta el mismo estado (y no el de __main__)
+    from warm_start import main as _main
+    _main()
@@ -0,0 +1,129 @@
+"""
+Construcción de los campos automáticos de la ficha a partir de detecciones.
+
+Compartido por la interfaz (app.py) y las herramientas por lotes, para que
+un mismo conjunto de cajas produzca siempre el mismo veredicto.
+"""
+import json
+
+import numpy as np
+
+from bead_geometry import measure_bead
+from defect_map import BEAD_CLASSES, DefectMap
+from postprocess import format_defect_fields, get_class_index
+
+
+def count_defects(det):
+    """Conteo por nombre de clase: {'Porosity': 3, ...}."""
+    return get_class_index(det.names).counts_by_name(det.cls)
+
+
+def serialize_detections(det):
+    """Lista JSON-serializable de detecciones (clase, confianza, caja xyxy)."""
+    return [
+        {'class': name, 'conf': round(float(conf), 4),
+         'xyxy': [round(float(v), 1) for v in box]}
+        for name, conf, box in zip(det.class_names(), det.conf, det.xyxy)
+    ]
+
+
+def defect_fields(det):
+    """Campos def_* de la Ficha de Defectología."""
+    return format_defect_fields(get_class_index(det.names).field_counts(det.cls))
+
+
+def weld_verdict(det):
+    return "RECHAZADO" if len(det) > 0 else "ACEPTADO"
+
+
+def surface_condition(det):
+    """Valor de 'condicion_superficial' para la inspección pre-soldadura."""
+    surf_defects = sorted(count_defects(det))
+    if surf_defects:
+        return f"RECHAZADO ({', '.join(surf_defects)})"
+    return "ACEPTADO (Limpio)"
+
+
+def bead_roi(det):
+    """Caja envolvente de las detecciones de cordón completo (Good/Bad Welding)."""
+    mask = np.isin(det.cls, [c for c, name in det.names.items() if name in BEAD_CLASSES])
+    if not mask.any():
+        return None
+    boxes = det.xyxy[mask]
+    return [boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()]
+
+
+def measure_geometry(image, det, distancia_camara=None, source_scale=1.0, channels="RGB"):
+    """Geometría del cordón en `image`, acotada a la caja de cordón si el modelo la detectó."""
+    return measure_bead(image, distancia_camara, roi=bead_roi(det), source_scale=source_scale, channels=channels)
+
+
+def geometry_fields(geometry):
+    """Campos de Geometría/Dimensionalidad a partir de un BeadGeometry (o None)."""
+    no_2d = "N/A (2D)"
+    if geometry is None:
+        values = dict.fromkeys(['ancho_promedio', 'simetria', 'rugosidad', 'perfil_geom',
+                                'dim_uniformidad', 'dim_rectitud'], "N/A")
+    else:
+        u = "" if geometry.units == "mm" else " px"
+        values = {
+            'ancho_promedio': f"{geometry.ancho:.2f}{u}",
+            'simetria': f"{geometry.simetria_pct:.1f}",
+            'rugosidad': f"{geometry.rugosidad:.2f}{u}",
+            'perfil_geom': (f"L={geometry.longitud:.1f} {geometry.units}, "
+                            f"W={geometry.ancho:.2f}±{geometry.ancho_std:.2f} {geometry.units}"),
+            'dim_uniformidad': f"{geometry.uniformidad_pct:.1f}%",
+            'dim_rectitud': f"{geometry.rectitud:.2f} {geometry.units}",
+        }
+    # La altura del refuerzo, el radio y los ángulos de mojado requieren
+    # un perfil transversal (láser/estéreo); no se observan en una vista superior.
+    values.update({
+        'altura_refuerzo': no_2d,
+        'radio_curvatura': no_2d,
+        'angulo_mojado_l': no_2d,
+        'angulo_mojado_r': no_2d,
+    })
+    return values
+
+
+def build_auto_data(det, id_cordon, geometry=None, defect_map=None):
+    """Campos automáticos de las cuatro fichas para una imagen de cordón.
+
+    `geometry` es el resultado de measure_geometry(); sin él los campos
+    geométricos quedan como "N/A". `defect_map` (DefectMap) se calcula a
+    partir de ambos si no se pasa.
+    """
+    defect_counts = count_defects(det)
+    geom = geometry_fields(geometry)
+    if defect_map is None:
+        defect_map = DefectMap.from_detections(det, geometry)
+
+    auto_data = {}
+
+    # Llenar campos automáticos de Geometría
+    for key in ['ancho_promedio', 'altura_refuerzo', 'radio_curvatura', 'simetria',
+                'angulo_mojado_l', 'angulo_mojado_r', 'rugosidad']:
+        auto_data[key] = geom[key]
+
+    # Llenar campos automáticos de Defectología; la porosidad lineal y las
+    # secciones críticas salen de las posiciones sobre el eje del cordón
+    auto_data.update(defect_fields(det))
+    spatial = defect_map.fields_text()
+    auto_data['secciones_criticas'] = spatial['secciones_criticas']
+    auto_data['def_porosidad_lineal'] = spatial['def_porosidad_lineal']
+
+    # Llenar campos automáticos de Dimensionalidad
+    auto_data['dim_ancho'] = auto_data['ancho_promedio']
+    auto_data['dim_altura'] = auto_data['altura_refuerzo']
+    auto_data['dim_angulo_l'] = auto_data['angulo_mojado_l']
+    auto_data['dim_angulo_r'] = auto_data['angulo_mojado_r']
+    auto_data['dim_uniformidad'] = geom['dim_uniformidad']
+    auto_data['dim_rectitud'] = geom['dim_rectitud']
+    auto_data['dim_penetracion'] = "N/A (Visual)"
+
+    # Trazabilidad Automática
+    auto_data['id_cordon'] = id_cordon
+    auto_data['perfil_geom'] = geom['perfil_geom']
+    auto_data['mapa_defectos'] = json.dumps(defect_counts, ensure_ascii=False)
+    auto_data['aprobacion_final'] = weld_verdict(det)
+    return auto_data